@@ -0,0 +1,672 @@
+import argparse
+import collections
+import datetime
+import hashlib
+import hmac
+import http.client
+import http.server
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import urllib.parse
+
+from hms import Hospital
+
+logger = logging.getLogger(__name__)
+
+# Largest page a listing returns, and largest request body accepted
+MAX_PAGE = 1000
+MAX_BODY = 1024 * 1024
+
+# Environment variable holding the shared token clients must send as
+# "Authorization: Bearer <token>"
+TOKEN_VARIABLE = 'HMS_API_TOKEN'
+LOOPBACK_HOSTS = ('127.0.0.1', '::1', 'localhost')
+
+PATIENT_FIELDS = ('name', 'dob', 'gender', 'problem', 'mobile_no')
+STAFF_FIELDS = ('name', 'age', 'gender', 'specialization', 'languages_spoken', 'mobile_no', 'email', 'schedule')
+
+
+# Integer query parameter, or default when it is missing
+def int_param(params, name, default=None):
+    if name not in params:
+        return default
+    try:
+        return int(params[name][-1])
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number") from None
+
+
+# A page size parameter: a whole number of at least 1, capped at maximum
+def limit_param(params, default, name='limit', maximum=MAX_PAGE):
+    limit = int_param(params, name, default)
+    if limit < 1:
+        raise ValueError(f"{name} must be at least 1")
+    return min(limit, maximum)
+
+
+# The values of the given fields of a request body, in order
+def fields(body, names):
+    if not isinstance(body, dict):
+        raise ValueError("Expected a JSON object")
+    missing = [name for name in names if body.get(name) in (None, '')]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+    return [body[name] for name in names]
+
+
+def parse_moment(text, name):
+    try:
+        return datetime.datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an ISO date and time, e.g. 2025-01-31T09:30") from None
+
+
+def parse_duration(minutes):
+    if minutes is None:
+        return None
+    if not isinstance(minutes, int) or minutes <= 0:
+        raise ValueError("duration_minutes must be a positive whole number")
+    return datetime.timedelta(minutes=minutes)
+
+
+# Handlers take (hospital, query parameters, JSON body, *URL groups) and
+# return a JSON-serialisable value. They raise ValueError for a bad request
+# and LookupError for something that does not exist.
+def list_page(table):
+    def handler(hospital, params, body):
+        limit = limit_param(params, 100)
+        return hospital.fetch_query(
+            f'SELECT * FROM {table} WHERE id > ? ORDER BY id LIMIT ?', (int_param(params, 'after_id', 0), limit)
+        )
+    return handler
+
+
+def search_handler(table):
+    def handler(hospital, params, body):
+        return hospital.search(table, params.get('q', [''])[-1], limit_param(params, 50))
+    return handler
+
+
+def get_patient(hospital, params, body, patient_id):
+    patient = hospital.fetch_patient(int(patient_id))
+    if patient is None:
+        raise LookupError("Patient not found.")
+    return patient
+
+
+def patient_appointments(hospital, params, body, patient_id):
+    return hospital.fetch_patient_appointments(int(patient_id))
+
+
+def dashboard(hospital, params, body):
+    return hospital.dashboard(params.get('day', [None])[-1])
+
+
+def cache_stats(hospital, params, body):
+    return hospital.cache_stats()
+
+
+def query_stats(hospital, params, body):
+    return hospital.query_stats(int_param(params, 'limit'))
+
+
+def add_patient(hospital, params, body):
+    return {'id': hospital.add_patient(*fields(body, PATIENT_FIELDS))}
+
+
+def discharge_patient(hospital, params, body, patient_id):
+    if not hospital.discharge_patient(int(patient_id)):
+        raise LookupError("Patient ID does not exist.")
+    return {'discharged': True}
+
+
+def patient_history(hospital, params, body, patient_id):
+    patient, appointments = hospital.fetch_patient_history(int(patient_id))
+    if patient is None:
+        raise LookupError("Patient not found.")
+    return {'patient': patient, 'appointments': appointments}
+
+
+# A page of a patient's timeline; before_ts, before_kind and before_id are
+# the last event of the previous page
+def patient_timeline(hospital, params, body, patient_id):
+    before = None
+    if 'before_ts' in params:
+        before = (int_param(params, 'before_ts'), params.get('before_kind', [''])[-1], int_param(params, 'before_id', 0))
+    patient, events = hospital.fetch_patient_timeline(int(patient_id), before,
+                                                      limit_param(params, 50))
+    if patient is None:
+        raise LookupError("Patient not found.")
+    return {'patient': patient, 'events': events}
+
+
+def search_archive(hospital, params, body):
+    return hospital.search_archive(params.get('q', [''])[-1], limit_param(params, 50))
+
+
+def add_staff(hospital, params, body):
+    return {'id': hospital.add_staff(*fields(body, STAFF_FIELDS))}
+
+
+# All appointments in id order, or with from (and to) the ones in a date
+# range in time order, paged by after_ts and after_id
+def list_appointments(hospital, params, body):
+    limit = limit_param(params, 100)
+    if 'from' in params:
+        after = None
+        if 'after_ts' in params:
+            after = (int_param(params, 'after_ts'), int_param(params, 'after_id', 0))
+        return hospital.fetch_appointments_between(params['from'][-1], params.get('to', [None])[-1],
+                                                   int_param(params, 'doctor_id'), after, limit)
+    return hospital.fetch_appointments_page(int_param(params, 'after_id'), int_param(params, 'before_id'), limit)
+
+
+def book_appointment(hospital, params, body):
+    patient_id, doctor_id, start = fields(body, ('patient_id', 'doctor_id', 'start'))
+    return {'id': hospital.scheduler.book(patient_id, doctor_id, parse_moment(start, 'start'),
+                                          body.get('details', ''), parse_duration(body.get('duration_minutes')))}
+
+
+def cancel_appointment(hospital, params, body, appointment_id):
+    if not hospital.scheduler.cancel(int(appointment_id)):
+        raise LookupError("Appointment ID does not exist.")
+    return {'cancelled': True}
+
+
+def schedule_settings(hospital, params, body):
+    scheduler = hospital.scheduler
+    return {
+        'slot_minutes': scheduler.slot.seconds // 60,
+        'opening': scheduler.opening.isoformat(),
+        'closing': scheduler.closing.isoformat(),
+    }
+
+
+def free_slots(hospital, params, body, doctor_id):
+    after = parse_moment(params['after'][-1], 'after') if 'after' in params else datetime.datetime.now()
+    duration = parse_duration(int_param(params, 'duration_minutes'))
+    count = limit_param(params, 5, 'count', 100)
+    slots = hospital.scheduler.free_slots(int(doctor_id), after, count, duration)
+    return [(start.isoformat(), end.isoformat()) for start, end in slots]
+
+
+def create_bill(hospital, params, body):
+    patient_id, items = fields(body, ('patient_id', 'items'))
+    try:
+        return {'id': hospital.create_bill(patient_id, items)}
+    except TypeError:
+        raise ValueError("items must be [description, quantity, unit amount] lists") from None
+
+
+def invoice_bills(hospital, params, body):
+    bill_ids = body.get('bill_ids') if isinstance(body, dict) else None
+    return {'invoiced': hospital.invoice_bills(bill_ids)}
+
+
+def get_bill(hospital, params, body, bill_id):
+    bill = hospital.fetch_bill(int(bill_id))
+    if bill is None:
+        raise LookupError("Bill not found.")
+    return bill
+
+
+def tax_rates(hospital, params, body):
+    return hospital.tax_rates()
+
+
+# Run several requests in one round trip. The body is a list of
+# {"method", "path", "body"} objects; the answer is a list of
+# {"status", "body"} in the same order. Writes share one commit at the end
+# (reads inside the batch see the writes before them).
+def run_batch(hospital, params, body):
+    if not isinstance(body, list):
+        raise ValueError("Expected a JSON list of requests")
+    results = []
+    try:
+        for request in body:
+            if not isinstance(request, dict) or request.get('method') == 'POST' and request.get('path') == '/batch':
+                results.append({'status': 400, 'body': {'error': "Invalid batch entry"}})
+                continue
+            if request.get('method') == 'GET':
+                hospital.flush()
+            status, value = dispatch(hospital, request.get('method', 'GET'), request.get('path', ''),
+                                     request.get('body'), commit=False)
+            results.append({'status': status, 'body': value})
+    finally:
+        hospital.flush()
+    return results
+
+
+ROUTES = [(method, re.compile(pattern + '$'), handler) for method, pattern, handler in (
+    ('GET', r'/patients', list_page('patients')),
+    ('POST', r'/patients', add_patient),
+    ('GET', r'/patients/search', search_handler('patients')),
+    ('GET', r'/patients/(\d+)', get_patient),
+    ('DELETE', r'/patients/(\d+)', discharge_patient),
+    ('GET', r'/patients/(\d+)/appointments', patient_appointments),
+    ('GET', r'/patients/(\d+)/history', patient_history),
+    ('GET', r'/patients/(\d+)/timeline', patient_timeline),
+    ('GET', r'/archive/patients/search', search_archive),
+    ('GET', r'/staff', list_page('staff')),
+    ('POST', r'/staff', add_staff),
+    ('GET', r'/staff/search', search_handler('staff')),
+    ('GET', r'/appointments', list_appointments),
+    ('POST', r'/appointments', book_appointment),
+    ('DELETE', r'/appointments/(\d+)', cancel_appointment),
+    ('GET', r'/schedule', schedule_settings),
+    ('GET', r'/doctors/(\d+)/free-slots', free_slots),
+    ('POST', r'/bills', create_bill),
+    ('POST', r'/bills/invoice', invoice_bills),
+    ('GET', r'/bills/(\d+)', get_bill),
+    ('GET', r'/tax-rates', tax_rates),
+    ('GET', r'/dashboard', dashboard),
+    ('GET', r'/cache', cache_stats),
+    ('GET', r'/stats/queries', query_stats),
+    ('POST', r'/batch', run_batch),
+)]
+
+
+# Route one request and return (HTTP status, JSON value). Writes are
+# committed before the answer goes out unless commit is False (inside a
+# batch, which commits once at the end).
+def dispatch(hospital, method, target, body=None, commit=True):
+    url = urllib.parse.urlsplit(target)
+    params = urllib.parse.parse_qs(url.query)
+    allowed = False
+    for route_method, pattern, handler in ROUTES:
+        match = pattern.match(url.path)
+        if match is None:
+            continue
+        if route_method != method:
+            allowed = True
+            continue
+        try:
+            value = handler(hospital, params, body, *match.groups())
+            if method != 'GET' and commit:
+                hospital.flush()
+            return 200, value
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        except LookupError as e:
+            return 404, {'error': str(e.args[0]) if e.args else "Not found"}
+        except sqlite3.IntegrityError as e:
+            return 409, {'error': str(e)}
+        except Exception:
+            logger.exception("%s %s failed", method, target)
+            return 500, {'error': "Internal server error"}
+    if allowed:
+        return 405, {'error': f"{method} is not allowed on {url.path}"}
+    return 404, {'error': f"No such resource: {url.path}"}
+
+
+# Strong ETag of a response body; a client that already has the same body
+# gets a 304 without it
+def etag(data):
+    return '"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"'
+
+
+class ApiRequestHandler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive, so each terminal reuses one connection. Headers and body
+    # go out as two writes; with Nagle's algorithm on, the body would wait
+    # for the client's delayed ACK (about 40ms) on every request.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.handle_api()
+
+    def do_POST(self):
+        self.handle_api()
+
+    def do_DELETE(self):
+        self.handle_api()
+
+    def handle_api(self):
+        if not self.authorized():
+            # The body is not read, so the connection cannot be reused
+            self.close_connection = True
+            self.send_json(401, {'error': "Missing or wrong API token"})
+            return
+        body = None
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY:
+            self.send_json(413, {'error': "Request body too large"})
+            self.close_connection = True
+            return
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                self.send_json(400, {'error': "Request body is not valid JSON"})
+                return
+        status, value = dispatch(self.server.hospital, self.command, self.path, body)
+        self.send_json(status, value)
+
+    # True when the server needs no token or the request carries it
+    def authorized(self):
+        token = self.server.token
+        if token is None:
+            return True
+        sent = self.headers.get('Authorization', '').encode('utf-8')
+        return hmac.compare_digest(sent, f'Bearer {token}'.encode('utf-8'))
+
+    def send_json(self, status, value):
+        data = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if status == 401:
+            headers['WWW-Authenticate'] = 'Bearer'
+        if self.command == 'GET' and status == 200:
+            tag = etag(data)
+            headers['ETag'] = tag
+            # Cache, but revalidate every time: the data changes under us
+            headers['Cache-Control'] = 'no-cache'
+            if tag in (known.strip() for known in self.headers.get('If-None-Match', '').split(',')):
+                status, data = 304, b''
+                del headers['Content-Type']
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+# Threaded HTTP server around one Hospital. Reads from handler threads go
+# through the Hospital's connection pool and run side by side; writes
+# share the single writer connection, with group commit batching the
+# commits of concurrent requests. With a token, every request must carry
+# it; without one the server is open to anyone who can reach it, so it
+# refuses to listen on anything but the loopback interface.
+class ApiServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, hospital, address=('127.0.0.1', 8000), token=None):
+        if not token and address[0] not in LOOPBACK_HOSTS:
+            raise ValueError(f"Listening on {address[0]} needs an API token (--token or {TOKEN_VARIABLE})")
+        super().__init__(address, ApiRequestHandler)
+        self.hospital = hospital
+        self.token = token or None
+        hospital.enable_group_commit()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+# Error answer from the API server that is not the user's fault
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"{message} (HTTP {status})")
+        self.status = status
+
+
+# Client for the API server with the same methods the GUI uses on a
+# Hospital, so `python hms.py --server URL` runs the GUI as a terminal of a
+# shared server. Each thread keeps its own keep-alive connection. GET
+# answers are cached by URL with their ETag and revalidated with
+# If-None-Match, so unchanged pages cost a 304 without a body. Rejected
+# requests raise ValueError with the server's message, like Hospital does.
+# token is the server's API token, if it has one.
+class RemoteHospital:
+    def __init__(self, base_url, token=None, timeout=10, cache_size=256):
+        url = urllib.parse.urlsplit(base_url)
+        if url.scheme != 'http' or not url.hostname:
+            raise ValueError(f"Not an http:// server URL: {base_url}")
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self.token = token
+        self.local = threading.local()
+        self.connections = []
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.not_modified = 0
+        self.scheduler = RemoteScheduler(self, self.call('GET', '/schedule'))
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    # Send one request; returns (status, JSON value)
+    def send(self, method, path, body=None, params=None):
+        target = self.prefix + path
+        if params:
+            target += '?' + urllib.parse.urlencode({name: value for name, value in params.items() if value is not None})
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        cached = None
+        if method == 'GET':
+            with self.lock:
+                cached = self.cache.get(target)
+            if cached is not None:
+                headers['If-None-Match'] = cached[0]
+
+        conn = self.connection()
+        try:
+            conn.request(method, target, payload, headers)
+            response = conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            # The server dropped an idle connection; only a GET is safe to resend
+            conn.close()
+            if method != 'GET':
+                raise
+            conn.request(method, target, payload, headers)
+            response = conn.getresponse()
+        data = response.read()
+
+        if response.status == 304 and cached is not None:
+            with self.lock:
+                self.not_modified += 1
+                self.cache.move_to_end(target)
+            return 200, cached[1]
+        value = json.loads(data) if data else None
+        tag = response.getheader('ETag')
+        if method == 'GET' and response.status == 200 and tag:
+            with self.lock:
+                self.cache[target] = (tag, value)
+                self.cache.move_to_end(target)
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return response.status, value
+
+    # Send one request and return its value, raising for any error
+    def call(self, method, path, body=None, params=None):
+        status, value = self.send(method, path, body, params)
+        if status == 200:
+            return value
+        message = value.get('error', '') if isinstance(value, dict) else ''
+        if status in (400, 404, 409):
+            raise ValueError(message)
+        raise ApiError(status, message)
+
+    # Method to run several requests in one round trip (see run_batch);
+    # calls are (method, path, body) and the answer is a list of
+    # (status, value)
+    def batch(self, calls):
+        results = self.call('POST', '/batch', [
+            {'method': method, 'path': path, 'body': body} for method, path, body in calls
+        ])
+        return [(result['status'], result['body']) for result in results]
+
+    def fetch_appointments_page(self, after_id=None, before_id=None, limit=100):
+        return self.call('GET', '/appointments', params={'after_id': after_id, 'before_id': before_id, 'limit': limit})
+
+    def iter_staff_pages(self, page_size=500):
+        after_id = 0
+        while True:
+            rows = self.call('GET', '/staff', params={'after_id': after_id, 'limit': page_size})
+            if not rows:
+                return
+            yield rows
+            after_id = rows[-1][0]
+
+    def search_patients(self, text, limit=50):
+        return self.call('GET', '/patients/search', params={'q': text, 'limit': limit})
+
+    def search_staff(self, text, limit=50):
+        return self.call('GET', '/staff/search', params={'q': text, 'limit': limit})
+
+    def fetch_patient(self, patient_id):
+        status, value = self.send('GET', f'/patients/{int(patient_id)}')
+        if status == 404:
+            return None
+        if status != 200:
+            raise ApiError(status, value.get('error', ''))
+        return value
+
+    def fetch_appointments_between(self, date_from, date_to=None, doctor_id=None, after=None, limit=100):
+        after_ts, after_id = after if after is not None else (None, None)
+        return self.call('GET', '/appointments', params={'from': date_from, 'to': date_to, 'doctor_id': doctor_id,
+                                                         'after_ts': after_ts, 'after_id': after_id, 'limit': limit})
+
+    def fetch_patient_appointments(self, patient_id):
+        return self.call('GET', f'/patients/{int(patient_id)}/appointments')
+
+    def dashboard(self, day=None):
+        return self.call('GET', '/dashboard', params={'day': day})
+
+    def cache_stats(self):
+        return self.call('GET', '/cache')
+
+    # The server's query statistics (see Hospital.query_stats)
+    def query_stats(self, limit=None):
+        return self.call('GET', '/stats/queries', params={'limit': limit} if limit is not None else None)
+
+    def search_archive(self, text, limit=50):
+        return self.call('GET', '/archive/patients/search', params={'q': text, 'limit': limit})
+
+    def fetch_patient_history(self, patient_id):
+        status, value = self.send('GET', f'/patients/{int(patient_id)}/history')
+        if status == 404:
+            return None, []
+        if status != 200:
+            raise ApiError(status, value.get('error', ''))
+        return value['patient'], value['appointments']
+
+    def fetch_patient_timeline(self, patient_id, before=None, limit=50):
+        params = {'limit': limit}
+        if before is not None:
+            params['before_ts'], params['before_kind'], params['before_id'] = before
+        status, value = self.send('GET', f'/patients/{int(patient_id)}/timeline', params=params)
+        if status == 404:
+            return None, []
+        if status != 200:
+            raise ApiError(status, value.get('error', ''))
+        return value['patient'], value['events']
+
+    def add_patient(self, name, dob, gender, problem, mobile_no):
+        return self.call('POST', '/patients', dict(zip(PATIENT_FIELDS, (name, dob, gender, problem, mobile_no))))['id']
+
+    def add_staff(self, name, age, gender, specialization, languages_spoken, mobile_no, email, schedule):
+        values = (name, age, gender, specialization, languages_spoken, mobile_no, email, schedule)
+        return self.call('POST', '/staff', dict(zip(STAFF_FIELDS, values)))['id']
+
+    def discharge_patient(self, patient_id):
+        status, value = self.send('DELETE', f'/patients/{int(patient_id)}')
+        if status not in (200, 404):
+            raise ApiError(status, value.get('error', ''))
+        return status == 200
+
+    def create_bill(self, patient_id, items):
+        return self.call('POST', '/bills', {'patient_id': patient_id, 'items': [list(item) for item in items]})['id']
+
+    def invoice_bills(self, bill_ids=None):
+        return self.call('POST', '/bills/invoice', {'bill_ids': None if bill_ids is None else list(bill_ids)})['invoiced']
+
+    def fetch_bill(self, bill_id):
+        status, value = self.send('GET', f'/bills/{int(bill_id)}')
+        return value if status == 200 else None
+
+    def tax_rates(self):
+        return self.call('GET', '/tax-rates')
+
+    # The server commits every write before answering
+    def flush(self):
+        pass
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+
+
+# The appointment side of RemoteHospital, standing in for Hospital.scheduler
+class RemoteScheduler:
+    def __init__(self, client, settings):
+        self.client = client
+        self.slot = datetime.timedelta(minutes=settings['slot_minutes'])
+        self.opening = datetime.time.fromisoformat(settings['opening'])
+        self.closing = datetime.time.fromisoformat(settings['closing'])
+
+    def free_slots(self, doctor_id, after, count=5, duration=None):
+        slots = self.client.call('GET', f'/doctors/{int(doctor_id)}/free-slots', params={
+            'after': after.isoformat(timespec='minutes'),
+            'count': count,
+            'duration_minutes': int(duration.total_seconds()) // 60 if duration is not None else None,
+        })
+        return [(datetime.datetime.fromisoformat(start), datetime.datetime.fromisoformat(end)) for start, end in slots]
+
+    def book(self, patient_id, doctor_id, start, details, duration=None):
+        return self.client.call('POST', '/appointments', {
+            'patient_id': patient_id,
+            'doctor_id': doctor_id,
+            'start': start.isoformat(timespec='minutes'),
+            'details': details,
+            'duration_minutes': int(duration.total_seconds()) // 60 if duration is not None else None,
+        })['id']
+
+    def cancel(self, appointment_id):
+        status, value = self.client.send('DELETE', f'/appointments/{int(appointment_id)}')
+        if status not in (200, 404):
+            raise ApiError(status, value.get('error', ''))
+        return status == 200
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the hospital database over HTTP/JSON")
+    parser.add_argument("--db", default="hospital.db", help="path to the SQLite database")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+    parser.add_argument("--token", default=os.environ.get(TOKEN_VARIABLE),
+                        help=f"API token clients must send (default: ${TOKEN_VARIABLE}); "
+                             "required unless listening on loopback")
+    parser.add_argument("--pool-size", type=int, default=8, help="read connections shared by request threads")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    parser.add_argument("--slow-query-ms", type=float, default=100.0,
+                        help="log queries slower than this many milliseconds (see GET /stats/queries)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(levelname)s %(name)s: %(message)s")
+
+    if not args.token and args.host not in LOOPBACK_HOSTS:
+        parser.error(f"--host {args.host} needs --token or {TOKEN_VARIABLE}; the API exposes every patient record")
+    hospital = Hospital(args.db, pool_size=args.pool_size, slow_query_ms=args.slow_query_ms)
+    server = ApiServer(hospital, (args.host, args.port), args.token)
+    logger.info("Serving %s on %s", args.db, server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        hospital.close()
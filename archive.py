@@ -0,0 +1,68 @@
+import argparse
+import datetime
+import sqlite3
+import sys
+import time
+
+from hms import Hospital
+
+
+# Move discharged patients and old appointments to the archive; meant to be
+# run nightly (e.g. from cron)
+def run_archive(hospital, args):
+    def progress(patients, appointments):
+        print(f"\r{patients} patients, {appointments} appointments archived", end="", flush=True)
+
+    start = time.perf_counter()
+    patients, appointments = hospital.archive(args.keep_days, args.batch_size, on_batch=progress)
+    print(f"\rArchived {patients} patients and {appointments} appointments in {time.perf_counter() - start:.2f}s")
+
+
+def search_archive(hospital, args):
+    for patient_id, name, dob, gender, problem, mobile_no, discharged_ts, archived_ts in hospital.search_archive(args.text):
+        where = "archived" if archived_ts is not None else "discharged"
+        print(f"{patient_id:>8}  {name:<30} {mobile_no:<14} {where}")
+
+
+# Print a patient's record and every appointment they ever had
+def show_patient(hospital, args):
+    patient, appointments = hospital.fetch_patient_history(args.patient_id)
+    if patient is None:
+        raise ValueError(f"No patient with ID {args.patient_id}")
+    patient_id, name, dob, gender, problem, mobile_no, discharged_ts, archived_ts = patient
+    print(f"{name} (ID {patient_id}), born {dob}, {gender}, {mobile_no}")
+    print(f"Problem: {problem}")
+    if discharged_ts is not None:
+        print(f"Discharged {datetime.datetime.fromtimestamp(discharged_ts):%Y-%m-%d %H:%M}")
+    for appointment_id, date, time_of_day, details, doctor_id, status in appointments:
+        doctor = f"doctor {doctor_id}" if doctor_id is not None else ""
+        print(f"  {date} {time_of_day}  {status:<9} {doctor:<12} {details}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive discharged patients and past appointments")
+    parser.add_argument("--db", default="hospital.db", help="path to the SQLite database")
+    parser.add_argument("--archive", help="path to the archive database (default: <db>-archive.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="move discharged patients and old appointments to the archive")
+    run.add_argument("--keep-days", type=int, default=30, help="keep appointments that ended this recently")
+    run.add_argument("--batch-size", type=int, default=5000, help="rows moved per transaction")
+    run.set_defaults(run=run_archive)
+
+    search = commands.add_parser("search", help="find discharged patients by name or mobile number prefix")
+    search.add_argument("text")
+    search.set_defaults(run=search_archive)
+
+    show = commands.add_parser("show", help="show a patient's record and appointment history")
+    show.add_argument("patient_id", type=int)
+    show.set_defaults(run=show_patient)
+
+    args = parser.parse_args()
+    hospital = Hospital(args.db, archive_path=args.archive)
+    try:
+        args.run(hospital, args)
+    except (ValueError, sqlite3.Error) as e:
+        sys.exit(f"Archive failed: {e}")
+    finally:
+        hospital.close()
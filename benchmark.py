@@ -0,0 +1,1106 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from generate_data import DOCTOR_SHARE, FEMALE_NAMES, LAST_NAMES, MALE_NAMES, PROBLEMS, Generator, pick
+from hms import Hospital, HospitalGUI, timestamp
+
+
+# Generate a fresh database with generate_data.Generator. Appointments are
+# booked from today on (the generator's today, or `today`), so none is over
+# and all of them stay in the appointments table.
+def generate(db_path, patients, staff=1, appointments=0, seed=1, today=None):
+    hospital = Hospital(db_path)
+    try:
+        Generator(patients, staff, appointments, seed=seed, today=today, history_days=0).into_database(hospital)
+    finally:
+        hospital.close()
+
+
+# Fill a fresh database with the given number of patients and an
+# appointment for each
+def populate(db_path, patients):
+    generate(db_path, patients, max(17, patients // 300), patients)
+
+
+# A new patient's details, named and ailing like the generated ones
+def random_patient(rng):
+    return (f"{rng.choice(MALE_NAMES + FEMALE_NAMES)} {rng.choice(LAST_NAMES)}", "1990-01-01", "Other",
+            pick(rng, PROBLEMS), f"9{rng.randrange(10 ** 9):09d}")
+
+# Searches typed while looking for a patient: growing prefixes, several
+# words, a problem, a phone number prefix and misspelt names
+SEARCHES = {
+    "prefix": ("j", "jo", "joh", "john", "john sm", "fever", "98"),
+    "fuzzy": ("jonh", "smiht", "pattel", "gupat"),
+}
+
+
+# Fill a fresh database with patients only (and the one member of staff
+# the generator needs)
+def populate_people(db_path, patients, seed=1):
+    generate(db_path, patients, seed=seed)
+
+
+# Time how long Hospital() takes to open an already-migrated database
+def bench_startup(sizes, repeat=20):
+    results = []
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    try:
+        for size in sizes:
+            db_path = os.path.join(workdir, f"startup-{size}.db")
+            populate(db_path, size)
+
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                Hospital(db_path).close()
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            results.append({
+                "rows": size,
+                "db_bytes": os.path.getsize(db_path),
+                "median_ms": timings[len(timings) // 2] * 1000,
+            })
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+# Insert the same rows with a commit per statement and with group commit,
+# under both synchronous=NORMAL (the default) and synchronous=FULL
+def bench_group_commit(rows=20000):
+    results = []
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    try:
+        for synchronous in ("NORMAL", "FULL"):
+            for grouped in (False, True):
+                db_path = os.path.join(workdir, f"writes-{synchronous}-{grouped}.db")
+                hospital = Hospital(db_path)
+                hospital.conn.execute(f"PRAGMA synchronous = {synchronous}")
+                if grouped:
+                    hospital.enable_group_commit()
+
+                start = time.perf_counter()
+                for i in range(rows):
+                    hospital.add_patient(f"Patient {i}", "1990-01-01", "Other", "Checkup", f"555{i:07d}")
+                hospital.flush()
+                elapsed = time.perf_counter() - start
+                hospital.close()
+
+                results.append({
+                    "synchronous": synchronous,
+                    "mode": "group commit" if grouped else "commit per statement",
+                    "rows_per_second": rows / elapsed,
+                })
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+# Time patient searches against a populated database
+def bench_search(patients=1000000, repeat=20):
+    results = []
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    try:
+        db_path = os.path.join(workdir, "search.db")
+        start = time.perf_counter()
+        populate_people(db_path, patients)
+        print(f"Populated {patients} patients in {time.perf_counter() - start:.1f}s")
+
+        hospital = Hospital(db_path)
+        for kind, searches in SEARCHES.items():
+            for text in searches:
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    rows = hospital.search_patients(text)
+                    timings.append(time.perf_counter() - start)
+                timings.sort()
+                results.append({
+                    "kind": kind,
+                    "text": text,
+                    "matches": len(rows),
+                    "median_ms": timings[len(timings) // 2] * 1000,
+                })
+        hospital.close()
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+# Time overlap checks and free-slot lookups for a doctor with a growing
+# number of booked appointments, then race threads for the same slots
+def bench_scheduler(sizes, repeat=200, threads=8):
+    results = []
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    try:
+        for size in sizes:
+            db_path = os.path.join(workdir, f"scheduler-{size}.db")
+            hospital = Hospital(db_path)
+            hospital.add_patient("Patient", "1990-01-01", "Other", "Checkup", "5550000000")
+            hospital.add_staff("Doctor", 40, "Other", "General", "English", "5550000001", "", "")
+            scheduler = hospital.scheduler
+
+            # Fill every other slot so each lookup has to step over bookings
+            first = datetime.datetime(2030, 1, 1, 9, 0)
+            slots = scheduler.free_slots(1, first, count=size * 2)[::2]
+            hospital.cursor.executemany(
+                'INSERT INTO appointments (patient_id, date, time, details, doctor_id, start_ts, end_ts) '
+                'VALUES (1, ?, ?, ?, 1, ?, ?)',
+                ((start.strftime('%Y-%m-%d'), start.strftime('%H:%M'), "Follow-up", timestamp(start), timestamp(end))
+                 for start, end in slots)
+            )
+            hospital.conn.commit()
+            # Inserted behind the scheduler's back, so drop its cached index
+            scheduler.indexes.clear()
+
+            start = time.perf_counter()
+            scheduler.index(1)
+            load_ms = (time.perf_counter() - start) * 1000
+            middle = slots[len(slots) // 2][0]
+
+            timings = {"overlap": [], "next 5 free": []}
+            for _ in range(repeat):
+                start = time.perf_counter()
+                scheduler.overlapping(1, middle, middle + scheduler.slot)
+                timings["overlap"].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                scheduler.free_slots(1, middle, count=5)
+                timings["next 5 free"].append(time.perf_counter() - start)
+            for operation, values in timings.items():
+                values.sort()
+                results.append({
+                    "appointments": size,
+                    "operation": operation,
+                    "median_us": values[len(values) // 2] * 1e6,
+                    "index_load_ms": load_ms,
+                })
+            hospital.close()
+
+        # Every thread tries to book the same free slots; each slot must be
+        # booked exactly once
+        hospital = Hospital(os.path.join(workdir, "race.db"))
+        hospital.add_patient("Patient", "1990-01-01", "Other", "Checkup", "5550000000")
+        hospital.add_staff("Doctor", 40, "Other", "General", "English", "5550000001", "", "")
+        wanted = hospital.scheduler.free_slots(1, datetime.datetime(2030, 1, 1, 9, 0), count=100)
+        booked = []
+
+        def book_all():
+            for start, end in wanted:
+                try:
+                    booked.append(hospital.scheduler.book(1, 1, start, "Race"))
+                except ValueError:
+                    pass
+
+        workers = [threading.Thread(target=book_all) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        stored = hospital.fetch_query('SELECT COUNT(*) FROM appointments')[0][0]
+        hospital.close()
+        results.append({"race_slots": len(wanted), "race_attempts": len(wanted) * threads,
+                        "race_booked": len(booked), "race_stored": stored})
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+# Time a nightly billing run over open bills with three items each,
+# and invoicing a sample of them one at a time for comparison
+def bench_billing(bills=100000, one_at_a_time=1000):
+    results = []
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    try:
+        db_path = os.path.join(workdir, "billing.db")
+        populate(db_path, 1000)
+        hospital = Hospital(db_path)
+        created = timestamp(datetime.datetime(2024, 1, 1))
+        hospital.cursor.executemany('INSERT INTO bills (patient_id, created_ts) VALUES (?, ?)',
+                                    ((i % 1000 + 1, created) for i in range(bills)))
+        hospital.cursor.executemany(
+            'INSERT INTO bill_items (bill_id, description, quantity, unit_amount) VALUES (?, ?, ?, ?)',
+            ((i // 3 + 1, "Service", i % 3 + 1, 1999 + i % 1000) for i in range(bills * 3))
+        )
+        hospital.conn.commit()
+
+        start = time.perf_counter()
+        for bill_id in range(1, one_at_a_time + 1):
+            hospital.invoice_bills([bill_id])
+        elapsed = time.perf_counter() - start
+        results.append({"mode": "one bill at a time", "bills": one_at_a_time,
+                        "seconds": elapsed, "bills_per_second": one_at_a_time / elapsed})
+
+        start = time.perf_counter()
+        invoiced = hospital.invoice_bills()
+        elapsed = time.perf_counter() - start
+        results.append({"mode": "nightly batch", "bills": invoiced,
+                        "seconds": elapsed, "bills_per_second": invoiced / elapsed})
+        hospital.close()
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+# Fill appointments for 20 doctors, each booked through their clinic hours
+def populate_appointments(db_path, appointments, doctors=20):
+    generate(db_path, 1000, round(doctors / DOCTOR_SHARE), appointments)
+
+
+# Export every appointment in each format, timing it and then measuring the
+# peak Python memory of a second run with tracemalloc
+def bench_export(sizes):
+    from export_data import WRITERS, export_file
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    try:
+        for size in sizes:
+            db_path = os.path.join(workdir, f"export-{size}.db")
+            populate_appointments(db_path, size)
+            hospital = Hospital(db_path)
+            for fmt in sorted(WRITERS):
+                path = os.path.join(workdir, f"appointments.{fmt}")
+                start = time.perf_counter()
+                export_file(hospital, 'appointments', path)
+                elapsed = time.perf_counter() - start
+
+                tracemalloc.start()
+                export_file(hospital, 'appointments', path)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                results.append({
+                    "rows": size,
+                    "format": fmt,
+                    "rows_per_second": size / elapsed,
+                    "file_bytes": os.path.getsize(path),
+                    "peak_memory_bytes": peak,
+                })
+                os.remove(path)
+            hospital.close()
+            os.remove(db_path)
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+# Read every patient with fetch_query (one fetchall) and with the streaming
+# API in each row shape, recording time and peak Python memory
+def bench_fetch(patients=1000000, batch_size=5000):
+    query = 'SELECT * FROM patients ORDER BY id'
+    modes = {
+        "fetchall": lambda hospital: [len(hospital.fetch_query(query))],
+        "iter_query": lambda hospital: [sum(1 for _ in hospital.iter_query(query, (), batch_size))],
+        "iter_query records": lambda hospital: [sum(1 for _ in hospital.iter_query(query, (), batch_size, 'record'))],
+    }
+    for shape in ('tuple', 'columns'):
+        modes[f"stream_query {shape}"] = (
+            lambda hospital, shape=shape: [len(batch) for batch in hospital.stream_query(query, (), batch_size, shape)[1]])
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    try:
+        db_path = os.path.join(workdir, "fetch.db")
+        populate_people(db_path, patients)
+        hospital = Hospital(db_path)
+        for mode, read in modes.items():
+            start = time.perf_counter()
+            read(hospital)
+            elapsed = time.perf_counter() - start
+
+            tracemalloc.start()
+            read(hospital)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append({"mode": mode, "rows": patients, "seconds": elapsed, "peak_memory_bytes": peak})
+        hospital.close()
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+# Time the active-set queries of a database with `active` patients in care
+# (each with an upcoming appointment) and `history` discharged patients
+# (each with a past appointment), before and after archive() moves the
+# history out, and time the archive run itself
+def bench_archive(histories, active=10000, repeat=20):
+    queries = {
+        "search": lambda hospital: hospital.search_patients("jo"),
+        "in care": lambda hospital: hospital.fetch_query('SELECT COUNT(*) FROM patients WHERE discharged_ts IS NULL'),
+        "upcoming": lambda hospital: hospital.fetch_query(
+            'SELECT COUNT(*) FROM appointments WHERE end_ts > ?', (timestamp(datetime.datetime.now()),)),
+    }
+
+    def timings(hospital):
+        medians = {}
+        for name, query in queries.items():
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                query(hospital)
+                samples.append(time.perf_counter() - start)
+            medians[name] = sorted(samples)[len(samples) // 2] * 1000
+        return medians
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    try:
+        for history in histories:
+            db_path = os.path.join(workdir, f"archive-{history}.db")
+            populate_people(db_path, history + active)
+            hospital = Hospital(db_path, cache_size=0)
+            now = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+
+            def rows():
+                for patient_id in range(1, history + active + 1):
+                    start = now + datetime.timedelta(days=-400 if patient_id <= history else 7)
+                    yield (patient_id, start.strftime('%Y-%m-%d'), start.strftime('%H:%M'), "Follow-up",
+                           timestamp(start), timestamp(start) + 1800)
+
+            hospital.bulk_import('appointments', rows(),
+                                 columns=('patient_id', 'date', 'time', 'details', 'start_ts', 'end_ts'))
+            hospital.execute_query('UPDATE patients SET discharged_ts = ? WHERE id <= ?',
+                                   (timestamp(now - datetime.timedelta(days=365)), history))
+
+            results.append(dict(timings(hospital), history=history, phase="before"))
+            start = time.perf_counter()
+            hospital.archive()
+            archive_seconds = time.perf_counter() - start
+            results.append(dict(timings(hospital), history=history, phase="after", archive_seconds=archive_seconds))
+            hospital.close()
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+# Open the timeline of patients with the given numbers of visits (one bill
+# per visit, visits older than 30 days archived) among `patients` others,
+# as the patient screen does: the record and first page in one query, then
+# every following page
+def bench_timeline(visits, patients=100000, page_size=50, repeat=20):
+    results = []
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    try:
+        db_path = os.path.join(workdir, "timeline.db")
+        populate_people(db_path, patients)
+        hospital = Hospital(db_path, cache_size=0)
+        now = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+        for patient_id, count in enumerate(visits, start=1):
+            starts = [now - datetime.timedelta(days=3 * (count - number)) for number in range(count)]
+            hospital.bulk_import('appointments', (
+                (patient_id, start.strftime('%Y-%m-%d'), start.strftime('%H:%M'), "Follow-up", timestamp(start),
+                 timestamp(start) + 1800)
+                for start in starts
+            ), columns=('patient_id', 'date', 'time', 'details', 'start_ts', 'end_ts'))
+            for start in starts:
+                hospital.create_bill(patient_id, [("Consultation", 1, 50000)], created=start)
+        hospital.flush()
+        hospital.archive()
+
+        for patient_id, count in enumerate(visits, start=1):
+            opens, walks = [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                patient, events = hospital.fetch_patient_timeline(patient_id, None, page_size)
+                opens.append(time.perf_counter() - start)
+                pages = 1
+                while len(events) == page_size:
+                    patient, events = hospital.fetch_patient_timeline(patient_id, events[-1][:3], page_size)
+                    pages += 1
+                walks.append(time.perf_counter() - start)
+            opens.sort()
+            walks.sort()
+            results.append({"visits": count, "events": 2 * count, "pages": pages,
+                            "open_ms": opens[len(opens) // 2] * 1000, "all_pages_ms": walks[len(walks) // 2] * 1000})
+        hospital.close()
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+# Look up patients the way the front desk does - mostly the same few
+# hundred recent ones - and reload the staff listing, with the cache off
+# and on
+def bench_cache(patients=100000, lookups=100000, staff=2000, hot=500, seed=1):
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    results = []
+    try:
+        db_path = os.path.join(workdir, "cache.db")
+        populate_people(db_path, patients)
+        hospital = Hospital(db_path)
+        hospital.bulk_import('staff', (
+            (f"Doctor {number}", 40, "Other", "General", "English", f"8{number:09d}", "staff@example.com", "Mon-Fri")
+            for number in range(staff)
+        ), columns=('name', 'age', 'gender', 'specialization', 'languages_spoken', 'mobile_no', 'email', 'schedule'))
+        hospital.close()
+
+        for cache_size in (0, 1024):
+            hospital = Hospital(db_path, cache_size=cache_size)
+            rng = random.Random(seed)
+            ids = [rng.randint(patients - hot, patients) if rng.random() < 0.9 else rng.randint(1, patients)
+                   for _ in range(lookups)]
+            start = time.perf_counter()
+            for patient_id in ids:
+                hospital.fetch_patient(patient_id)
+            lookup_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(20):
+                for page in hospital.iter_staff_pages():
+                    pass
+            listing_seconds = (time.perf_counter() - start) / 20
+            results.append({
+                "cache_size": cache_size,
+                "lookup_us": lookup_seconds / lookups * 1e6,
+                "staff_listing_ms": listing_seconds * 1000,
+                "hit_rate": hospital.cache_stats()["hit_rate"],
+            })
+            hospital.close()
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+# Cost of the query statistics: the same lookups, searches and updates with
+# profiling off, on (the default) and with tracing. The modes take turns,
+# in a different order each round, and the best round of each counts.
+# Returns {mode: {operation: microseconds}}.
+def bench_profiling(patients=100000, operations=20000, rounds=7, seed=1):
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    modes = {"off": {"profile": False}, "on": {}, "trace": {"trace": True}}
+    results = {mode: {} for mode in modes}
+    try:
+        db_path = os.path.join(workdir, "profile.db")
+        populate_people(db_path, patients)
+        rng = random.Random(seed)
+        ids = [rng.randint(1, patients) for _ in range(operations)]
+        searches = [rng.choice(SEARCHES["prefix"]) for _ in range(operations // 10)]
+        workload = {
+            "lookup": lambda hospital: [hospital.fetch_query('SELECT * FROM patients WHERE id = ?', (patient_id,))
+                                        for patient_id in ids],
+            "search": lambda hospital: [hospital.search_patients(text) for text in searches],
+            "update": lambda hospital: [hospital.execute_query('UPDATE patients SET problem = ? WHERE id = ?',
+                                                               ("Checkup", patient_id)) for patient_id in ids],
+        }
+        counts = {"lookup": len(ids), "search": len(searches), "update": len(ids)}
+        hospitals = {mode: Hospital(db_path, **options) for mode, options in modes.items()}
+        for hospital in hospitals.values():
+            hospital.enable_group_commit()
+        order = list(modes)
+        for _ in range(rounds):
+            for operation, run in workload.items():
+                for mode in order:
+                    start = time.perf_counter()
+                    run(hospitals[mode])
+                    hospitals[mode].flush()
+                    micros = (time.perf_counter() - start) / counts[operation] * 1e6
+                    results[mode][operation] = min(results[mode].get(operation, micros), micros)
+            order.append(order.pop(0))
+        for hospital in hospitals.values():
+            hospital.close()
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+# Load-test the API server: client threads, each with its own keep-alive
+# connection, run a mix of patient reads (repeated, so ETags come into
+# play), searches, appointment pages and registrations for the given
+# number of seconds. Without a url a server is started on a scratch
+# database of patients. Also compares registering patients one request at
+# a time with sending them in /batch requests.
+def bench_api(patients=100000, clients=8, seconds=10, url=None, write_share=0.1, batch_rows=1000, token=None):
+    from api import ApiServer, RemoteHospital
+
+    workdir = server = hospital = None
+    if url is None:
+        workdir = tempfile.mkdtemp(prefix="hms-bench-")
+        db_path = os.path.join(workdir, "api.db")
+        populate_people(db_path, patients)
+        hospital = Hospital(db_path, pool_size=clients)
+        server = ApiServer(hospital, ('127.0.0.1', 0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = server.url
+
+    # Most terminals look at the same recently seen patients over and over
+    operations = {
+        "patient": lambda client, rng: client.fetch_patient(rng.randint(1, min(patients, 1000))),
+        "search": lambda client, rng: client.search_patients(rng.choice(SEARCHES["prefix"])),
+        "appointments": lambda client, rng: client.fetch_appointments_page(),
+        "register": lambda client, rng: client.add_patient(*random_patient(rng)),
+    }
+    read_names = ["patient"] * 6 + ["search"] * 3 + ["appointments"]
+    timings = {name: [] for name in operations}
+    deadline = time.perf_counter() + seconds
+    clients_done = []
+
+    def run_client(seed):
+        rng = random.Random(seed)
+        client = RemoteHospital(url, token)
+        while time.perf_counter() < deadline:
+            name = "register" if rng.random() < write_share else rng.choice(read_names)
+            start = time.perf_counter()
+            operations[name](client, rng)
+            timings[name].append(time.perf_counter() - start)
+        clients_done.append(client)
+        client.close()
+
+    try:
+        threads = [threading.Thread(target=run_client, args=(seed,)) for seed in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        results = []
+        for name, samples in timings.items():
+            samples.sort()
+            if samples:
+                results.append({
+                    "operation": name,
+                    "requests": len(samples),
+                    "requests_per_second": len(samples) / seconds,
+                    "p50_ms": samples[len(samples) // 2] * 1000,
+                    "p99_ms": samples[int(len(samples) * 0.99)] * 1000,
+                })
+        reads = sum(len(timings[name]) for name in ("patient", "search", "appointments"))
+        not_modified = sum(client.not_modified for client in clients_done)
+
+        rng = random.Random(clients)
+        client = RemoteHospital(url, token)
+        start = time.perf_counter()
+        for _ in range(batch_rows):
+            client.add_patient(*random_patient(rng))
+        one_at_a_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(0, batch_rows, 100):
+            client.batch([("POST", "/patients", dict(zip(("name", "dob", "gender", "problem", "mobile_no"),
+                                                          random_patient(rng))))
+                          for _ in range(100)])
+        batched = time.perf_counter() - start
+        client.close()
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            hospital.close()
+            shutil.rmtree(workdir)
+    return {
+        "operations": results,
+        "not_modified_share": not_modified / reads if reads else 0.0,
+        "registrations": batch_rows,
+        "one_at_a_time_per_second": batch_rows / one_at_a_time,
+        "batched_per_second": batch_rows / batched,
+    }
+
+
+# Cycle through every screen with cached screens and with the old
+# destroy-and-rebuild behaviour. Needs a display for Tk.
+def bench_navigation(rounds=5):
+    import tkinter as tk
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    try:
+        db_path = os.path.join(workdir, "navigation.db")
+        populate(db_path, 1000)
+        for cached in (True, False):
+            hospital = Hospital(db_path)
+            root = tk.Tk()
+            app = HospitalGUI(root, hospital, cache_screens=cached)
+            app.show_main_window()
+            names = list(app.screens.builders)
+            bill = app.bill_patient(1, "Checkup", 10000)
+            for _ in range(rounds):
+                for name in names:
+                    if name == 'receipt':
+                        app.screens.show(name, bill)
+                    else:
+                        app.screens.show(name)
+                    root.update()
+            app.hide_home()
+            # The first round builds every screen in both modes
+            log = list(app.screens.navigation_log)[len(names):]
+            timings = sorted(ms for _, ms, _, _ in log)
+            results.append({
+                "mode": "cached screens" if cached else "rebuild",
+                "median_ms": timings[len(timings) // 2],
+                "max_widgets": max(widgets for _, _, widgets, _ in log),
+            })
+            app.db.shutdown()
+            root.destroy()
+            hospital.close()
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+# Patient counts the suite runs at by default; each patient also gets an
+# appointment. The large scale takes about half an hour to generate on one
+# CPU, so it only runs with --large.
+SUITE_SCALES = (1000, 100000)
+LARGE_SCALE = 10000000
+
+# Generated hospitals book their appointments from this day on. It is in
+# the past so that no generated date of birth is in the future.
+SUITE_TODAY = datetime.date(2026, 1, 5)
+
+
+# Build a synthetic hospital of `patients` patients, one doctor per thousand
+# of them (at least 5) and one appointment per patient, booked in the
+# doctors' clinic hours from SUITE_TODAY on. The same seed always gives the
+# same database. Returns the number of doctors, who are staff 1 onwards.
+def populate_hospital(db_path, patients, seed=1):
+    staff = round(max(5, patients // 1000) / DOCTOR_SHARE)
+    generate(db_path, patients, staff, patients, seed, SUITE_TODAY)
+    return max(1, round(staff * DOCTOR_SHARE))
+
+
+# Call call(*arguments) for each entry of calls and summarise the timings
+def time_calls(call, calls):
+    samples = []
+    for arguments in calls:
+        start = time.perf_counter()
+        call(*arguments)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "ops": len(samples),
+        "median_ms": samples[len(samples) // 2] * 1000,
+        "p95_ms": samples[int(len(samples) * 0.95)] * 1000,
+    }
+
+
+# Time the data-layer operations behind the GUI on a generated hospital.
+# Reads come first and writes last, so every scale measures the same work.
+def bench_data_layer(db_path, patients, doctors, repeat=200, seed=1):
+    rng = random.Random(seed)
+    metrics = {}
+    hospital = Hospital(db_path)
+    try:
+        random_ids = [(rng.randint(1, patients),) for _ in range(repeat)]
+        metrics["view_patient"] = time_calls(hospital.fetch_patient, random_ids)
+        metrics["patient_timeline"] = time_calls(hospital.fetch_patient_timeline, random_ids)
+        metrics["search_patients"] = time_calls(hospital.search_patients,
+                                                [(rng.choice(SEARCHES["prefix"]),) for _ in range(repeat)])
+        metrics["list_patients"] = time_calls(
+            hospital.fetch_query,
+            [('SELECT * FROM patients WHERE id > ? ORDER BY id LIMIT 100', ids) for ids in random_ids]
+        )
+        metrics["list_appointments"] = time_calls(hospital.fetch_appointments_page, random_ids)
+        # A day's appointments, for everyone and for one doctor
+        first, last = (datetime.date.fromtimestamp(start_ts) for start_ts in hospital.fetch_query(
+            'SELECT MIN(start_ts), MAX(start_ts) FROM appointments')[0])
+        random_days = [first + datetime.timedelta(days=rng.randrange((last - first).days + 1)) for _ in range(repeat)]
+        metrics["day_appointments"] = time_calls(hospital.fetch_appointments_between,
+                                                 [(day,) for day in random_days])
+        metrics["doctor_day"] = time_calls(hospital.fetch_appointments_between, [
+            (day, day, rng.randint(1, doctors)) for day in random_days
+        ])
+        metrics["list_staff"] = time_calls(lambda: sum(map(len, hospital.iter_staff_pages())), [()] * repeat)
+        metrics["dashboard"] = time_calls(hospital.dashboard, [(day,) for day in random_days])
+
+        metrics["add_patient"] = time_calls(hospital.add_patient, [random_patient(rng) for _ in range(repeat)])
+        metrics["add_appointment"] = time_calls(hospital.add_appointment, [
+            (patient_id, "2031-01-01", "10:00", "Walk-in") for patient_id, in random_ids
+        ])
+        # Booked on the first doctor's calendar after all generated appointments
+        first_free = datetime.datetime.combine(last + datetime.timedelta(days=1), datetime.time(9))
+        metrics["book_appointment"] = time_calls(hospital.scheduler.book, [
+            (patient_id, 1, first_free + datetime.timedelta(minutes=30 * i), "Follow-up")
+            for i, (patient_id,) in enumerate(random_ids)
+        ])
+
+        # What the billing screen does for each bill
+        def bill_patient(patient_id):
+            bill_id = hospital.create_bill(patient_id, [("Consultation", 1, 50000)])
+            hospital.invoice_bills([bill_id])
+            hospital.flush()
+            return hospital.fetch_bill(bill_id)
+
+        metrics["bill_patient"] = time_calls(bill_patient, random_ids)
+        for patient_id, in random_ids:
+            hospital.create_bill(patient_id, [("Consultation", 1, 50000), ("Tests", 2, 12500)])
+        metrics["invoice_run"] = time_calls(hospital.invoice_bills, [()])
+
+        # Discharged before the generated calendar, so every appointment is upcoming and cancelled
+        discharged = datetime.datetime.combine(first, datetime.time())
+        metrics["discharge_patient"] = time_calls(hospital.discharge_patient, [
+            (patient_id, discharged) for patient_id in rng.sample(range(1, patients + 1), repeat)
+        ])
+    finally:
+        hospital.close()
+    return metrics
+
+
+# Start a virtual X server for the GUI measurements; returns the process
+def start_xvfb():
+    display = next(number for number in range(99, 200) if not os.path.exists(f"/tmp/.X{number}-lock"))
+    process = subprocess.Popen(["Xvfb", f":{display}", "-screen", "0", "1600x1200x24", "-nolisten", "tcp"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(f"/tmp/.X11-unix/X{display}"):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError("Xvfb did not start")
+        time.sleep(0.05)
+    os.environ["DISPLAY"] = f":{display}"
+    return process
+
+
+# Time GUI hot paths: one slideshow frame on the home screen, and filling
+# the appointments Treeview - its first screen (two pages) and each page
+# fetched while scrolling down
+def bench_gui(db_path, repeat=50):
+    import tkinter as tk
+    from tkinter import ttk
+    from hms import PagedTreeview
+
+    metrics = {}
+    hospital = Hospital(db_path)
+    root = tk.Tk()
+    app = HospitalGUI(root, hospital)
+    try:
+        app.show_main_window()
+        photos = [path for path in app.photo_files if os.path.exists(path)]
+        deadline = time.monotonic() + 30
+        while not all(app.slideshow_cache.get(path) is not None for path in photos):
+            if time.monotonic() > deadline:
+                raise RuntimeError("Slideshow images were not decoded in time")
+            root.update()
+            time.sleep(0.01)
+
+        def slideshow_frame():
+            app.show_slideshow()
+            root.update_idletasks()
+
+        metrics["slideshow_frame"] = time_calls(slideshow_frame, [()] * repeat)
+        app.stop_slideshow()
+
+        window = tk.Toplevel(root)
+        tree = ttk.Treeview(window, columns=("ID", "Patient ID", "Date", "Time", "Details", "Doctor"), show='headings')
+        scrollbar = ttk.Scrollbar(window, orient='vertical')
+        tree.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='right', fill='y')
+        pager = PagedTreeview(tree, scrollbar, hospital.fetch_appointments_page)
+
+        def first_screen():
+            pager.load()
+            root.update_idletasks()
+
+        def next_page():
+            pager.load_next()
+            root.update_idletasks()
+
+        metrics["treeview_load"] = time_calls(first_screen, [()] * repeat)
+        pager.load()
+        metrics["treeview_page"] = time_calls(next_page, [()] * repeat)
+    finally:
+        app.hide_home()
+        app.db.shutdown()
+        root.destroy()
+        hospital.close()
+    return metrics
+
+
+# Run the suite at each scale. GUI timings need a display: gui is "on",
+# "off" or "auto" (use $DISPLAY, or start Xvfb when it is installed).
+def bench_suite(scales, repeat=200, seed=1, gui="auto"):
+    xvfb = None
+    if gui == "auto":
+        gui = "on" if os.environ.get("DISPLAY") or shutil.which("Xvfb") else "off"
+    if gui == "on" and not os.environ.get("DISPLAY"):
+        xvfb = start_xvfb()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(),
+            "seed": seed,
+            "repeat": repeat,
+            "gui": gui == "on",
+            "generated_seconds": {},
+        },
+        "metrics": {},
+    }
+    workdir = tempfile.mkdtemp(prefix="hms-bench-")
+    try:
+        for scale in scales:
+            db_path = os.path.join(workdir, f"suite-{scale}.db")
+            start = time.perf_counter()
+            doctors = populate_hospital(db_path, scale, seed)
+            report["meta"]["generated_seconds"][str(scale)] = round(time.perf_counter() - start, 1)
+
+            metrics = bench_data_layer(db_path, scale, doctors, repeat, seed)
+            if gui == "on":
+                metrics.update(bench_gui(db_path))
+            report["metrics"][str(scale)] = metrics
+            for name in os.listdir(workdir):
+                os.remove(os.path.join(workdir, name))
+    finally:
+        shutil.rmtree(workdir)
+        if xvfb is not None:
+            xvfb.terminate()
+    return report
+
+
+# Compare the medians of a report against a baseline report. A metric has
+# regressed when it is more than `tolerance` (a fraction) slower and at
+# least min_ms slower in absolute terms, which keeps sub-millisecond noise
+# from failing the run. Returns (scale, metric, baseline ms, current ms,
+# regressed) for every metric present in both.
+def compare_reports(report, baseline, tolerance=0.25, min_ms=0.25):
+    rows = []
+    for scale, metrics in report["metrics"].items():
+        for name, result in metrics.items():
+            base = baseline.get("metrics", {}).get(scale, {}).get(name)
+            if base is None:
+                continue
+            current, previous = result["median_ms"], base["median_ms"]
+            regressed = current > previous * (1 + tolerance) and current - previous >= min_ms
+            rows.append((scale, name, previous, current, regressed))
+    return rows
+
+
+def print_startup(args):
+    sizes = [int(size) for size in args.sizes.split(",")]
+    print(f"{'rows':>10} {'db size':>12} {'warm start':>12}")
+    for result in bench_startup(sizes):
+        print(f"{result['rows']:>10} {result['db_bytes']:>12} {result['median_ms']:>10.2f}ms")
+
+
+def print_group_commit(args):
+    print(f"{'synchronous':<12} {'mode':<22} {'rows/s':>10}")
+    for result in bench_group_commit(args.rows):
+        print(f"{result['synchronous']:<12} {result['mode']:<22} {result['rows_per_second']:>10,.0f}")
+
+
+def print_search(args):
+    results = bench_search(args.patients)
+    print(f"{'kind':<8} {'search':<10} {'rows':>6} {'median':>10}")
+    for result in results:
+        print(f"{result['kind']:<8} {result['text']:<10} {result['matches']:>6} {result['median_ms']:>8.2f}ms")
+
+
+def print_scheduler(args):
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = bench_scheduler(sizes)
+    race = results.pop()
+    print(f"{'appointments':>12} {'operation':<12} {'median':>10} {'index load':>12}")
+    for result in results:
+        print(f"{result['appointments']:>12} {result['operation']:<12} {result['median_us']:>8.1f}us "
+              f"{result['index_load_ms']:>10.1f}ms")
+    print(f"{race['race_attempts']} concurrent booking attempts for {race['race_slots']} slots: "
+          f"{race['race_booked']} booked, {race['race_stored']} stored")
+
+
+def print_billing(args):
+    print(f"{'mode':<20} {'bills':>10} {'seconds':>9} {'bills/s':>10}")
+    for result in bench_billing(args.bills):
+        print(f"{result['mode']:<20} {result['bills']:>10} {result['seconds']:>9.2f} {result['bills_per_second']:>10,.0f}")
+
+
+def print_export(args):
+    sizes = [int(size) for size in args.sizes.split(",")]
+    print(f"{'rows':>10} {'format':<7} {'rows/s':>10} {'file size':>12} {'peak memory':>12}")
+    for result in bench_export(sizes):
+        print(f"{result['rows']:>10} {result['format']:<7} {result['rows_per_second']:>10,.0f} "
+              f"{result['file_bytes']:>12,} {result['peak_memory_bytes']:>12,}")
+
+
+def print_fetch(args):
+    print(f"{'mode':<22} {'rows':>10} {'seconds':>9} {'peak memory':>14}")
+    for result in bench_fetch(args.patients):
+        print(f"{result['mode']:<22} {result['rows']:>10} {result['seconds']:>9.2f} "
+              f"{result['peak_memory_bytes']:>14,}")
+
+
+def print_archive(args):
+    histories = [int(size) for size in args.histories.split(",")]
+    print(f"{'history':>9} {'phase':<7} {'search':>9} {'in care':>9} {'upcoming':>9} {'archive run':>12}")
+    for result in bench_archive(histories, args.active):
+        run = f"{result['archive_seconds']:.1f}s" if "archive_seconds" in result else ""
+        print(f"{result['history']:>9} {result['phase']:<7} {result['search']:>7.2f}ms {result['in care']:>7.2f}ms "
+              f"{result['upcoming']:>7.2f}ms {run:>12}")
+
+
+def print_timeline(args):
+    visits = [int(count) for count in args.visits.split(",")]
+    print(f"{'visits':>8} {'events':>8} {'pages':>6} {'open':>10} {'all pages':>10}")
+    for result in bench_timeline(visits, args.patients):
+        print(f"{result['visits']:>8} {result['events']:>8} {result['pages']:>6} {result['open_ms']:>8.2f}ms "
+              f"{result['all_pages_ms']:>8.2f}ms")
+
+
+def print_cache(args):
+    print(f"{'cache size':>10} {'lookup':>10} {'staff listing':>14} {'hit rate':>9}")
+    for result in bench_cache(args.patients, args.lookups):
+        print(f"{result['cache_size']:>10} {result['lookup_us']:>8.1f}us {result['staff_listing_ms']:>12.2f}ms "
+              f"{result['hit_rate']:>9.0%}")
+
+
+def print_profiling(args):
+    results = bench_profiling(args.patients, args.operations)
+    operations = list(results["off"])
+    print(f"{'mode':<6} " + " ".join(f"{operation:>18}" for operation in operations))
+    for mode, timings in results.items():
+        cells = []
+        for operation in operations:
+            overhead = timings[operation] / results["off"][operation] - 1
+            cells.append(f"{timings[operation]:>8.1f}us {overhead:>+6.1%}")
+        print(f"{mode:<6} " + " ".join(f"{cell:>18}" for cell in cells))
+
+
+def print_api(args):
+    report = bench_api(args.patients, args.clients, args.seconds, args.url, token=args.token)
+    print(f"{'operation':<14} {'requests':>9} {'req/s':>9} {'p50':>9} {'p99':>9}")
+    for result in report["operations"]:
+        print(f"{result['operation']:<14} {result['requests']:>9} {result['requests_per_second']:>9,.0f} "
+              f"{result['p50_ms']:>7.2f}ms {result['p99_ms']:>7.2f}ms")
+    print(f"{report['not_modified_share']:.0%} of reads answered 304 Not Modified")
+    print(f"{report['registrations']} registrations: {report['one_at_a_time_per_second']:,.0f}/s one at a time, "
+          f"{report['batched_per_second']:,.0f}/s in batches of 100")
+
+
+def print_suite(args):
+    scales = [int(scale) for scale in args.scales.split(",")]
+    if args.large and LARGE_SCALE not in scales:
+        scales.append(LARGE_SCALE)
+    report = bench_suite(scales, args.repeat, args.seed, args.gui)
+
+    print(f"{'scale':>10} {'metric':<18} {'median':>10} {'p95':>10}")
+    for scale, metrics in report["metrics"].items():
+        for name, result in metrics.items():
+            print(f"{scale:>10} {name:<18} {result['median_ms']:>8.3f}ms {result['p95_ms']:>8.3f}ms")
+    if not report["meta"]["gui"]:
+        print("GUI timings skipped: no display (set DISPLAY or install Xvfb)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        if baseline.get("meta", {}).get("machine") != report["meta"]["machine"]:
+            print("Warning: the baseline was recorded on a different kind of machine")
+        rows = compare_reports(report, baseline, args.tolerance, args.min_ms)
+        print(f"\n{'scale':>10} {'metric':<18} {'baseline':>10} {'now':>10} {'change':>8}")
+        for scale, name, previous, current, regressed in rows:
+            change = (current / previous - 1) if previous else 0.0
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{scale:>10} {name:<18} {previous:>8.3f}ms {current:>8.3f}ms {change:>+8.0%}{flag}")
+        regressions = sum(1 for row in rows if row[4])
+        if regressions:
+            sys.exit(f"{regressions} metrics regressed by more than {args.tolerance:.0%} against {args.baseline}")
+        print(f"No regressions against {args.baseline}")
+
+
+def print_navigation(args):
+    print(f"{'mode':<16} {'median':>10} {'widgets':>8}")
+    for result in bench_navigation(args.rounds):
+        print(f"{result['mode']:<16} {result['median_ms']:>8.2f}ms {result['max_widgets']:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hospital Management System benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    startup = commands.add_parser("startup", help="warm Hospital() start time against database size")
+    startup.add_argument("--sizes", default="0,10000,100000,1000000",
+                         help="comma-separated patient counts")
+    startup.set_defaults(run=print_startup)
+
+    group_commit = commands.add_parser("group-commit", help="write throughput with and without group commit")
+    group_commit.add_argument("--rows", type=int, default=20000, help="rows inserted per run")
+    group_commit.set_defaults(run=print_group_commit)
+
+    search = commands.add_parser("search", help="prefix and fuzzy patient search time")
+    search.add_argument("--patients", type=int, default=1000000, help="patients in the database")
+    search.set_defaults(run=print_search)
+
+    scheduler = commands.add_parser("scheduler", help="overlap checks and free-slot lookups against bookings per doctor")
+    scheduler.add_argument("--sizes", default="1000,10000,100000,1000000",
+                           help="comma-separated appointment counts for one doctor")
+    scheduler.set_defaults(run=print_scheduler)
+
+    billing = commands.add_parser("billing", help="nightly invoicing of open bills")
+    billing.add_argument("--bills", type=int, default=100000, help="open bills to invoice")
+    billing.set_defaults(run=print_billing)
+
+    export = commands.add_parser("export", help="streaming export throughput and peak memory")
+    export.add_argument("--sizes", default="100000,1000000", help="comma-separated appointment counts")
+    export.set_defaults(run=print_export)
+
+    fetch = commands.add_parser("fetch", help="peak memory of fetchall against streamed reads")
+    fetch.add_argument("--patients", type=int, default=1000000, help="patients read")
+    fetch.set_defaults(run=print_fetch)
+
+    archive = commands.add_parser("archive", help="active-set query time against archived history")
+    archive.add_argument("--histories", default="0,100000,1000000",
+                         help="comma-separated counts of discharged patients")
+    archive.add_argument("--active", type=int, default=10000, help="patients in care")
+    archive.set_defaults(run=print_archive)
+
+    timeline = commands.add_parser("timeline", help="patient timeline load time against the number of visits")
+    timeline.add_argument("--visits", default="10,100,500,5000", help="comma-separated visit counts")
+    timeline.add_argument("--patients", type=int, default=100000, help="other patients in the database")
+    timeline.set_defaults(run=print_timeline)
+
+    cache = commands.add_parser("cache", help="patient lookups and staff listings with and without the cache")
+    cache.add_argument("--patients", type=int, default=100000, help="patients in the database")
+    cache.add_argument("--lookups", type=int, default=100000, help="patient lookups timed")
+    cache.set_defaults(run=print_cache)
+
+    profiling = commands.add_parser("profiling", help="overhead of the query statistics and of SQL tracing")
+    profiling.add_argument("--patients", type=int, default=100000, help="patients in the database")
+    profiling.add_argument("--operations", type=int, default=20000, help="lookups and updates timed per round")
+    profiling.set_defaults(run=print_profiling)
+
+    api = commands.add_parser("api", help="load-test the HTTP API server")
+    api.add_argument("--url", help="server to test (registers test patients); by default one is started")
+    api.add_argument("--token", default=os.environ.get("HMS_API_TOKEN"),
+                     help="API token of the server at --url (default: $HMS_API_TOKEN)")
+    api.add_argument("--patients", type=int, default=100000, help="patients in the scratch database")
+    api.add_argument("--clients", type=int, default=8, help="concurrent client threads")
+    api.add_argument("--seconds", type=float, default=10, help="length of the run")
+    api.set_defaults(run=print_api)
+
+    navigation = commands.add_parser("navigation", help="screen switch time, cached against rebuilt (needs a display)")
+    navigation.add_argument("--rounds", type=int, default=5, help="times every screen is visited")
+    navigation.set_defaults(run=print_navigation)
+
+    suite = commands.add_parser("suite", help="the standard suite: data layer and GUI timings at several scales, "
+                                              "as JSON, compared against a baseline")
+    suite.add_argument("--scales", default=",".join(map(str, SUITE_SCALES)), help="comma-separated patient counts")
+    suite.add_argument("--large", action="store_true", help=f"also run at {LARGE_SCALE:,} patients (slow to generate)")
+    suite.add_argument("--repeat", type=int, default=200, help="calls timed per operation")
+    suite.add_argument("--seed", type=int, default=1, help="seed of the generated hospitals")
+    suite.add_argument("--gui", choices=("auto", "on", "off"), default="auto",
+                       help="GUI timings need a display; auto uses $DISPLAY or starts Xvfb if installed")
+    suite.add_argument("--output", help="write the results to this JSON file")
+    suite.add_argument("--baseline", help="JSON results to compare against; exits with an error on regressions")
+    suite.add_argument("--tolerance", type=float, default=0.25,
+                       help="slowdown allowed before a metric counts as regressed (0.25 = 25%%)")
+    suite.add_argument("--min-ms", type=float, default=0.25,
+                       help="smallest absolute slowdown, in milliseconds, that counts as a regression")
+    suite.set_defaults(run=print_suite)
+
+    args = parser.parse_args()
+    args.run(args)
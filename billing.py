@@ -0,0 +1,54 @@
+import argparse
+import datetime
+import sqlite3
+import sys
+import time
+
+from hms import Hospital, format_rate, to_basis_points
+
+
+# Invoice every open bill; meant to be run nightly (e.g. from cron)
+def run_billing(hospital, args):
+    start = time.perf_counter()
+    invoiced = hospital.invoice_bills()
+    print(f"Invoiced {invoiced} bills in {time.perf_counter() - start:.2f}s")
+
+
+def show_rates(hospital, args):
+    for code, rate_bp in hospital.tax_rates():
+        print(f"{code:<10} {format_rate(rate_bp):>8}")
+
+
+# Change a tax rate from a date on (today by default); "none" stops the tax
+def set_rate(hospital, args):
+    rate_bp = None if args.percent.lower() == 'none' else to_basis_points(args.percent)
+    valid_from = datetime.datetime.strptime(args.valid_from, "%Y-%m-%d") if args.valid_from else None
+    hospital.set_tax_rate(args.code.upper(), rate_bp, valid_from)
+    show_rates(hospital, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Invoice open bills and manage tax rates")
+    parser.add_argument("--db", default="hospital.db", help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="invoice every open bill")
+    run.set_defaults(run=run_billing)
+
+    rates = commands.add_parser("rates", help="list the tax rates in force")
+    rates.set_defaults(run=show_rates)
+
+    rate = commands.add_parser("set-rate", help="change a tax rate for bills created from a date on")
+    rate.add_argument("code", help="tax code, e.g. GST")
+    rate.add_argument("percent", help="new rate in percent, or 'none' to stop charging it")
+    rate.add_argument("--from", dest="valid_from", help="YYYY-MM-DD, defaults to now")
+    rate.set_defaults(run=set_rate)
+
+    args = parser.parse_args()
+    hospital = Hospital(args.db)
+    try:
+        args.run(hospital, args)
+    except (ValueError, sqlite3.Error) as e:
+        sys.exit(f"Billing failed: {e}")
+    finally:
+        hospital.close()
@@ -0,0 +1,152 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+
+from hms import Hospital, ReportPool, EXPORT_SOURCES
+
+# Columnar files (.hmsc) are a magic number followed by length-prefixed,
+# zlib-compressed JSON blocks: first {"columns": [...]}, then one block per
+# batch of rows holding {"rows": n, "data": [values of column 0, values of
+# column 1, ...]}, and finally a zero length. Keeping each column's values
+# together lets similar values compress well, and a reader only ever holds
+# one block in memory.
+COLUMNAR_MAGIC = b'HMSC\x01'
+BLOCK_LENGTH = struct.Struct('>I')
+
+
+# Each writer takes the column names and an iterable of batches and returns
+# the number of rows written. Only one batch is held at a time.
+def write_csv(handle, columns, batches):
+    writer = csv.writer(handle)
+    writer.writerow(columns)
+    count = 0
+    for rows in batches:
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def write_jsonl(handle, columns, batches):
+    count = 0
+    for rows in batches:
+        handle.write(''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows))
+        count += len(rows)
+    return count
+
+
+# Takes columnar batches ({column: values}, see hms.ROW_SHAPES)
+def write_columnar(handle, columns, batches):
+    def write_block(value):
+        block = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        handle.write(BLOCK_LENGTH.pack(len(block)))
+        handle.write(block)
+
+    handle.write(COLUMNAR_MAGIC)
+    write_block({'columns': list(columns)})
+    count = 0
+    for batch in batches:
+        data = [batch[column] for column in columns]
+        write_block({'rows': len(data[0]), 'data': data})
+        count += len(data[0])
+    handle.write(BLOCK_LENGTH.pack(0))
+    return count
+
+
+# Read a columnar file back as (columns, rows), the same shape as the
+# readers in import_data.py; rows are tuples in column order
+def read_columnar(path):
+    source = open(path, 'rb')
+    if source.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        source.close()
+        raise ValueError(f"{path} is not a columnar export")
+
+    def read_block():
+        length, = BLOCK_LENGTH.unpack(source.read(BLOCK_LENGTH.size))
+        if not length:
+            return None
+        return json.loads(zlib.decompress(source.read(length)))
+
+    columns = read_block()['columns']
+
+    def rows():
+        with source:
+            for block in iter(read_block, None):
+                yield from zip(*block['data'])
+    return columns, rows()
+
+
+# Writer, the batch shape it takes and how its file is opened, per format
+WRITERS = {
+    'csv': (write_csv, 'tuple', {'mode': 'w', 'newline': '', 'encoding': 'utf-8'}),
+    'jsonl': (write_jsonl, 'tuple', {'mode': 'w', 'encoding': 'utf-8'}),
+    'hmsc': (write_columnar, 'columns', {'mode': 'wb'}),
+}
+
+
+# Export one table or report to a file. The file is written under a
+# temporary name and renamed when complete, so a failed export never
+# leaves a truncated file behind.
+def export_file(hospital, source, path, fmt=None, date_from=None, date_to=None, doctor_id=None,
+                batch_size=5000):
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    writer, shape, open_args = WRITERS[fmt]
+
+    columns, batches = hospital.export_rows(source, date_from, date_to, doctor_id, batch_size, shape)
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, **open_args) as handle:
+            count = writer(handle, columns, batches)
+    except BaseException:
+        batches.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export tables and reports to CSV, JSONL or columnar files")
+    parser.add_argument("source", choices=sorted(EXPORT_SOURCES))
+    parser.add_argument("path", help="output file")
+    parser.add_argument("--format", choices=sorted(WRITERS), help="defaults to the file extension")
+    parser.add_argument("--from", dest="date_from", help="first date to include (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="last date to include (YYYY-MM-DD)")
+    parser.add_argument("--doctor", type=int, help="only this doctor's (staff ID) appointments")
+    parser.add_argument("--db", default="hospital.db", help="path to the SQLite database")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows fetched and written at a time")
+    parser.add_argument("--workers", type=int,
+                        help="read from a fresh snapshot of the database with this many processes")
+    parser.add_argument("--snapshot", help="read from this existing snapshot instead of the database")
+    args = parser.parse_args()
+
+    # Snapshot reads run in worker processes and leave the live database
+    # free for the front desk
+    hospital = None
+    try:
+        start = time.perf_counter()
+        if args.snapshot is None and args.workers is None:
+            hospital = Hospital(args.db)
+        else:
+            if args.snapshot is None:
+                with contextlib.closing(Hospital(args.db)) as live:
+                    args.snapshot = live.snapshot()
+                print(f"Took snapshot {args.snapshot} in {time.perf_counter() - start:.1f}s")
+            hospital = ReportPool(args.snapshot, args.workers)
+        count = export_file(hospital, args.source, args.path, args.format, args.date_from, args.date_to,
+                            args.doctor, args.batch_size)
+        print(f"Exported {count} rows to {args.path} in {time.perf_counter() - start:.1f}s")
+    except (OSError, ValueError, sqlite3.Error) as e:
+        sys.exit(f"Export failed: {e}")
+    finally:
+        if hospital is not None:
+            hospital.close()
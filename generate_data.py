@@ -0,0 +1,397 @@
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import datetime
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import time
+
+from export_data import WRITERS
+from hms import Hospital, ROW_SHAPES, convert_batches, timestamp
+
+# Every chunk of rows is generated from a random.Random seeded with the run's
+# seed and the chunk's own key, so the output only depends on the seed and
+# the options - never on how many processes made it or in which order they
+# finished.
+PATIENT_CHUNK = 50000
+
+MALE_NAMES = ("James", "John", "Robert", "Michael", "William", "David", "Richard", "Thomas", "Daniel", "Aarav",
+              "Rahul", "Vikram", "Arjun", "Rohan", "Aditya", "Karthik", "Suresh", "Ravi", "Mohammed", "Ahmed",
+              "Omar", "Wei", "Jun", "Hiroshi", "Kenji", "Carlos", "Luis", "Luca", "Marco", "Chinedu")
+FEMALE_NAMES = ("Mary", "Patricia", "Jennifer", "Linda", "Elizabeth", "Susan", "Sarah", "Karen", "Emily", "Priya",
+                "Ananya", "Sneha", "Divya", "Kavya", "Lakshmi", "Meera", "Pooja", "Anjali", "Fatima", "Aisha",
+                "Zara", "Mei", "Li", "Yuki", "Sakura", "Sofia", "Maria", "Giulia", "Elena", "Ngozi")
+LAST_NAMES = ("Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Martinez", "Wilson",
+              "Anderson", "Taylor", "Thomas", "Moore", "Sharma", "Patel", "Singh", "Kumar", "Gupta", "Reddy",
+              "Iyer", "Nair", "Rao", "Das", "Mehta", "Joshi", "Khan", "Ali", "Hussain", "Chen", "Wang", "Li",
+              "Zhang", "Tanaka", "Sato", "Suzuki", "Rossi", "Russo", "Ferrari", "Müller", "Schmidt", "Novak",
+              "Kowalski", "Okafor", "Mensah", "Silva", "Santos", "Fernandes", "Dubois", "Jensen")
+
+# (value, weight) pairs
+GENDERS = (("Male", 49), ("Female", 49), ("Other", 2))
+# Age bands in years, as (youngest, oldest) and share of patients
+AGE_BANDS = (((0, 14), 18), ((15, 29), 20), ((30, 44), 22), ((45, 64), 25), ((65, 95), 15))
+PROBLEMS = (("checkup", 14), ("fever", 12), ("influenza", 8), ("hypertension", 10), ("diabetes", 9),
+            ("back pain", 7), ("asthma", 5), ("allergy", 5), ("migraine", 4), ("fracture", 3), ("anemia", 3),
+            ("arthritis", 4), ("bronchitis", 3), ("dermatitis", 3), ("gastritis", 3), ("insomnia", 2),
+            ("pregnancy", 3), ("depression", 2), ("chest pain", 2), ("ear infection", 2))
+LANGUAGES = (("English", 60), ("Hindi", 35), ("Kannada", 12), ("Tamil", 10), ("Telugu", 8), ("Urdu", 5),
+             ("Malayalam", 5), ("Bengali", 4), ("Marathi", 4), ("Arabic", 2), ("Mandarin", 1), ("Spanish", 1))
+VISITS = (("Consultation", 40), ("Follow-up", 30), ("Check-up", 12), ("Test results", 8), ("Procedure", 6),
+          ("Vaccination", 4))
+
+# Doctors' specializations: share of doctors, appointment length in
+# minutes, and the share of past appointments the patient did not turn up to
+SPECIALIZATIONS = (
+    ("General Medicine", 25, 15, 0.12),
+    ("Pediatrics", 12, 20, 0.08),
+    ("Cardiology", 8, 30, 0.06),
+    ("Orthopedics", 8, 20, 0.10),
+    ("Gynecology", 8, 20, 0.09),
+    ("Dermatology", 7, 15, 0.15),
+    ("ENT", 6, 15, 0.12),
+    ("Ophthalmology", 6, 15, 0.10),
+    ("Dentistry", 6, 30, 0.14),
+    ("Psychiatry", 5, 45, 0.18),
+    ("Neurology", 5, 30, 0.07),
+    ("Oncology", 4, 30, 0.04),
+)
+# Everyone else on the staff, by share of all staff
+OTHER_ROLES = (("Nursing", 40), ("Administration", 9), ("Laboratory", 7), ("Pharmacy", 5), ("Radiology", 5),
+               ("Physiotherapy", 4))
+DOCTOR_SHARE = 0.30
+
+# Clinic weeks and hours, with their shares of doctors
+CLINIC_DAYS = ((("Mon-Fri", (0, 1, 2, 3, 4)), 70), (("Mon-Sat", (0, 1, 2, 3, 4, 5)), 20),
+               (("Tue-Sat", (1, 2, 3, 4, 5)), 10))
+CLINIC_HOURS = (((9, 17), 45), ((8, 14), 20), ((10, 18), 20), ((13, 20), 15))
+
+Clinic = collections.namedtuple('Clinic', 'doctor_id days opening closing slot_minutes utilization no_show_rate')
+
+
+def random_for(seed, kind, key):
+    return random.Random(f"{seed}:{kind}:{key}")
+
+
+def pick(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+# Weighted choice for many draws: the values and cumulative weights, for
+# rng.choices(values, cum_weights=...), which skips summing every time
+def table(choices):
+    values, weights = zip(*choices)
+    return values, list(itertools.accumulate(weights))
+
+
+# A different mobile number for every id below a billion: the multiplier
+# shares no factor with 10 ** 9, so it permutes the nine-digit numbers
+def mobile_number(rng, number):
+    return f"{rng.choice('6789')}{number * 123456791 % 10 ** 9:09d}"
+
+
+# Patients first_id onwards as (id, name, dob, gender, problem, mobile_no),
+# with ages counted back from today
+def generate_patients(seed, first_id, count, today):
+    rng = random_for(seed, 'patients', first_id)
+    genders, gender_weights = table(GENDERS)
+    bands, band_weights = table(AGE_BANDS)
+    problems, problem_weights = table(PROBLEMS)
+    rows = []
+    for patient_id in range(first_id, first_id + count):
+        gender = rng.choices(genders, cum_weights=gender_weights)[0]
+        first_names = {"Male": MALE_NAMES, "Female": FEMALE_NAMES}.get(gender) or rng.choice((MALE_NAMES, FEMALE_NAMES))
+        youngest, oldest = rng.choices(bands, cum_weights=band_weights)[0]
+        dob = today - datetime.timedelta(days=rng.randint(youngest * 365, oldest * 365 + 364))
+        rows.append((patient_id, f"{rng.choice(first_names)} {rng.choice(LAST_NAMES)}", dob.isoformat(), gender,
+                     rng.choices(problems, cum_weights=problem_weights)[0], mobile_number(rng, patient_id)))
+    return rows
+
+
+# The whole staff as (id, name, age, gender, specialization,
+# languages_spoken, mobile_no, email, schedule) rows, and the clinic of
+# every doctor among them. A doctor's schedule reads like "Mon-Fri
+# 09:00-17:00" and matches the hours their appointments are booked in.
+def generate_staff(seed, count):
+    rng = random_for(seed, 'staff', 0)
+    doctors = max(1, round(count * DOCTOR_SHARE))
+    rows = []
+    clinics = []
+    for staff_id in range(1, count + 1):
+        gender = pick(rng, GENDERS[:2])
+        first_name = rng.choice(MALE_NAMES if gender == "Male" else FEMALE_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        languages = ["English"] + rng.sample([language for language, weight in LANGUAGES[1:]], rng.randint(0, 2))
+        if staff_id <= doctors:
+            specialization, weight, slot_minutes, no_show_rate = rng.choices(
+                SPECIALIZATIONS, [weight for name, weight, slot, rate in SPECIALIZATIONS])[0]
+            (week, days), (opening, closing) = pick(rng, CLINIC_DAYS), pick(rng, CLINIC_HOURS)
+            schedule = f"{week} {opening:02d}:00-{closing:02d}:00"
+            age = rng.randint(28, 68)
+            clinics.append(Clinic(staff_id, days, opening, closing, slot_minutes,
+                                  rng.uniform(0.55, 0.95), no_show_rate * rng.uniform(0.7, 1.3)))
+        else:
+            specialization = pick(rng, OTHER_ROLES)
+            schedule = rng.choice(("Mon-Fri", "Mon-Sat", "Shifts"))
+            age = rng.randint(21, 64)
+        email = f"{first_name}.{last_name}{staff_id}@hospital.example".lower()
+        rows.append((staff_id, f"{first_name} {last_name}", age, gender, specialization, ", ".join(languages),
+                     mobile_number(rng, 10 ** 8 + staff_id), email, schedule))
+    return rows, clinics
+
+
+# count appointments in the doctor's clinic hours from start onwards, as
+# (patient_id, date, time, details, doctor_id, start_ts, end_ts) rows, plus
+# the positions of the no-shows among them. Slots are booked at the
+# doctor's utilization; frequent visitors are more likely to be picked
+# (patient 1 most of all). Only appointments over by now can be no-shows.
+def generate_appointments(seed, clinic, count, patients, start, now):
+    rng = random_for(seed, 'appointments', clinic.doctor_id)
+    visits, visit_weights = table(VISITS)
+    slot = datetime.timedelta(minutes=clinic.slot_minutes)
+    slot_seconds = clinic.slot_minutes * 60
+    now_ts = timestamp(now)
+    rows = []
+    no_shows = []
+    day = start
+    while len(rows) < count:
+        if day.weekday() in clinic.days:
+            moment = datetime.datetime.combine(day, datetime.time(clinic.opening))
+            closing = datetime.datetime.combine(day, datetime.time(clinic.closing))
+            date = day.isoformat()
+            while moment + slot <= closing and len(rows) < count:
+                if rng.random() < clinic.utilization:
+                    start_ts = timestamp(moment)
+                    if start_ts + slot_seconds <= now_ts and rng.random() < clinic.no_show_rate:
+                        no_shows.append(len(rows))
+                    rows.append((1 + int(patients * rng.random() ** 2), date, f"{moment.hour:02d}:{moment.minute:02d}",
+                                 rng.choices(visits, cum_weights=visit_weights)[0], clinic.doctor_id,
+                                 start_ts, start_ts + slot_seconds))
+                moment += slot
+        day += datetime.timedelta(days=1)
+    return rows, no_shows
+
+
+# Indexes the triggers look rows up through while they are inserted; the
+# overlap check on appointments would scan the table without this one
+TRIGGER_INDEXES = {'idx_appointments_doctor_start'}
+
+
+# Drop the indexes of table (other than its primary key and
+# TRIGGER_INDEXES) for a bulk load and build them again afterwards: sorting
+# every row once is much faster than inserting each into every index in turn
+@contextlib.contextmanager
+def indexes_deferred(hospital, table):
+    with hospital.lock:
+        indexes = [(name, sql) for name, sql in hospital.cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+        ) if name not in TRIGGER_INDEXES]
+        for name, sql in indexes:
+            hospital.cursor.execute(f'DROP INDEX {name}')
+        hospital.conn.commit()
+    try:
+        yield
+    finally:
+        with hospital.lock:
+            for name, sql in indexes:
+                hospital.cursor.execute(sql)
+            hospital.conn.commit()
+
+
+# Yield function(*task) for every task, in task order, running up to
+# window tasks ahead on the executor so memory stays bounded
+def run_ahead(executor, function, tasks, window):
+    tasks = iter(tasks)
+    pending = collections.deque(executor.submit(function, *task) for task in itertools.islice(tasks, window))
+    while pending:
+        result = pending.popleft().result()
+        for task in itertools.islice(tasks, 1):
+            pending.append(executor.submit(function, *task))
+        yield result
+
+
+# Appointments shared out between the doctors, the first ones taking one
+# more each when they do not divide evenly
+def appointment_tasks(seed, clinics, appointments, patients, start, now):
+    share, extra = divmod(appointments, len(clinics))
+    for number, clinic in enumerate(clinics):
+        count = share + (number < extra)
+        if count:
+            yield seed, clinic, count, patients, start, now
+
+
+# Columns of the generated rows of each table
+COLUMNS = {
+    'staff': ('id', 'name', 'age', 'gender', 'specialization', 'languages_spoken', 'mobile_no', 'email', 'schedule'),
+    'patients': ('id', 'name', 'dob', 'gender', 'problem', 'mobile_no'),
+    'appointments': ('id', 'patient_id', 'date', 'time', 'details', 'doctor_id', 'start_ts', 'end_ts', 'status'),
+}
+
+
+class Generator:
+    def __init__(self, patients, staff, appointments, seed=1, today=None, history_days=182, workers=None):
+        if patients < 1 or staff < 1 or appointments < 0:
+            raise ValueError("Need at least one patient and one member of staff")
+        self.patients = patients
+        self.staff = staff
+        self.appointments = appointments
+        self.seed = seed
+        self.today = today or datetime.date.today()
+        if self.today > datetime.date.today():
+            raise ValueError("today cannot be later than the real date: patients would be born in the future")
+        # Appointments start history_days back, so some are already over
+        self.start = self.today - datetime.timedelta(days=history_days)
+        self.now = datetime.datetime.combine(self.today, datetime.time())
+        self.workers = workers or os.cpu_count() or 1
+
+    # (table, generator of chunks of rows) for each table, in id order.
+    # Appointments get a status column when with_status is set, and the
+    # no-shows' ids are collected in self.no_shows as they are read.
+    def tables(self, executor, with_status=False):
+        staff_rows, clinics = generate_staff(self.seed, self.staff)
+        window = 2 * self.workers
+
+        def patients():
+            tasks = ((self.seed, first_id, min(PATIENT_CHUNK, self.patients - first_id + 1), self.today)
+                     for first_id in range(1, self.patients + 1, PATIENT_CHUNK))
+            for rows in run_ahead(executor, generate_patients, tasks, window):
+                yield rows
+
+        self.no_shows = []
+
+        def appointments():
+            next_id = 1
+            tasks = appointment_tasks(self.seed, clinics, self.appointments, self.patients, self.start, self.now)
+            for rows, no_shows in run_ahead(executor, generate_appointments, tasks, window):
+                self.no_shows.extend(next_id + position for position in no_shows)
+                rows = [(next_id + position,) + row for position, row in enumerate(rows)]
+                if with_status:
+                    no_shows = set(no_shows)
+                    rows = [row + ('no-show' if position in no_shows else 'booked',)
+                            for position, row in enumerate(rows)]
+                yield rows
+                next_id += len(rows)
+
+        return [('staff', iter([staff_rows])), ('patients', patients()), ('appointments', appointments())]
+
+    # Method to generate straight into an empty database, with the
+    # no-shows moved to its archive as 'no-show'. on_progress(table, rows)
+    # is called after every chunk.
+    def into_database(self, hospital, on_progress=None):
+        counts = hospital.fetch_query('''
+            SELECT (SELECT COUNT(*) FROM patients) + (SELECT COUNT(*) FROM staff)
+                   + (SELECT COUNT(*) FROM appointments)
+                   + (SELECT COUNT(*) FROM sqlite_sequence WHERE name IN ('patients', 'staff', 'appointments'))
+        ''')[0][0]
+        if counts:
+            raise ValueError(f"{hospital.db_path} already holds data; generate into a new database")
+
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as executor:
+            for name, chunks in self.tables(executor):
+                written = 0
+
+                def rows():
+                    nonlocal written
+                    for chunk in chunks:
+                        yield from chunk
+                        written += len(chunk)
+                        if on_progress:
+                            on_progress(name, written)
+
+                # Rows keep their generated ids, which appointments and
+                # no-shows refer to, and every one of them must go in
+                columns = [column for column in COLUMNS[name] if column != 'status']
+                with indexes_deferred(hospital, name):
+                    _, rejected = hospital.bulk_import(name, rows(), columns=columns)
+                if rejected:
+                    row_number, message = rejected[0]
+                    raise ValueError(f"{len(rejected):,} generated {name} were rejected "
+                                     f"(the first, row {row_number}: {message})")
+        hospital.execute_query('ANALYZE')
+
+        archived = timestamp(self.now)
+        for start in range(0, len(self.no_shows), 50000):
+            hospital.move_to_archive('appointments', self.no_shows[start:start + 50000], "'no-show', :archived",
+                                     {'archived': archived})
+        return len(self.no_shows)
+
+    # Method to write <table>.<fmt> files into directory, with ids, in a
+    # format import_data.py reads. Appointments carry a status column
+    # ('booked' or 'no-show') that the importer ignores.
+    def into_files(self, directory, fmt='csv', on_progress=None):
+        writer, shape, open_args = WRITERS[fmt]
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as executor:
+            for name, chunks in self.tables(executor, with_status=True):
+                written = 0
+
+                def batches():
+                    nonlocal written
+                    for chunk in chunks:
+                        yield chunk
+                        written += len(chunk)
+                        if on_progress:
+                            on_progress(name, written)
+
+                columns = COLUMNS[name]
+                rows = batches() if shape == 'tuple' else convert_batches(batches(), ROW_SHAPES[shape](columns))
+                path = os.path.join(directory, f"{name}.{fmt}")
+                with open(path + '.tmp', **open_args) as handle:
+                    writer(handle, columns, rows)
+                os.replace(path + '.tmp', path)
+                paths.append(path)
+        return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic hospital for load testing")
+    parser.add_argument("--patients", type=int, default=1000000, help="patients to generate")
+    parser.add_argument("--staff", type=int, default=2000, help=f"staff to generate ({DOCTOR_SHARE * 100:.0f}%% doctors)")
+    parser.add_argument("--appointments", type=int, default=10000000, help="appointments to generate")
+    parser.add_argument("--seed", type=int, default=1, help="the same seed and options give the same data")
+    parser.add_argument("--today", type=datetime.date.fromisoformat,
+                        help="date the data is generated as of (YYYY-MM-DD, default today)")
+    parser.add_argument("--history-days", type=int, default=182, help="days of appointments before --today")
+    parser.add_argument("--workers", type=int, help="generating processes (default: one per CPU)")
+    parser.add_argument("--db", default="hospital.db", help="empty database to fill")
+    parser.add_argument("--output-dir", help="write import files here instead of filling a database")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="csv", help="format of the files")
+    args = parser.parse_args()
+
+    try:
+        generator = Generator(args.patients, args.staff, args.appointments, args.seed, args.today,
+                              args.history_days, args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+    start = time.perf_counter()
+    shown = 0.0
+
+    def progress(table, rows):
+        global shown
+        elapsed = time.perf_counter() - start
+        if elapsed - shown >= 0.5:
+            shown = elapsed
+            print(f"\r{table}: {rows:,} rows ({elapsed:.0f}s)", end="", flush=True)
+
+    try:
+        if args.output_dir:
+            for path in generator.into_files(args.output_dir, args.format, progress):
+                print(f"\rWrote {path}", " " * 20)
+        else:
+            # Rebuilding indexes and ANALYZE take seconds; that is not news
+            hospital = Hospital(args.db, slow_query_ms=None)
+            try:
+                no_shows = generator.into_database(hospital, progress)
+            finally:
+                hospital.close()
+            print(f"\rGenerated {args.patients:,} patients, {args.staff:,} staff and {args.appointments:,} "
+                  f"appointments ({no_shows:,} no-shows archived)")
+    except (OSError, ValueError, sqlite3.Error) as e:
+        sys.exit(f"Generation failed: {e}")
+    print(f"Done in {time.perf_counter() - start:.1f}s")
@@ -1,35 +1,304 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+import json
 import sqlite3
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
 import os
-
-class Hospital:
-    def __init__(self):
-        # Connect to SQLite database (or create it if it doesn't exist)
-        self.conn = sqlite3.connect('hospital.db')
-        self.cursor = self.conn.cursor()
-
-        # Drop the old patients table if it exists
-        self.cursor.execute('DROP TABLE IF EXISTS patients')
-
-        # Create patients table with the correct schema
-        self.cursor.execute('''
+import pathlib
+import logging
+import argparse
+import itertools
+import operator
+import queue
+import threading
+import contextlib
+import concurrent.futures
+import functools
+import inspect
+import hashlib
+import collections
+import bisect
+import datetime
+import re
+import unicodedata
+import decimal
+
+logger = logging.getLogger("hms")
+
+# Pillow is only needed when an image has to be decoded and resized, which
+# the on-disk caches make rare; load_pil() imports it on first use
+Image = None
+
+
+def load_pil():
+    global Image
+    if Image is None:
+        from PIL import Image as pil_image
+        Image = pil_image
+    return Image
+
+
+# Records how long each startup phase took, from module import until the
+# login window is on screen and its background image has been drawn
+class StartupTimer:
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self.last = self.start
+        self.phases = []
+        self.report_enabled = False
+        self.reported = False
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        report = {phase: round(seconds * 1000, 2) for phase, seconds in self.phases}
+        report['total'] = round((self.last - self.start) * 1000, 2)
+        return report
+
+    # Print the report as one JSON line (once, and only if enabled)
+    def finish(self):
+        if self.report_enabled and not self.reported:
+            self.reported = True
+            print(json.dumps({'startup_ms': self.report()}), flush=True)
+
+
+STARTUP = StartupTimer(IMPORT_STARTED)
+
+# Images and the on-disk image cache live next to this file
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_CACHE_DIR = os.path.join(BASE_DIR, ".hms_cache")
+
+STARTUP.mark('imports')
+
+# Dates are stored as 'YYYY-MM-DD' and times as 'HH:MM' text for display,
+# next to integer columns (Unix timestamps, date ordinals) that range
+# queries and sorting use. These are the other layouts accepted from users
+# and imports; numeric dates are read day first.
+DATE_FORMATS = ('%d-%m-%Y', '%d/%m/%Y', '%d.%m.%Y', '%Y/%m/%d', '%d %b %Y', '%d %B %Y', '%b %d %Y', '%B %d %Y')
+TIME_FORMATS = ('%H:%M:%S', '%H.%M', '%I:%M %p', '%I:%M%p', '%I %p', '%I%p')
+ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+ISO_TIME = re.compile(r'\d{1,2}:\d{2}')
+
+# Oldest date of birth accepted, in years before today
+MAX_AGE_YEARS = 150
+
+
+# Parse a date in any of the accepted layouts; raises ValueError
+def parse_date(text):
+    text = str(text).strip()
+    if ISO_DATE.fullmatch(text):
+        try:
+            return datetime.date.fromisoformat(text)
+        except ValueError:
+            pass
+    cleaned = ' '.join(text.replace(',', ' ').split())
+    for layout in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(cleaned, layout).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date: {text} (expected YYYY-MM-DD or DD-MM-YYYY)")
+
+
+# Parse a time of day ("14:30", "2:30 pm"); raises ValueError
+def parse_time(text):
+    text = str(text).strip()
+    if ISO_TIME.fullmatch(text):
+        hours, minutes = map(int, text.split(':'))
+        if hours < 24 and minutes < 60:
+            return datetime.time(hours, minutes)
+    cleaned = ' '.join(text.upper().replace('.M.', 'M').split())
+    for layout in TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(cleaned, layout).time()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid time: {text} (expected HH:MM)")
+
+
+# Parse a date of birth, which must not be in the future or implausibly
+# long ago; returns it as ('YYYY-MM-DD', date ordinal)
+def normalize_dob(text, today=None):
+    dob = parse_date(text)
+    today = today or datetime.date.today()
+    if dob > today:
+        raise ValueError(f"Date of birth {dob.isoformat()} is in the future")
+    if dob.year < today.year - MAX_AGE_YEARS:
+        raise ValueError(f"Date of birth {dob.isoformat()} is more than {MAX_AGE_YEARS} years ago")
+    return dob.isoformat(), dob.toordinal()
+
+
+# Parse an appointment's date and time; returns ('YYYY-MM-DD', 'HH:MM',
+# start timestamp)
+def normalize_appointment_time(date, time):
+    start = datetime.datetime.combine(parse_date(date), parse_time(time))
+    return start.date().isoformat(), f"{start.hour:02d}:{start.minute:02d}", timestamp(start)
+
+
+# Migration step: fill in dob_ordinal and the start_ts of appointments
+# added without one, rewriting dates and times typed in other layouts to
+# the stored form. Rows already in that form are converted by SQLite; the
+# rest are parsed here, 10000 at a time. Values that cannot be read at all
+# are left alone and counted in a warning.
+def backfill_dates(cursor):
+    cursor.execute('''
+        UPDATE patients SET dob_ordinal = CAST(julianday(dob) - 1721424.5 AS INTEGER)
+        WHERE dob_ordinal IS NULL AND date(dob) = dob
+    ''')
+
+    unreadable = 0
+    last_id = 0
+    while True:
+        rows = cursor.execute(
+            'SELECT id, dob FROM patients WHERE dob_ordinal IS NULL AND id > ? ORDER BY id LIMIT 10000', (last_id,)
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for patient_id, dob in rows:
+            try:
+                dob = parse_date(dob)
+            except ValueError:
+                unreadable += 1
+                continue
+            updates.append((dob.isoformat(), dob.toordinal(), patient_id))
+        cursor.executemany('UPDATE patients SET dob = ?, dob_ordinal = ? WHERE id = ?', updates)
+        last_id = rows[-1][0]
+
+    unreadable += backfill_start_times(cursor, 'main')
+    if unreadable:
+        logger.warning("%d dates of birth or appointment times could not be read and were left as they were",
+                       unreadable)
+
+
+# Archive migration step: the same for archived appointments
+def backfill_archive_dates(cursor):
+    unreadable = backfill_start_times(cursor, 'archive')
+    if unreadable:
+        logger.warning("%d archived appointment times could not be read and were left as they were", unreadable)
+
+
+# Fill in start_ts for the appointments of a schema that have none; returns
+# the number whose date or time could not be read
+def backfill_start_times(cursor, schema):
+    cursor.execute(f'''
+        UPDATE {schema}.appointments SET start_ts = CAST(strftime('%s', date || ' ' || time, 'utc') AS INTEGER)
+        WHERE start_ts IS NULL AND date(date) = date AND strftime('%H:%M', time) = time
+    ''')
+
+    unreadable = 0
+    last_id = 0
+    while True:
+        rows = cursor.execute(
+            f'SELECT id, date, time FROM {schema}.appointments WHERE start_ts IS NULL AND id > ? ORDER BY id LIMIT 10000',
+            (last_id,)
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for appointment_id, date, time in rows:
+            try:
+                updates.append(normalize_appointment_time(date, time) + (appointment_id,))
+            except ValueError:
+                unreadable += 1
+        cursor.executemany(f'UPDATE {schema}.appointments SET date = ?, time = ?, start_ts = ? WHERE id = ?', updates)
+        last_id = rows[-1][0]
+    return unreadable
+
+
+# SQL adding delta (1 or -1) to the counter (name, key) when condition
+# holds. Counters that drop to zero are deleted, so the table only holds
+# live counts; a missing counter reads as zero.
+def counter_change(name, key, delta, condition='1'):
+    if delta > 0:
+        return f'''
+            INSERT INTO counters (name, key, value) SELECT '{name}', {key}, 1 WHERE {condition}
+            ON CONFLICT (name, key) DO UPDATE SET value = value + 1;
+        '''
+    return f'''
+        UPDATE counters SET value = value - 1 WHERE name = '{name}' AND key = {key} AND {condition};
+        DELETE FROM counters WHERE name = '{name}' AND key = {key} AND value = 0;
+    '''
+
+
+# SQL counting an appointment (row 'NEW', delta 1) or uncounting it (row
+# 'OLD', delta -1): appointments per day, each doctor's appointments per
+# day, and from those the doctors working per day and specialization
+def appointment_counters(row, delta):
+    doctor_day = f"{row}.doctor_id || ' ' || {row}.date"
+    appointments = counter_change('appointments', f'{row}.date', delta)
+    doctor = counter_change('doctor_appointments', doctor_day, delta, f'{row}.doctor_id IS NOT NULL')
+    # The doctor starts or stops working that day when their count goes
+    # from 0 to 1 or from 1 to 0
+    working = counter_change(
+        'doctors_working', f"{row}.date || ' ' || (SELECT specialization FROM staff WHERE id = {row}.doctor_id)",
+        delta, f"(SELECT value FROM counters WHERE name = 'doctor_appointments' AND key = {doctor_day}) = 1 "
+               f"AND EXISTS (SELECT 1 FROM staff WHERE id = {row}.doctor_id)"
+    )
+    if delta > 0:
+        return appointments + doctor + working
+    return appointments + working + doctor
+
+
+# SQL moving a doctor's working days from one specialization to another
+def move_working_days(specialization, delta):
+    days = '''
+        SELECT substr(key, length(OLD.id) + 2) AS day FROM counters
+        WHERE name = 'doctor_appointments' AND key > OLD.id || ' ' AND key < OLD.id || '!'
+    '''
+    if delta > 0:
+        return f'''
+            INSERT INTO counters (name, key, value) SELECT 'doctors_working', day || ' ' || {specialization}, 1
+            FROM ({days}) WHERE 1
+            ON CONFLICT (name, key) DO UPDATE SET value = value + 1;
+        '''
+    return f'''
+        UPDATE counters SET value = value - 1
+        WHERE name = 'doctors_working' AND key IN (SELECT day || ' ' || {specialization} FROM ({days}));
+        DELETE FROM counters WHERE name = 'doctors_working' AND value = 0;
+    '''
+
+
+# Recount every counter from the tables (see migration 9)
+COUNTER_REBUILD = (
+    'DELETE FROM counters',
+    "INSERT INTO counters SELECT 'patients', 'in_care', COUNT(*) FROM patients WHERE discharged_ts IS NULL",
+    "INSERT INTO counters SELECT 'staff', specialization, COUNT(*) FROM staff GROUP BY specialization",
+    "INSERT INTO counters SELECT 'appointments', date, COUNT(*) FROM appointments GROUP BY date",
+    '''
+        INSERT INTO counters SELECT 'doctor_appointments', doctor_id || ' ' || date, COUNT(*)
+        FROM appointments WHERE doctor_id IS NOT NULL GROUP BY doctor_id, date
+    ''',
+    '''
+        INSERT INTO counters SELECT 'doctors_working', a.date || ' ' || s.specialization, COUNT(DISTINCT a.doctor_id)
+        FROM appointments a JOIN staff s ON s.id = a.doctor_id GROUP BY a.date, s.specialization
+    ''',
+    "DELETE FROM counters WHERE value = 0",
+)
+
+# Ordered schema migrations. Migration N (1-based) upgrades a database whose
+# PRAGMA user_version is N-1. Each step is either an SQL statement or a
+# callable taking the cursor; steps must be idempotent so a database created
+# by an older release (user_version 0 with tables present) upgrades cleanly.
+# Only ever append to this list - never edit a migration that has shipped.
+MIGRATIONS = [
+    # 1: initial schema
+    [
+        '''
             CREATE TABLE IF NOT EXISTS patients (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL,
                 dob DATE NOT NULL,
-                gender TEXT NOT NULL,  
+                gender TEXT NOT NULL,
                 problem TEXT NOT NULL,
                 mobile_no TEXT NOT NULL
             )
-        ''')
-
-        # Drop the old staff table if it exists
-        self.cursor.execute('DROP TABLE IF EXISTS staff')
-
-        # Create staff table with the correct schema
-        self.cursor.execute('''
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS staff (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL,
@@ -41,10 +310,8 @@ class Hospital:
                 email TEXT,
                 schedule TEXT
             )
-        ''')
-
-        # Recreate appointments table with correct schema
-        self.cursor.execute('''
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS appointments (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 patient_id INTEGER NOT NULL,
@@ -53,101 +320,3154 @@ class Hospital:
                 details TEXT NOT NULL,
                 FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE
             )
-        ''')
+        ''',
+    ],
+    # 2: secondary indexes for the patient/appointment/staff access paths
+    [
+        'CREATE INDEX IF NOT EXISTS idx_appointments_patient_id ON appointments (patient_id)',
+        'CREATE INDEX IF NOT EXISTS idx_appointments_date_time ON appointments (date, time)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_mobile_no ON patients (mobile_no)',
+        'CREATE INDEX IF NOT EXISTS idx_staff_specialization ON staff (specialization)',
+        'ANALYZE',
+    ],
+    # 3: full-text search. patients_fts/staff_fts are external-content FTS5
+    # indexes (the text is stored only once, in the base table) with prefix
+    # indexes for search-as-you-type, kept in sync by triggers. The *_terms
+    # tables expose their vocabulary, which typo-tolerant search matches
+    # misspelt words against; they store nothing themselves.
+    [
+        '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+                name, problem, mobile_no,
+                content='patients', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+            )
+        ''',
+        "CREATE VIRTUAL TABLE IF NOT EXISTS patients_terms USING fts5vocab(patients_fts, 'row')",
+        '''
+            CREATE TRIGGER IF NOT EXISTS patients_search_insert AFTER INSERT ON patients BEGIN
+                INSERT INTO patients_fts (rowid, name, problem, mobile_no)
+                VALUES (new.id, new.name, new.problem, new.mobile_no);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS patients_search_delete AFTER DELETE ON patients BEGIN
+                INSERT INTO patients_fts (patients_fts, rowid, name, problem, mobile_no)
+                VALUES ('delete', old.id, old.name, old.problem, old.mobile_no);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS patients_search_update AFTER UPDATE OF name, problem, mobile_no ON patients BEGIN
+                INSERT INTO patients_fts (patients_fts, rowid, name, problem, mobile_no)
+                VALUES ('delete', old.id, old.name, old.problem, old.mobile_no);
+                INSERT INTO patients_fts (rowid, name, problem, mobile_no)
+                VALUES (new.id, new.name, new.problem, new.mobile_no);
+            END
+        ''',
+        '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS staff_fts USING fts5(
+                name, specialization, languages_spoken,
+                content='staff', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+            )
+        ''',
+        "CREATE VIRTUAL TABLE IF NOT EXISTS staff_terms USING fts5vocab(staff_fts, 'row')",
+        '''
+            CREATE TRIGGER IF NOT EXISTS staff_search_insert AFTER INSERT ON staff BEGIN
+                INSERT INTO staff_fts (rowid, name, specialization, languages_spoken)
+                VALUES (new.id, new.name, new.specialization, new.languages_spoken);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS staff_search_delete AFTER DELETE ON staff BEGIN
+                INSERT INTO staff_fts (staff_fts, rowid, name, specialization, languages_spoken)
+                VALUES ('delete', old.id, old.name, old.specialization, old.languages_spoken);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS staff_search_update AFTER UPDATE OF name, specialization, languages_spoken ON staff BEGIN
+                INSERT INTO staff_fts (staff_fts, rowid, name, specialization, languages_spoken)
+                VALUES ('delete', old.id, old.name, old.specialization, old.languages_spoken);
+                INSERT INTO staff_fts (rowid, name, specialization, languages_spoken)
+                VALUES (new.id, new.name, new.specialization, new.languages_spoken);
+            END
+        ''',
+        # Index the rows that existed before this migration
+        "INSERT INTO patients_fts (patients_fts) VALUES ('rebuild')",
+        "INSERT INTO staff_fts (staff_fts) VALUES ('rebuild')",
+    ],
+    # 4: scheduled appointments. doctor_id links an appointment to a staff
+    # member; start_ts/end_ts are Unix timestamps. The triggers reject a
+    # booking that overlaps one the doctor already has, so two concurrent
+    # bookings can never both succeed. Because a doctor's appointments never
+    # overlap, only the last one starting before the new one ends can
+    # collide, which the (doctor_id, start_ts) index finds with one seek.
+    [
+        'ALTER TABLE appointments ADD COLUMN doctor_id INTEGER REFERENCES staff(id)',
+        'ALTER TABLE appointments ADD COLUMN start_ts INTEGER',
+        'ALTER TABLE appointments ADD COLUMN end_ts INTEGER',
+        'CREATE INDEX IF NOT EXISTS idx_appointments_doctor_start ON appointments (doctor_id, start_ts)',
+        '''
+            CREATE TRIGGER IF NOT EXISTS appointments_no_overlap_insert
+            BEFORE INSERT ON appointments WHEN NEW.doctor_id IS NOT NULL BEGIN
+                SELECT RAISE(ABORT, 'Appointment must have a start and an end after it')
+                WHERE NEW.start_ts IS NULL OR NEW.end_ts IS NULL OR NEW.end_ts <= NEW.start_ts;
+                SELECT RAISE(ABORT, 'Appointment overlaps another booking for this doctor')
+                WHERE (SELECT end_ts FROM appointments
+                       WHERE doctor_id = NEW.doctor_id AND start_ts < NEW.end_ts
+                       ORDER BY start_ts DESC LIMIT 1) > NEW.start_ts;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS appointments_no_overlap_update
+            BEFORE UPDATE OF doctor_id, start_ts, end_ts ON appointments WHEN NEW.doctor_id IS NOT NULL BEGIN
+                SELECT RAISE(ABORT, 'Appointment must have a start and an end after it')
+                WHERE NEW.start_ts IS NULL OR NEW.end_ts IS NULL OR NEW.end_ts <= NEW.start_ts;
+                SELECT RAISE(ABORT, 'Appointment overlaps another booking for this doctor')
+                WHERE (SELECT end_ts FROM appointments
+                       WHERE doctor_id = NEW.doctor_id AND start_ts < NEW.end_ts AND id != NEW.id
+                       ORDER BY start_ts DESC LIMIT 1) > NEW.start_ts;
+            END
+        ''',
+    ],
+    # 5: billing ledger. Amounts are integers in minor units (cents/paise)
+    # and tax rates are basis points (1800 = 18%), so no float rounding ever
+    # reaches a stored amount. A bill is "open" until invoice_bills() fixes
+    # its subtotal, taxes and total; tax rates apply by the bill's creation
+    # time, so changing a rate never alters old invoices.
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS tax_rates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                code TEXT NOT NULL,
+                rate_bp INTEGER NOT NULL CHECK (rate_bp >= 0),
+                valid_from INTEGER NOT NULL DEFAULT 0,
+                valid_to INTEGER
+            )
+        ''',
+        "INSERT INTO tax_rates (code, rate_bp) VALUES ('CST', 200), ('GST', 1800)",
+        '''
+            CREATE TABLE IF NOT EXISTS bills (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                patient_id INTEGER NOT NULL,
+                created_ts INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'invoiced')),
+                invoiced_ts INTEGER,
+                subtotal INTEGER,
+                tax INTEGER,
+                total INTEGER,
+                FOREIGN KEY (patient_id) REFERENCES patients(id)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS bill_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bill_id INTEGER NOT NULL,
+                description TEXT NOT NULL,
+                quantity INTEGER NOT NULL DEFAULT 1 CHECK (quantity > 0),
+                unit_amount INTEGER NOT NULL CHECK (unit_amount >= 0),
+                FOREIGN KEY (bill_id) REFERENCES bills(id) ON DELETE CASCADE
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS bill_taxes (
+                bill_id INTEGER NOT NULL,
+                code TEXT NOT NULL,
+                rate_bp INTEGER NOT NULL,
+                amount INTEGER NOT NULL,
+                PRIMARY KEY (bill_id, code),
+                FOREIGN KEY (bill_id) REFERENCES bills(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_tax_rates_code ON tax_rates (code, valid_from)',
+        'CREATE INDEX IF NOT EXISTS idx_bills_status ON bills (status, created_ts)',
+        'CREATE INDEX IF NOT EXISTS idx_bills_patient_id ON bills (patient_id)',
+        'CREATE INDEX IF NOT EXISTS idx_bill_items_bill_id ON bill_items (bill_id)',
+    ],
+    # 6: soft delete. Discharging a patient only sets discharged_ts; the
+    # row stays (out of searches and lookups) until Hospital.archive()
+    # moves it to the archive database. The partial index finds discharged
+    # patients without touching active ones, and end_ts finds past
+    # appointments.
+    [
+        'ALTER TABLE patients ADD COLUMN discharged_ts INTEGER',
+        'CREATE INDEX IF NOT EXISTS idx_patients_discharged ON patients (discharged_ts) WHERE discharged_ts IS NOT NULL',
+        'CREATE INDEX IF NOT EXISTS idx_appointments_end_ts ON appointments (end_ts)',
+    ],
+    # 7: typed dates. Every appointment gets a start_ts (appointments added
+    # without a doctor used to have only text), so date ranges are integer
+    # range scans on idx_appointments_start_ts, which replaces the index on
+    # the text columns. dob_ordinal is the date of birth as a proleptic
+    # Gregorian ordinal (datetime.date.toordinal()).
+    [
+        'ALTER TABLE patients ADD COLUMN dob_ordinal INTEGER',
+        backfill_dates,
+        'CREATE INDEX IF NOT EXISTS idx_appointments_start_ts ON appointments (start_ts)',
+        'DROP INDEX IF EXISTS idx_appointments_date_time',
+        'ANALYZE',
+    ],
+    # 8: patient timelines. A patient's appointments and bills are read
+    # newest first, a page at a time, straight off these indexes; they
+    # replace the indexes on patient_id alone, which they start with.
+    [
+        'CREATE INDEX IF NOT EXISTS idx_appointments_patient_start ON appointments (patient_id, start_ts)',
+        'DROP INDEX IF EXISTS idx_appointments_patient_id',
+        'CREATE INDEX IF NOT EXISTS idx_bills_patient_created ON bills (patient_id, created_ts)',
+        'DROP INDEX IF EXISTS idx_bills_patient_id',
+    ],
+    # 9: dashboard counters, kept up to date by triggers so the home
+    # screen reads a handful of rows instead of counting whole tables.
+    # Counters are (name, key) -> value: ('patients', 'in_care'),
+    # ('staff', specialization), ('appointments', day), ('doctor_appointments',
+    # 'doctor_id day') and ('doctors_working', 'day specialization'), days
+    # being 'YYYY-MM-DD'. Hospital.rebuild_counters() recounts them.
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value INTEGER NOT NULL,
+                PRIMARY KEY (name, key)
+            ) WITHOUT ROWID
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS patients_counters_insert AFTER INSERT ON patients
+            WHEN NEW.discharged_ts IS NULL BEGIN
+                {counter_change('patients', "'in_care'", 1)}
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS patients_counters_delete AFTER DELETE ON patients
+            WHEN OLD.discharged_ts IS NULL BEGIN
+                {counter_change('patients', "'in_care'", -1)}
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS patients_counters_update AFTER UPDATE OF discharged_ts ON patients
+            WHEN (OLD.discharged_ts IS NULL) != (NEW.discharged_ts IS NULL) BEGIN
+                {counter_change('patients', "'in_care'", -1, 'OLD.discharged_ts IS NULL')}
+                {counter_change('patients', "'in_care'", 1, 'NEW.discharged_ts IS NULL')}
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS staff_counters_insert AFTER INSERT ON staff BEGIN
+                {counter_change('staff', 'NEW.specialization', 1)}
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS staff_counters_delete AFTER DELETE ON staff BEGIN
+                {counter_change('staff', 'OLD.specialization', -1)}
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS staff_counters_update AFTER UPDATE OF specialization ON staff
+            WHEN OLD.specialization != NEW.specialization BEGIN
+                {counter_change('staff', 'OLD.specialization', -1)}
+                {counter_change('staff', 'NEW.specialization', 1)}
+                {move_working_days('OLD.specialization', -1)}
+                {move_working_days('NEW.specialization', 1)}
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS appointments_counters_insert AFTER INSERT ON appointments BEGIN
+                {appointment_counters('NEW', 1)}
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS appointments_counters_delete AFTER DELETE ON appointments BEGIN
+                {appointment_counters('OLD', -1)}
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS appointments_counters_update AFTER UPDATE OF date, doctor_id ON appointments BEGIN
+                {appointment_counters('OLD', -1)}
+                {appointment_counters('NEW', 1)}
+            END
+        ''',
+    ] + list(COUNTER_REBUILD),
+    # 10: triggers Hospital.bulk_import drops for the length of an import,
+    # kept here so they can be put back should the import never finish
+    [
+        'CREATE TABLE IF NOT EXISTS suspended_triggers (name TEXT PRIMARY KEY, sql TEXT NOT NULL)',
+    ],
+]
+
+# Migrations of the archive database (attached as "archive", see
+# Hospital.attach_archive), versioned by its own PRAGMA user_version. It
+# holds discharged patients and past or cancelled appointments moved out of
+# the active tables; rows keep their ids, which AUTOINCREMENT never reuses.
+# status is 'completed' or 'cancelled'. Names and numbers are NOCASE so
+# prefix searches (LIKE 'jo%') can use the indexes.
+ARCHIVE_MIGRATIONS = [
+    # 1: archive tables
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS archive.patients (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL COLLATE NOCASE,
+                dob DATE NOT NULL,
+                gender TEXT NOT NULL,
+                problem TEXT NOT NULL,
+                mobile_no TEXT NOT NULL COLLATE NOCASE,
+                discharged_ts INTEGER,
+                archived_ts INTEGER NOT NULL
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS archive.appointments (
+                id INTEGER PRIMARY KEY,
+                patient_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                time TEXT NOT NULL,
+                details TEXT NOT NULL,
+                doctor_id INTEGER,
+                start_ts INTEGER,
+                end_ts INTEGER,
+                status TEXT NOT NULL,
+                archived_ts INTEGER NOT NULL
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS archive.idx_patients_name ON patients (name)',
+        'CREATE INDEX IF NOT EXISTS archive.idx_patients_mobile_no ON patients (mobile_no)',
+        'CREATE INDEX IF NOT EXISTS archive.idx_appointments_patient_id ON appointments (patient_id, date, time)',
+    ],
+    # 2: start times for archived appointments (see migration 7 of the
+    # active database) and the index patient timelines page through
+    [
+        backfill_archive_dates,
+        'CREATE INDEX IF NOT EXISTS archive.idx_appointments_patient_start ON appointments (patient_id, start_ts)',
+    ],
+]
+
+# Columns moved to the archive, per table
+ARCHIVE_COLUMNS = {
+    'patients': 'id, name, dob, gender, problem, mobile_no, discharged_ts',
+    'appointments': 'id, patient_id, date, time, details, doctor_id, start_ts, end_ts',
+}
+
+# SQL for "this appointment is over" at :now (a timestamp): it has ended,
+# or it has no end and started before :today (midnight, a timestamp), or
+# its time could not be read and its date is before :day ('YYYY-MM-DD').
+# past_moments() gives all three.
+APPOINTMENT_PAST = 'COALESCE(end_ts <= :now, start_ts < :today, date < :day)'
+
+# Columns accepted by Hospital.bulk_import for each table, in table order.
+# "id" is optional so records migrated from another system keep their ids
+# (appointments refer to patients by id).
+IMPORT_COLUMNS = {
+    'patients': ('id', 'name', 'dob', 'gender', 'problem', 'mobile_no'),
+    'staff': ('id', 'name', 'age', 'gender', 'specialization', 'languages_spoken', 'mobile_no', 'email', 'schedule'),
+    'appointments': ('id', 'patient_id', 'date', 'time', 'details', 'doctor_id', 'start_ts', 'end_ts'),
+}
+
+# Columns that must be present and non-empty in every imported row
+IMPORT_REQUIRED = {
+    'patients': ('name', 'dob', 'gender', 'problem', 'mobile_no'),
+    'staff': ('name', 'age', 'gender', 'specialization', 'mobile_no'),
+    'appointments': ('patient_id', 'date', 'time', 'details'),
+}
+
+
+# Import conversions: given the imported columns and the length of an
+# appointment slot, return the columns to insert and a function turning
+# each row's values into theirs, raising ValueError for a row that must be
+# rejected
+def import_patients(columns, slot):
+    dob = columns.index('dob')
+    today = datetime.date.today()
+    # Many patients share a date of birth
+    normalize = functools.lru_cache(maxsize=65536)(lambda text: normalize_dob(text, today))
+
+    def convert(values):
+        values = list(values)
+        values[dob], ordinal = normalize(values[dob])
+        values.append(ordinal)
+        return values
+    return columns + ['dob_ordinal'], convert
+
+
+# Appointments without a start or end time get them from the date and
+# time, lasting one slot, as the scheduler's triggers require both
+def import_appointments(columns, slot):
+    date, time = columns.index('date'), columns.index('time')
+    added = [column for column in ('start_ts', 'end_ts') if column not in columns]
+    columns = columns + added
+    start, end = columns.index('start_ts'), columns.index('end_ts')
+
+    def convert(values):
+        values = list(values) + [None] * len(added)
+        values[date], values[time], start_ts = normalize_appointment_time(values[date], values[time])
+        if values[start] in (None, ''):
+            values[start] = start_ts
+        if values[end] in (None, ''):
+            values[end] = int(values[start]) + int(slot.total_seconds())
+        return values
+    return columns, convert
+
+
+IMPORT_CONVERSIONS = {
+    'patients': import_patients,
+    'appointments': import_appointments,
+}
+
+# Columns covered by the full-text index of each table (<table>_fts,
+# created by migration 3)
+SEARCH_INDEXES = {
+    'patients': ('name', 'problem', 'mobile_no'),
+    'staff': ('name', 'specialization', 'languages_spoken'),
+}
+
+# Most rows a search returns
+SEARCH_LIMIT = 50
+
+
+# Parse an amount typed by a user ("1,234.50") into integer minor units,
+# rounding half up to the nearest cent
+def to_minor_units(text):
+    try:
+        amount = decimal.Decimal(str(text).replace(',', '').strip())
+    except decimal.InvalidOperation:
+        raise ValueError(f"Invalid amount: {text}") from None
+    if not amount.is_finite() or amount < 0:
+        raise ValueError(f"Invalid amount: {text}")
+    return int((amount * 100).quantize(decimal.Decimal(1), rounding=decimal.ROUND_HALF_UP))
+
+
+# Parse a tax rate typed as a percentage ("18", "2.5") into basis points.
+# A basis point is the smallest step a rate can take, so more than two
+# decimal places is refused rather than rounded away.
+def to_basis_points(text):
+    try:
+        percent = decimal.Decimal(str(text).strip())
+    except decimal.InvalidOperation:
+        raise ValueError(f"Invalid percentage: {text}") from None
+    if not percent.is_finite() or percent < 0 or (percent * 100) % 1:
+        raise ValueError(f"Invalid percentage: {text} (use 0 or more, with at most two decimal places)")
+    return int(percent * 100)
+
+
+# Format minor units for display ("1,234.50")
+def format_money(minor):
+    sign = '-' if minor < 0 else ''
+    units, cents = divmod(abs(minor), 100)
+    return f"{sign}{units:,}.{cents:02d}"
+
+
+# Format a rate in basis points as a percentage ("18%", "2.5%")
+def format_rate(rate_bp):
+    return f"{(decimal.Decimal(rate_bp) / 100).normalize():f}%"
+
+
+# Split free text typed by a user into lower-case words. Only letters and
+# digits are kept, so the words can never be parsed as FTS5 syntax.
+def search_words(text):
+    return re.findall(r'\w+', text.lower())
+
+
+# Build an FTS5 query that requires every group to match; each group is a
+# list of alternatives for one typed word, and "*" marks a prefix
+# ([['jo*'], ['smith', 'smyth']] -> '"jo"* AND ("smith" OR "smyth")')
+def match_query(groups):
+    clauses = []
+    for alternatives in groups:
+        terms = [f'"{term[:-1]}"*' if term.endswith('*') else f'"{term}"' for term in alternatives]
+        clauses.append(terms[0] if len(terms) == 1 else '(' + ' OR '.join(terms) + ')')
+    return ' AND '.join(clauses)
+
+
+# Number of single-letter insertions, deletions, substitutions or swaps of
+# neighbouring letters needed to turn a into b, giving up (returning
+# limit + 1) once it is certain to exceed limit
+def edit_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    two_back = None
+    one_back = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(one_back[j] + 1, current[j - 1] + 1,
+                             one_back[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], two_back[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        two_back, one_back = one_back, current
+    return one_back[-1]
+
+
+# Named tuple class for rows with the given column names. Records are
+# plain tuples underneath (no per-row __dict__), and one class is shared by
+# every row of a query.
+@functools.lru_cache(maxsize=256)
+def record_class(columns):
+    return collections.namedtuple('Record', columns, rename=True)
+
+
+def to_records(columns):
+    make = record_class(tuple(columns))._make
+    return lambda rows: list(map(make, rows))
+
+
+# {column name: tuple of that column's values} for a batch, for consumers
+# that work a column at a time (sums, histograms, columnar files)
+def to_columns(columns):
+    return lambda rows: dict(zip(columns, zip(*rows)))
+
+
+# Generators over converted batches or single rows that close the batch
+# generator underneath - releasing its connection - as soon as they are
+# closed themselves
+def convert_batches(batches, convert):
+    try:
+        for rows in batches:
+            yield convert(rows)
+    finally:
+        batches.close()
+
+
+def each_row(batches):
+    try:
+        for rows in batches:
+            yield from rows
+    finally:
+        batches.close()
+
+
+# How Hospital.stream_query can hand out each batch of rows: as the tuples
+# SQLite returns, as named-tuple records, or transposed into columns
+ROW_SHAPES = {
+    'tuple': None,
+    'record': to_records,
+    'columns': to_columns,
+}
+
+
+# What can be exported or reported on: the query (filters are inserted
+# at {where}), the timestamp column that date ranges filter on, and the
+# column holding the doctor's staff id. Tables are
+# exported in id order; the census and doctor-load reports are SQL
+# aggregates over appointments, one row per day (and doctor).
+EXPORT_SOURCES = {
+    'patients': ('SELECT * FROM patients WHERE {where} ORDER BY id', None, None),
+    'staff': ('SELECT * FROM staff WHERE {where} ORDER BY id', None, None),
+    'appointments': ('SELECT * FROM appointments WHERE {where} ORDER BY id', 'start_ts', 'doctor_id'),
+    'bills': ('SELECT * FROM bills WHERE {where} ORDER BY id', 'created_ts', None),
+    'census': ('''
+        SELECT date, COUNT(*) AS appointments, COUNT(DISTINCT patient_id) AS patients,
+               COUNT(DISTINCT doctor_id) AS doctors
+        FROM appointments WHERE {where}
+        GROUP BY date ORDER BY date
+    ''', 'start_ts', 'doctor_id'),
+    'doctor-load': ('''
+        SELECT a.date, a.doctor_id, s.name AS doctor, COUNT(*) AS appointments,
+               SUM(a.end_ts - a.start_ts) / 60 AS booked_minutes,
+               MIN(a.time) AS first_appointment, MAX(a.time) AS last_appointment
+        FROM appointments a JOIN staff s ON s.id = a.doctor_id WHERE {where}
+        GROUP BY a.date, a.doctor_id ORDER BY a.date, a.doctor_id
+    ''', 'a.start_ts', 'a.doctor_id'),
+}
+
+
+# The census and doctor-load reports group by day, so they can be split into
+# runs of whole days; tables are split into ranges of ids instead
+DAILY_REPORTS = ('census', 'doctor-load')
+
+
+# Build the SQL and parameters for one of EXPORT_SOURCES, limited to a date
+# range (inclusive, 'YYYY-MM-DD'), a doctor and a range of ids (lowest, first
+# id past the end), any of which may be None.
+def export_query(source, date_from=None, date_to=None, doctor_id=None, ids=None):
+    if source not in EXPORT_SOURCES:
+        raise ValueError(f"Cannot export unknown source: {source}")
+    query, date_column, doctor_column = EXPORT_SOURCES[source]
+
+    conditions = []
+    parameters = []
+    # Days run from midnight to the next midnight
+    for bound, days, comparison in ((date_from, 0, '>='), (date_to, 1, '<')):
+        if bound is None:
+            continue
+        if date_column is None:
+            raise ValueError(f"{source} cannot be filtered by date")
+        conditions.append(f'{date_column} {comparison} ?')
+        parameters.append(midnight(parse_date(bound) + datetime.timedelta(days=days)))
+    if doctor_id is not None:
+        if doctor_column is None:
+            raise ValueError(f"{source} cannot be filtered by doctor")
+        conditions.append(f'{doctor_column} = ?')
+        parameters.append(doctor_id)
+    if ids is not None:
+        if source in DAILY_REPORTS:
+            raise ValueError(f"{source} cannot be split by id")
+        conditions.append('id >= ? AND id < ?')
+        parameters.extend(ids)
+
+    where = ' AND '.join(conditions) or '1'
+    return query.format(where=where), parameters
+
+
+# Per-connection settings. WAL lets readers run alongside the single writer;
+# synchronous=NORMAL is durable across application crashes in WAL mode and
+# only fsyncs at checkpoints; cache_size is negative KiB (64 MiB).
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -65536',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA busy_timeout = 5000',
+)
+
+
+# Open a connection with the tuned pragmas applied. Connections may be handed
+# between threads, but each one must only be used by one thread at a time.
+# With tracing QueryStats, every statement is logged and its work counted.
+def connect(db_path, stats=None):
+    conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    if stats is not None and stats.trace:
+        stats.install(conn)
+    return conn
+
+
+# A bounded pool of read connections for threads other than the one that
+# owns the Hospital. A thread keeps its connection for nested use; when all
+# connections are checked out, callers wait for one to be returned.
+class ConnectionPool:
+    def __init__(self, db_path, size=4, stats=None):
+        self.db_path = db_path
+        self.size = size
+        self.stats = stats
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # Databases attached to every connection (schema -> path), and the
+        # schemas each connection has attached so far, by id(connection)
+        self.attachments = {}
+        self.attached = collections.defaultdict(set)
+
+    @contextlib.contextmanager
+    def connection(self, timeout=30):
+        held = getattr(self.local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self.acquire(timeout)
+        self.local.conn = conn
+        try:
+            yield conn
+        finally:
+            self.local.conn = None
+            self.release(conn)
+
+    # Hand a connection taken with acquire() back to the pool
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self.idle.put(conn)
+
+    def acquire(self, timeout):
+        conn = self.take(timeout)
+        attached = self.attached[id(conn)]
+        for schema, path in list(self.attachments.items()):
+            if schema not in attached:
+                conn.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+                attached.add(schema)
+        return conn
+
+    def take(self, timeout):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.created < self.size:
+                self.created += 1
+                return connect(self.db_path, self.stats)
+        try:
+            return self.idle.get(timeout=timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a database connection") from None
+
+    # Attach a database to every connection as schema, each one the next
+    # time it is handed out
+    def attach(self, schema, path):
+        self.attachments[schema] = path
 
-    # Method to execute INSERT, UPDATE, DELETE queries
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# Open a snapshot (see Hospital.snapshot) read-only. A snapshot is never
+# written once renamed into place, so SQLite can skip locking it.
+def connect_snapshot(path):
+    conn = sqlite3.connect(pathlib.Path(path).absolute().as_uri() + '?mode=ro&immutable=1', uri=True,
+                           check_same_thread=False)
+    for pragma in ('PRAGMA cache_size = -65536', 'PRAGMA mmap_size = 268435456', 'PRAGMA temp_store = MEMORY'):
+        conn.execute(pragma)
+    return conn
+
+
+# Each ReportPool worker process reads through one connection of its own
+snapshot_conn = None
+
+
+def open_snapshot_worker(path):
+    global snapshot_conn
+    snapshot_conn = connect_snapshot(path)
+
+
+def run_snapshot_query(query, parameters):
+    return snapshot_conn.execute(query, parameters).fetchall()
+
+
+# Serves exports and reports from a snapshot across a pool of processes, so
+# heavy reporting runs on every core and never touches the live database.
+# Each request is split into pieces that run in parallel and come back in
+# order: tables by ranges of ids, the daily reports by runs of whole days.
+# export_rows matches Hospital.export_rows, so either can be handed to
+# export_data.export_file.
+class ReportPool:
+    def __init__(self, snapshot_path, workers=None):
+        self.snapshot_path = snapshot_path
+        self.workers = workers or os.cpu_count() or 1
+        # For planning the pieces and reading column names
+        self.conn = connect_snapshot(snapshot_path)
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            self.workers, initializer=open_snapshot_worker, initargs=(snapshot_path,)
+        )
+
+    # Method to stream one of EXPORT_SOURCES; returns (column names,
+    # generator of batches). A batch holds one piece: up to batch_size
+    # rows of a table, or a run of days of a report.
+    def export_rows(self, source, date_from=None, date_to=None, doctor_id=None, batch_size=5000, shape='tuple'):
+        if shape not in ROW_SHAPES:
+            raise ValueError(f"Unknown row shape: {shape}")
+        query, parameters = export_query(source, date_from, date_to, doctor_id)
+        columns = [column[0] for column in self.conn.execute(f'SELECT * FROM ({query}) LIMIT 0', parameters).description]
+
+        if source not in DAILY_REPORTS:
+            lowest, highest = self.conn.execute(f'SELECT MIN(id), MAX(id) FROM ({query})', parameters).fetchone()
+            pieces = [] if lowest is None else (
+                export_query(source, date_from, date_to, doctor_id, (first, first + batch_size))
+                for first in range(lowest, highest + 1, batch_size)
+            )
+        elif self.unreadable_dates(date_from, date_to):
+            # Rows without a start_ts fall outside every run of days
+            pieces = [(query, parameters)]
+        else:
+            pieces = (export_query(source, first, last, doctor_id) for first, last in self.day_runs(date_from, date_to))
+
+        batches = self.run_pieces(pieces)
+        if shape == 'tuple':
+            return columns, batches
+        return columns, convert_batches(batches, ROW_SHAPES[shape](columns))
+
+    def unreadable_dates(self, date_from, date_to):
+        if date_from is not None or date_to is not None:
+            return False
+        return self.conn.execute('SELECT 1 FROM appointments WHERE start_ts IS NULL LIMIT 1').fetchone() is not None
+
+    # Split the days from date_from to date_to (default: the first and last
+    # appointment) into a few runs per worker; yields (first, last) dates
+    def day_runs(self, date_from, date_to):
+        earliest, latest = self.conn.execute('SELECT MIN(start_ts), MAX(start_ts) FROM appointments').fetchone()
+        if earliest is None:
+            return
+        first = parse_date(date_from) if date_from is not None else datetime.date.fromtimestamp(earliest)
+        last = parse_date(date_to) if date_to is not None else datetime.date.fromtimestamp(latest)
+        days = (last - first).days + 1
+        length = max(1, -(-days // (self.workers * 4)))
+        while first <= last:
+            end = min(last, first + datetime.timedelta(days=length - 1))
+            yield first.isoformat(), end.isoformat()
+            first = end + datetime.timedelta(days=1)
+
+    # Run the pieces, a few per worker at a time so that results waiting to
+    # be written stay bounded, and yield their rows in order
+    def run_pieces(self, pieces):
+        pieces = iter(pieces)
+        pending = collections.deque(
+            self.executor.submit(run_snapshot_query, query, parameters)
+            for query, parameters in itertools.islice(pieces, self.workers * 2)
+        )
+        try:
+            while pending:
+                rows = pending.popleft().result()
+                for query, parameters in itertools.islice(pieces, 1):
+                    pending.append(self.executor.submit(run_snapshot_query, query, parameters))
+                if rows:
+                    yield rows
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.conn.close()
+
+
+# Runs writes submitted from any thread, in order, on a background thread.
+# The writes themselves go through Hospital.execute_query, so they share the
+# single writer connection with the owning thread.
+class WriteQueue:
+    def __init__(self, hospital):
+        self.hospital = hospital
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="hms-writer", daemon=True)
+        self.thread.start()
+
+    # Queue a statement; the returned Future resolves to the row id of the
+    # last inserted row, or to the error raised by SQLite
+    def submit(self, query, parameters=()):
+        future = concurrent.futures.Future()
+        self.pending.put((future, query, parameters))
+        return future
+
+    def run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            future, query, parameters = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.hospital.execute_query(query, parameters))
+            except Exception as e:
+                future.set_exception(e)
+
+    # Finish everything already queued, then stop the thread
+    def close(self):
+        self.pending.put(None)
+        self.thread.join()
+
+
+# Table an INSERT, UPDATE, DELETE or REPLACE statement writes to, or None
+WRITTEN_TABLE = re.compile(
+    r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+["`\[]?(\w+)',
+    re.IGNORECASE
+)
+
+
+def written_table(query):
+    match = WRITTEN_TABLE.match(query)
+    return match.group(1).lower() if match else None
+
+
+# Read-through cache of query results for Hospital, evicting the least
+# recently used entry beyond max_entries and any entry older than ttl
+# seconds. Every entry names the tables it was read from and is dropped as
+# soon as one of them is written. A per-table generation number stops a
+# read that raced with a write from storing what it read. Values are shared
+# between callers, so only immutable values (tuples) should be stored.
+class QueryCache:
+    def __init__(self, max_entries=1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.keys_by_table = collections.defaultdict(set)
+        self.generations = collections.Counter()
+        self.epoch = 0
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    # (True, value) for a live entry, (False, None) otherwise
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, tables, value = entry
+                if expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                self.remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    # Snapshot to take before reading the tables and hand to put()
+    def generation(self, tables):
+        with self.lock:
+            return self.epoch, tuple(self.generations[table] for table in tables)
+
+    def put(self, key, tables, value, generation):
+        with self.lock:
+            if self.max_entries <= 0 or generation != (self.epoch, tuple(self.generations[table] for table in tables)):
+                return
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, tables, value)
+            for table in tables:
+                self.keys_by_table[table].add(key)
+            while len(self.entries) > self.max_entries:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key):
+        expires, tables, value = self.entries.pop(key)
+        for table in tables:
+            self.keys_by_table[table].discard(key)
+
+    # Drop every entry read from table
+    def invalidate(self, table):
+        with self.lock:
+            self.generations[table] += 1
+            keys = self.keys_by_table.pop(table, ())
+            for key in keys:
+                self.remove(key)
+            self.invalidations += len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.epoch += 1
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.keys_by_table.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+# Listings longer than this are streamed every time instead of cached
+CACHE_MAX_ROWS = 10000
+
+# Upper bounds, in milliseconds, of the latency histogram buckets kept for
+# each statement; a last bucket holds anything slower
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# With tracing on, SQLite calls back every this many virtual machine
+# instructions; the count of callbacks measures how much work a statement did
+PROGRESS_STEPS = 1000
+
+# Literals folded into '?' when statements are grouped (strings, and numbers
+# that are not part of a name), and lists of them after IN
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w.])-?\d+(?:\.\d+)?\b")
+SQL_IN_LISTS = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+
+sql_logger = logging.getLogger("hms.sql")
+
+
+# Statement text with literals and whitespace normalised, so that queries
+# differing only in the values built into them are counted together
+def normalize_sql(query):
+    return SQL_IN_LISTS.sub('IN (...)', ' '.join(SQL_LITERALS.sub('?', query).split()))
+
+
+# Latency histogram, row counts and a slow-query log per normalised
+# statement, for Hospital. Only the statement text is kept, never the
+# parameters, which hold patient details. With trace on, connections log
+# every statement (expanded, at DEBUG level on the hms.sql logger) and
+# count the instructions SQLite runs for it.
+class QueryStats:
+    def __init__(self, slow_query_ms=100.0, slow_log_size=100, trace=False):
+        self.slow_query_ms = slow_query_ms if slow_query_ms is not None else float('inf')
+        self.trace = trace
+        self.statements = {}
+        self.entries = {}
+        self.slow_queries = collections.deque(maxlen=slow_log_size)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    # Method to hook the trace and progress callbacks into a connection
+    def install(self, conn):
+        conn.set_trace_callback(self.trace_statement)
+        conn.set_progress_handler(self.count_steps, PROGRESS_STEPS)
+
+    def trace_statement(self, statement):
+        sql_logger.debug("%s", statement)
+
+    def count_steps(self):
+        self.local.steps = getattr(self.local, 'steps', 0) + 1
+
+    # Call before running a statement; returns the start time for record()
+    def begin(self):
+        if self.trace:
+            self.local.steps = 0
+        return time.perf_counter()
+
+    def record(self, query, started, rows):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)
+        with self.lock:
+            entry = self.entries.get(query)
+            if entry is None:
+                entry = self.add_entry(query)
+            entry[0] += 1
+            entry[1] += elapsed_ms
+            if elapsed_ms > entry[2]:
+                entry[2] = elapsed_ms
+            entry[3] += rows
+            entry[5][bucket] += 1
+            if self.trace:
+                entry[4] += getattr(self.local, 'steps', 0)
+        if elapsed_ms >= self.slow_query_ms:
+            sql = normalize_sql(query)
+            self.slow_queries.append({'at': time.time(), 'ms': round(elapsed_ms, 3), 'rows': rows, 'sql': sql})
+            logger.warning("Slow query (%.1f ms, %d rows): %s", elapsed_ms, rows, sql)
+
+    # Counters are kept per normalised statement and looked up by the exact
+    # query text, so normalising only happens the first time a text is seen
+    def add_entry(self, query):
+        # Queries built with changing literals would otherwise grow this
+        if len(self.entries) >= 4096:
+            self.entries.clear()
+        sql = normalize_sql(query)
+        entry = self.statements.get(sql)
+        if entry is None:
+            entry = self.statements[sql] = [0, 0.0, 0.0, 0, 0, [0] * (len(LATENCY_BUCKETS_MS) + 1)]
+        self.entries[query] = entry
+        return entry
+
+    # Statements sorted by total time (the first limit of them), and the
+    # most recent slow queries. Percentiles are bucket upper bounds.
+    def report(self, limit=None):
+        with self.lock:
+            entries = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+            slow_queries = list(self.slow_queries)
+
+        def percentile(calls, max_ms, buckets, fraction):
+            seen = 0
+            for bound, count in zip(LATENCY_BUCKETS_MS, buckets):
+                seen += count
+                if seen >= calls * fraction:
+                    return min(bound, max_ms)
+            return max_ms
+
+        statements = []
+        for sql, (calls, total_ms, max_ms, rows, steps, buckets) in entries:
+            statement = {
+                'sql': sql,
+                'calls': calls,
+                'total_ms': round(total_ms, 3),
+                'mean_ms': round(total_ms / calls, 3),
+                'p50_ms': round(percentile(calls, max_ms, buckets, 0.5), 3),
+                'p95_ms': round(percentile(calls, max_ms, buckets, 0.95), 3),
+                'max_ms': round(max_ms, 3),
+                'rows': rows,
+                'histogram': {f'<={bound}': count for bound, count in zip(LATENCY_BUCKETS_MS, buckets) if count},
+            }
+            if buckets[-1]:
+                statement['histogram'][f'>{LATENCY_BUCKETS_MS[-1]}'] = buckets[-1]
+            if self.trace:
+                statement['vm_steps'] = steps * PROGRESS_STEPS
+            statements.append(statement)
+        slow_query_ms = self.slow_query_ms if self.slow_query_ms != float('inf') else None
+        return {'slow_query_ms': slow_query_ms, 'statements': statements, 'slow_queries': slow_queries}
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.entries.clear()
+            self.slow_queries.clear()
+
+
+class Hospital:
+    def __init__(self, db_path='hospital.db', explain=False, pool_size=4, cache_size=1024, cache_ttl=30.0,
+                 archive_path=None, profile=True, slow_query_ms=100.0, trace=False):
+        # Timings of every statement run through execute_query, fetch_query
+        # and the streaming and archive queries; see query_stats()
+        self.stats = QueryStats(slow_query_ms, trace=trace) if profile else None
+
+        # Connect to SQLite database (or create it if it doesn't exist).
+        # self.conn is the only connection that writes; the thread that
+        # creates the Hospital also reads through it, so it always sees its
+        # own writes. Other threads read from the pool.
+        self.db_path = db_path
+        self.conn = connect(db_path, self.stats)
+        self.cursor = self.conn.cursor()
+        self.lock = threading.RLock()
+        self.owner_thread = threading.get_ident()
+        self.pool = ConnectionPool(db_path, pool_size, self.stats) if db_path != ':memory:' else None
+        self.write_queue = None
+
+        # Group commit is off by default; see enable_group_commit()
+        self.group_commit = None
+        self.uncommitted = 0
+        self.uncommitted_tables = set()
+        self.commit_timer = None
+
+        # Hot lookups (patient by id, staff listing, a patient's
+        # appointments); see cached(). data_version tells when another
+        # connection, e.g. another process, has written.
+        self.cache = QueryCache(cache_size, cache_ttl)
+        self.data_version = None
+
+        # The archive database is attached the first time it is needed
+        if archive_path is None:
+            archive_path = ':memory:' if db_path == ':memory:' else os.path.splitext(db_path)[0] + '-archive.db'
+        self.archive_path = archive_path
+        self.archive_attached = False
+
+        # In explain mode every distinct statement is run through
+        # EXPLAIN QUERY PLAN once and full table scans are logged
+        self.explain_enabled = explain
+        self.query_plans = {}
+
+        # Bring the schema up to date; on a current database this is a
+        # single PRAGMA read and no DDL runs at all
+        self.migrate()
+        self.restore_triggers()
+
+        # Appointment booking and free-slot lookups
+        self.scheduler = Scheduler(self)
+
+    # Method to apply any pending migrations, one transaction per version,
+    # to the main database or an attached one
+    def migrate(self, schema='main', migrations=MIGRATIONS):
+        version = self.cursor.execute(f'PRAGMA {schema}.user_version').fetchone()[0]
+        if version >= len(migrations):
+            return version
+
+        for number in range(version + 1, len(migrations) + 1):
+            self.cursor.execute('BEGIN')
+            try:
+                for step in migrations[number - 1]:
+                    if callable(step):
+                        step(self.cursor)
+                    else:
+                        self.cursor.execute(step)
+                # PRAGMA does not accept bound parameters
+                self.cursor.execute(f'PRAGMA {schema}.user_version = {number:d}')
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return len(migrations)
+
+    # Method to execute INSERT, UPDATE, DELETE queries. Safe to call from
+    # any thread; returns the row id of the last inserted row. Cached
+    # results read from the table written to are dropped.
     def execute_query(self, query, parameters=()):
-        self.cursor.execute(query, parameters)
-        self.conn.commit()
+        with self.lock:
+            if self.explain_enabled:
+                self.explain(query, parameters)
+            if self.stats is None:
+                self.cursor.execute(query, parameters)
+            else:
+                started = self.stats.begin()
+                self.cursor.execute(query, parameters)
+                self.stats.record(query, started, max(self.cursor.rowcount, 0))
+            self.finish_write(written_table(query))
+            return self.cursor.lastrowid
+
+    # Commit the current write now, or leave it to group commit when that is
+    # enabled, and invalidate the cached results of the tables written.
+    # Callers hold self.lock.
+    def finish_write(self, *tables):
+        # Dropped now for this connection, which sees its own uncommitted
+        # writes, and again once committed for readers on the pool, which
+        # may have cached the old rows in between
+        for table in tables:
+            if table is not None:
+                self.cache.invalidate(table)
+                self.uncommitted_tables.add(table)
+        if self.group_commit is None:
+            self.conn.commit()
+            self.invalidate_committed()
+        else:
+            self.buffer_commit()
+
+    def invalidate_committed(self):
+        for table in self.uncommitted_tables:
+            self.cache.invalidate(table)
+        self.uncommitted_tables.clear()
+
+    # Method to run several statements as one unit. Inside a transaction
+    # left open by group commit they run under a savepoint, so an error
+    # undoes only them and never the writes buffered for other callers,
+    # who already have their row ids. Otherwise they get a transaction of
+    # their own. Callers hold self.lock and call finish_write afterwards.
+    @contextlib.contextmanager
+    def savepoint(self):
+        if not self.conn.in_transaction:
+            self.cursor.execute('BEGIN')
+            try:
+                yield
+            except BaseException:
+                self.conn.rollback()
+                raise
+            return
+        self.cursor.execute('SAVEPOINT unit')
+        try:
+            yield
+        except BaseException:
+            self.cursor.execute('ROLLBACK TO unit')
+            self.cursor.execute('RELEASE unit')
+            raise
+        self.cursor.execute('RELEASE unit')
+
+    # Method to turn on group commit: writes are left in an open transaction
+    # and committed together once max_statements have been buffered or
+    # max_delay seconds have passed since the first one. Other connections
+    # do not see buffered writes until they are committed; call flush()
+    # wherever a write must be durable before carrying on.
+    def enable_group_commit(self, max_statements=500, max_delay=0.005):
+        with self.lock:
+            self.group_commit = (max_statements, max_delay)
+
+    def disable_group_commit(self):
+        with self.lock:
+            self.flush()
+            self.group_commit = None
+
+    def buffer_commit(self):
+        max_statements, max_delay = self.group_commit
+        self.uncommitted += 1
+        if self.uncommitted >= max_statements:
+            self.flush()
+        elif self.commit_timer is None:
+            self.commit_timer = threading.Timer(max_delay, self.flush)
+            self.commit_timer.daemon = True
+            self.commit_timer.start()
+
+    # Method to commit any buffered writes now (a durability barrier)
+    def flush(self):
+        with self.lock:
+            if self.commit_timer is not None:
+                self.commit_timer.cancel()
+                self.commit_timer = None
+            self.uncommitted = 0
+            if self.conn.in_transaction:
+                self.conn.commit()
+            self.invalidate_committed()
+
+    # Method to queue a write for the background writer thread, for callers
+    # that should not wait on the database. Returns a Future.
+    def submit_write(self, query, parameters=()):
+        with self.lock:
+            if self.write_queue is None:
+                self.write_queue = WriteQueue(self)
+        return self.write_queue.submit(query, parameters)
 
     # Method to fetch records from the database
     def fetch_query(self, query, parameters=()):
-        self.cursor.execute(query, parameters)
-        return self.cursor.fetchall()
+        if self.explain_enabled:
+            with self.lock:
+                self.explain(query, parameters)
+        if self.stats is not None:
+            started = self.stats.begin()
+        if self.pool is None or threading.get_ident() == self.owner_thread:
+            with self.lock:
+                self.cursor.execute(query, parameters)
+                rows = self.cursor.fetchall()
+        else:
+            with self.pool.connection() as conn:
+                rows = conn.execute(query, parameters).fetchall()
+        if self.stats is not None:
+            self.stats.record(query, started, len(rows))
+        return rows
+
+    # Method to stream the result of a query in batches of batch_size rows
+    # with fetchmany, so memory stays flat however many rows there are.
+    # Returns (column names, generator of batches); see ROW_SHAPES for what a
+    # batch looks like. The query runs on a connection of its own, held
+    # until the generator is exhausted or closed; buffered group-commit
+    # writes are flushed first so the stream sees everything written so far.
+    def stream_query(self, query, parameters=(), batch_size=5000, shape='tuple'):
+        if shape not in ROW_SHAPES:
+            raise ValueError(f"Unknown row shape: {shape}")
+        if self.explain_enabled:
+            with self.lock:
+                self.explain(query, parameters)
+        self.flush()
+        batches = self.fetch_batches(query, parameters, batch_size)
+        # The generator runs the query and yields the column names first
+        columns = next(batches)
+        if shape == 'tuple':
+            return columns, batches
+        return columns, convert_batches(batches, ROW_SHAPES[shape](columns))
+
+    # Method to iterate over the rows of a query one at a time while they
+    # are fetched chunk_size at a time. shape is 'tuple' or 'record'.
+    #
+    #     for patient in hospital.iter_query('SELECT * FROM patients', shape='record'):
+    #         print(patient.id, patient.name)
+    def iter_query(self, query, parameters=(), chunk_size=1000, shape='tuple'):
+        if shape == 'columns':
+            raise ValueError("Columnar batches have no single rows; use stream_query")
+        columns, batches = self.stream_query(query, parameters, chunk_size, shape)
+        return each_row(batches)
+
+    # Generator behind stream_query. A stream is recorded in the query
+    # stats once it ends, with the time spent in SQLite - not in the
+    # consumer - and the number of rows read.
+    def fetch_batches(self, query, parameters, batch_size):
+        elapsed = 0.0
+        count = 0
+        if self.pool is None:
+            # An in-memory database has only the one connection
+            with self.lock:
+                started = time.perf_counter()
+                cursor = self.conn.execute(query, parameters)
+                elapsed += time.perf_counter() - started
+            try:
+                yield [column[0] for column in cursor.description]
+                while True:
+                    with self.lock:
+                        started = time.perf_counter()
+                        rows = cursor.fetchmany(batch_size)
+                        elapsed += time.perf_counter() - started
+                    if not rows:
+                        return
+                    count += len(rows)
+                    yield rows
+            finally:
+                cursor.close()
+                if self.stats is not None:
+                    self.stats.record(query, time.perf_counter() - elapsed, count)
+
+        conn = self.pool.acquire(timeout=30)
+        try:
+            started = time.perf_counter()
+            cursor = conn.execute(query, parameters)
+            elapsed += time.perf_counter() - started
+            try:
+                yield [column[0] for column in cursor.description]
+                while True:
+                    started = time.perf_counter()
+                    rows = cursor.fetchmany(batch_size)
+                    elapsed += time.perf_counter() - started
+                    if not rows:
+                        break
+                    count += len(rows)
+                    yield rows
+            finally:
+                # Ends the statement, and with it the read snapshot
+                cursor.close()
+                if self.stats is not None:
+                    self.stats.record(query, time.perf_counter() - elapsed, count)
+        finally:
+            self.pool.release(conn)
+
+    # Method to stream one of EXPORT_SOURCES, optionally limited to a date
+    # range (inclusive, 'YYYY-MM-DD') and a doctor. Returns (column names,
+    # generator of batches) like stream_query.
+    def export_rows(self, source, date_from=None, date_to=None, doctor_id=None, batch_size=5000, shape='tuple'):
+        query, parameters = export_query(source, date_from, date_to, doctor_id)
+        return self.stream_query(query, parameters, batch_size, shape)
+
+    # Method to copy the database to path (default <db>-snapshot.db) with
+    # SQLite's online backup API, for reports to read from (see ReportPool).
+    # The whole copy is one step inside a single read transaction on a
+    # connection of its own, so it is consistent and, in WAL mode, never
+    # holds up writers. It is written under a temporary name and renamed
+    # into place, so processes still reading an older snapshot keep theirs.
+    def snapshot(self, path=None):
+        if path is None:
+            if self.db_path == ':memory:':
+                raise ValueError("An in-memory database needs a snapshot path")
+            path = os.path.splitext(self.db_path)[0] + '-snapshot.db'
+        # Buffered group-commit writes belong in the snapshot
+        self.flush()
+        temp_path = path + '.tmp'
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        target = sqlite3.connect(temp_path)
+        try:
+            if self.pool is None:
+                with self.lock:
+                    self.conn.backup(target)
+            else:
+                with self.pool.connection() as conn:
+                    conn.backup(target)
+            # The copy is read by itself, without a -wal file next to it
+            target.execute('PRAGMA journal_mode = DELETE')
+            target.close()
+        except BaseException:
+            target.close()
+            os.remove(temp_path)
+            raise
+        os.replace(temp_path, path)
+        return path
+
+    # Method to run EXPLAIN QUERY PLAN for a statement and flag full table
+    # scans. Plans are cached per SQL text, so each statement is explained once.
+    def explain(self, query, parameters=()):
+        if query in self.query_plans:
+            return self.query_plans[query]
 
-    # Method to add a new patient
+        try:
+            plan = [row[3] for row in self.conn.execute('EXPLAIN QUERY PLAN ' + query, parameters)]
+        except sqlite3.Error:
+            # PRAGMA, BEGIN and similar statements have no query plan
+            plan = []
+        # Named subqueries and CTEs show up as "MATERIALIZE e" or
+        # "CO-ROUTINE e" before they are scanned
+        subqueries = {step.split(' ', 1)[1] for step in plan if step.startswith(('MATERIALIZE ', 'CO-ROUTINE '))}
+        scans = [step for step in plan if is_full_scan(step, subqueries)]
+        self.query_plans[query] = (plan, scans)
+
+        for step in scans:
+            logger.warning("Full table scan (%s) in query: %s", step, " ".join(query.split()))
+        return plan, scans
+
+    # Method to list every explained statement that performed a full scan
+    def full_scan_report(self):
+        return {query: scans for query, (plan, scans) in self.query_plans.items() if scans}
+
+    # Method to fetch one page of appointments using keyset pagination on id.
+    # Pass after_id to page forwards or before_id to page backwards; rows are
+    # always returned in ascending id order as (id, patient_id, date, time,
+    # details, doctor_id), with '' for appointments booked without a doctor.
+    def fetch_appointments_page(self, after_id=None, before_id=None, limit=100):
+        columns = "id, patient_id, date, time, details, COALESCE(doctor_id, '')"
+        if before_id is not None:
+            rows = self.fetch_query(
+                f'SELECT {columns} FROM appointments WHERE id < ? ORDER BY id DESC LIMIT ?',
+                (before_id, limit)
+            )
+            rows.reverse()
+            return rows
+        if after_id is None:
+            after_id = 0
+        return self.fetch_query(
+            f'SELECT {columns} FROM appointments WHERE id > ? ORDER BY id LIMIT ?',
+            (after_id, limit)
+        )
+
+    # Method to fetch the appointments starting on date_from through
+    # date_to (inclusive; dates or date strings), optionally only one
+    # doctor's, in time order as (id, patient_id, date, time, details,
+    # doctor_id, start_ts) rows. after is the (start_ts, id) of the last row
+    # of the previous page. Either way this is one range scan, of
+    # idx_appointments_start_ts or idx_appointments_doctor_start.
+    def fetch_appointments_between(self, date_from, date_to=None, doctor_id=None, after=None, limit=100):
+        date_from = parse_date(date_from)
+        date_to = parse_date(date_to) if date_to is not None else date_from
+        conditions = ['start_ts >= :start', 'start_ts < :end']
+        parameters = {'start': midnight(date_from), 'end': midnight(date_to + datetime.timedelta(days=1)),
+                      'limit': limit}
+        if doctor_id is not None:
+            conditions.append('doctor_id = :doctor')
+            parameters['doctor'] = doctor_id
+        if after is not None:
+            conditions.append('(start_ts, id) > (:after_ts, :after_id)')
+            parameters['after_ts'], parameters['after_id'] = after
+        return self.fetch_query(
+            "SELECT id, patient_id, date, time, details, COALESCE(doctor_id, ''), start_ts FROM appointments "
+            f"WHERE {' AND '.join(conditions)} ORDER BY start_ts, id LIMIT :limit",
+            parameters
+        )
+
+    # Generator over every staff member, one page at a time. The listing
+    # is cached (see cached_pages), so revisiting the staff screen does not
+    # read the table again until it changes.
+    def iter_staff_pages(self, page_size=500):
+        return self.cached_pages(('staff',), ('staff',), 'SELECT * FROM staff ORDER BY id', page_size)
+
+    # Method to look key up in the cache, or call load() and cache what it
+    # returns (which should be immutable) against the tables it reads
+    def cached(self, key, tables, load):
+        found, value = self.cache_lookup(key)
+        if found:
+            return value
+        generation = self.cache.generation(tables)
+        value = load()
+        self.cache.put(key, tables, value, generation)
+        return value
+
+    def cache_lookup(self, key):
+        # Anything cached may be stale once another connection has written
+        with self.lock:
+            version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            if version != self.data_version:
+                if self.data_version is not None:
+                    self.cache.clear()
+                self.data_version = version
+        return self.cache.get(key)
+
+    # Generator over the rows of query in pages of page_size, served from
+    # the cache when it holds the whole listing. Otherwise the query is
+    # streamed and, if it was read to the end and has at most
+    # CACHE_MAX_ROWS rows, cached for next time.
+    def cached_pages(self, key, tables, query, page_size):
+        found, rows = self.cache_lookup(key)
+        if found:
+            return (list(rows[start:start + page_size]) for start in range(0, len(rows), page_size))
+        generation = self.cache.generation(tables)
+        columns, pages = self.stream_query(query, batch_size=page_size)
+        return self.collect_pages(key, tables, generation, pages)
+
+    def collect_pages(self, key, tables, generation, pages):
+        rows = []
+        try:
+            for page in pages:
+                if rows is not None:
+                    rows.extend(page)
+                    if len(rows) > CACHE_MAX_ROWS:
+                        rows = None
+                yield page
+        finally:
+            pages.close()
+        if rows is not None:
+            self.cache.put(key, tables, tuple(rows), generation)
+
+    # Method to report the cache's size and hit, miss and eviction counts
+    def cache_stats(self):
+        return self.cache.stats()
+
+    # Method to report where database time goes: per normalised statement,
+    # the calls, total/mean/percentile/max latency in milliseconds, rows and
+    # a latency histogram, slowest total first (limit of them), plus the
+    # most recent queries slower than slow_query_ms
+    def query_stats(self, limit=None):
+        if self.stats is None:
+            return {'slow_query_ms': None, 'statements': [], 'slow_queries': []}
+        return self.stats.report(limit)
+
+    # Method to read the dashboard for a day (default today) from the
+    # counters kept by the triggers of migration 9: a few primary key
+    # lookups, however large the tables. Returns {'day', 'appointments',
+    # 'patients_in_care', 'staff': {specialization: count},
+    # 'doctors_working': {specialization: count}}, doctors working being
+    # those with appointments that day. This stands in for staff on shift:
+    # staff.schedule is free text ("Mon-Fri", "Shifts", often empty) that
+    # says nothing reliable about a given day.
+    def dashboard(self, day=None):
+        day = (parse_date(day) if day is not None else datetime.date.today()).isoformat()
+        rows = self.fetch_query('''
+            SELECT name, key, value FROM counters WHERE name = 'patients' AND key = 'in_care'
+            UNION ALL
+            SELECT name, key, value FROM counters WHERE name = 'appointments' AND key = :day
+            UNION ALL
+            SELECT name, key, value FROM counters WHERE name = 'staff'
+            UNION ALL
+            SELECT name, substr(key, 12), value FROM counters
+            WHERE name = 'doctors_working' AND key > :day || ' ' AND key < :day || '!'
+        ''', {'day': day})
+        dashboard = {'day': day, 'appointments': 0, 'patients_in_care': 0, 'staff': {}, 'doctors_working': {}}
+        for name, key, value in rows:
+            if name == 'patients':
+                dashboard['patients_in_care'] = value
+            elif name == 'appointments':
+                dashboard['appointments'] = value
+            else:
+                dashboard[name][key] = value
+        return dashboard
+
+    # Method to recount the dashboard counters from the tables, should they
+    # ever be changed with the counter triggers dropped
+    def rebuild_counters(self):
+        with self.lock:
+            self.flush()
+            try:
+                self.cursor.execute('BEGIN')
+                for query in COUNTER_REBUILD:
+                    self.cursor.execute(query)
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+
+    # Method to search patients by name, problem or mobile number
+    def search_patients(self, text, limit=SEARCH_LIMIT):
+        return self.search('patients', text, limit)
+
+    # Method to search staff by name, specialization or languages spoken
+    def search_staff(self, text, limit=SEARCH_LIMIT):
+        return self.search('staff', text, limit)
+
+    # Method to run a full-text search over one table. Every word is matched
+    # as a prefix; results come back in id order, which keeps even one-letter
+    # searches over a million rows at a few milliseconds (ranking would have
+    # to score every match). When fewer than limit rows match, misspelt words
+    # are retried together with the indexed words closest to them.
+    def search(self, table, text, limit=SEARCH_LIMIT):
+        if table not in SEARCH_INDEXES:
+            raise ValueError(f"Cannot search unknown table: {table}")
+        words = search_words(text)
+        if not words:
+            return []
+
+        # Discharged patients are left to search_archive()
+        active = ' AND t.discharged_ts IS NULL' if table == 'patients' else ''
+        query = (f'SELECT t.* FROM {table}_fts f JOIN {table} t ON t.id = f.rowid '
+                 f'WHERE {table}_fts MATCH ?{active} LIMIT ?')
+        rows = self.fetch_query(query, (match_query([[word + '*'] for word in words]), limit))
+        if len(rows) < limit:
+            groups = [[word + '*'] + self.similar_terms(table, word) for word in words]
+            if any(len(group) > 1 for group in groups):
+                found = {row[0] for row in rows}
+                for row in self.fetch_query(query, (match_query(groups), limit + len(rows))):
+                    if row[0] not in found and len(rows) < limit:
+                        rows.append(row)
+        return rows
+
+    # Method to find indexed words within one typo of word (two for longer
+    # words), closest first. Only words sharing its first two letters are
+    # compared, which keeps the vocabulary scan to a sliver of the index.
+    def similar_terms(self, table, word):
+        word = ''.join(char for char in unicodedata.normalize('NFKD', word) if not unicodedata.combining(char))
+        if len(word) < 3 or not word.isalpha():
+            return []
+        limit = 1 if len(word) < 6 else 2
+        end = word[0] + chr(ord(word[1]) + 1)
+        terms = self.fetch_query(f'SELECT term FROM {table}_terms WHERE term >= ? AND term < ?', (word[:2], end))
+        scored = sorted((edit_distance(word, term, limit), term) for term, in terms)
+        return [term for distance, term in scored if 0 < distance <= limit]
+
+    # Method to load a stream of rows into a table. Rows are dicts keyed by
+    # column name, or - faster - sequences laid out as `columns` (e.g. a CSV
+    # header). They are validated and inserted batch_size at a time with
+    # executemany, one transaction per batch, instead of one commit per row.
+    # The first `skip` rows are passed over so an interrupted import can
+    # resume; after each committed batch on_batch(rows_done, inserted,
+    # rejected) is called with running totals. Invalid rows are skipped and
+    # returned as (row_number, message) pairs.
+    #
+    # Counting rows for the dashboard and indexing them for search one
+    # trigger call at a time is several times slower than the insert
+    # itself, so the table's counter trigger and - unless the rows bring
+    # their own ids into a table that already has rows - its search trigger
+    # are suspended for the whole import. Once it ends the counters are
+    # recounted and the new rows (all ids above the previous maximum, or
+    # the whole table if it was empty) are indexed in one statement.
+    def bulk_import(self, table, rows, columns=None, batch_size=50000, skip=0, on_batch=None):
+        if table not in IMPORT_COLUMNS:
+            raise ValueError(f"Cannot import into unknown table: {table}")
+
+        rows = iter(rows)
+        for _ in range(skip):
+            if next(rows, None) is None:
+                break
+
+        first = next(rows, None)
+        if first is None:
+            return 0, []
+        source_columns = list(columns) if columns is not None else list(first)
+        columns = [column for column in IMPORT_COLUMNS[table] if column in source_columns]
+        missing = [column for column in IMPORT_REQUIRED[table] if column not in columns]
+        if missing:
+            raise ValueError(f"Missing required columns for {table}: {', '.join(missing)}")
+        required = operator.itemgetter(*[columns.index(column) for column in IMPORT_REQUIRED[table]])
+
+        # Pull the wanted fields out of each row in table column order
+        if isinstance(first, dict):
+            def extract(row):
+                return tuple(map(row.get, columns))
+        else:
+            positions = [source_columns.index(column) for column in columns]
+            if len(positions) == 1:
+                def extract(row):
+                    return (row[positions[0]],)
+            else:
+                extract = operator.itemgetter(*positions)
+
+        insert_columns, convert = columns, None
+        if table in IMPORT_CONVERSIONS:
+            insert_columns, convert = IMPORT_CONVERSIONS[table](columns, self.scheduler.slot)
+        query = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            table, ', '.join(insert_columns), ', '.join('?' * len(insert_columns)))
+        rows = itertools.chain([first], rows)
+        row_number = skip
+        inserted = 0
+        rejected = []
+
+        with self.lock:
+            self.flush()
+            last_id = self.cursor.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0]
+            triggers = [f'{table}_counters_insert']
+            if table in SEARCH_INDEXES and ('id' not in columns or last_id is None):
+                triggers.append(f'{table}_search_insert')
+            suspended = self.suspend_triggers(triggers)
+        try:
+            for chunk in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+                batch = []
+                row_numbers = []
+                for row in chunk:
+                    row_number += 1
+                    values = extract(row)
+                    needed = required(values)
+                    if None in needed or '' in needed:
+                        rejected.append((row_number, "missing required value"))
+                        continue
+                    if convert is not None:
+                        try:
+                            values = convert(values)
+                        except ValueError as e:
+                            rejected.append((row_number, str(e)))
+                            continue
+                    batch.append(values)
+                    row_numbers.append(row_number)
+
+                if batch:
+                    with self.lock:
+                        self.flush()
+                        with self.savepoint():
+                            batch = self.insert_rows(query, batch, row_numbers, rejected)
+                        self.conn.commit()
+                        self.cache.invalidate(table)
+                inserted += len(batch)
+                if on_batch:
+                    on_batch(row_number, inserted, len(rejected))
+        finally:
+            with self.lock:
+                self.resume_triggers(table, suspended, last_id)
+        if table == 'appointments':
+            self.scheduler.forget()
+        # Rows breaking a constraint are found after the rest of their batch
+        rejected.sort()
+        return inserted, rejected
+
+    # Method to insert a batch with executemany or, should a row break a
+    # constraint (such as an appointment overlapping another of the
+    # doctor's), row by row, adding the rows that fail to rejected as
+    # (row_number, message). Returns the rows inserted.
+    def insert_rows(self, query, batch, row_numbers, rejected):
+        try:
+            with self.savepoint():
+                self.cursor.executemany(query, batch)
+            return batch
+        except sqlite3.IntegrityError:
+            pass
+        inserted = []
+        for row_number, values in zip(row_numbers, batch):
+            try:
+                self.cursor.execute(query, values)
+            except sqlite3.IntegrityError as e:
+                rejected.append((row_number, str(e)))
+                continue
+            inserted.append(values)
+        return inserted
+
+    # Method to drop triggers for the length of a bulk import. Their SQL is
+    # kept in suspended_triggers, so they are put back even if the import
+    # never finishes (see restore_triggers). Returns the triggers this call
+    # dropped; any others were left suspended by an earlier import.
+    def suspend_triggers(self, triggers):
+        suspended = []
+        with self.savepoint():
+            for trigger in triggers:
+                row = self.cursor.execute(
+                    "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (trigger,)
+                ).fetchone()
+                if row is None:
+                    continue
+                self.cursor.execute('INSERT INTO suspended_triggers (name, sql) VALUES (?, ?)', (trigger, row[0]))
+                self.cursor.execute(f'DROP TRIGGER {trigger}')
+                suspended.append(trigger)
+        self.conn.commit()
+        return suspended
+
+    # Method to put back the triggers a bulk import of table suspended and
+    # catch up on what they missed: recount the counters and index the rows
+    # added since last_id for search. The table is reindexed in full if it
+    # was empty (last_id is None) or should the triggers have been put back
+    # by someone else in the meantime.
+    def resume_triggers(self, table, suspended, last_id):
+        self.flush()
+        with self.savepoint():
+            restored = self.cursor.execute(
+                'SELECT name, sql FROM suspended_triggers WHERE name IN (SELECT value FROM json_each(?))',
+                (json.dumps(suspended),)
+            ).fetchall()
+            for trigger, trigger_sql in restored:
+                self.cursor.execute(trigger_sql)
+                self.cursor.execute('DELETE FROM suspended_triggers WHERE name = ?', (trigger,))
+            for query in COUNTER_REBUILD:
+                self.cursor.execute(query)
+            if f'{table}_search_insert' in suspended:
+                if len(restored) == len(suspended) and last_id is not None:
+                    columns = ', '.join(SEARCH_INDEXES[table])
+                    self.cursor.execute(
+                        f'INSERT INTO {table}_fts (rowid, {columns}) SELECT id, {columns} FROM {table} WHERE id > ?',
+                        (last_id,)
+                    )
+                else:
+                    self.cursor.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+        self.finish_write('counters')
+
+    # Method to put back triggers left suspended by a bulk import that never
+    # finished, recounting the counters and rebuilding the search indexes
+    # they would have kept up to date
+    def restore_triggers(self):
+        with self.lock:
+            restored = self.cursor.execute('SELECT name, sql FROM suspended_triggers').fetchall()
+            if not restored:
+                return
+            logger.warning("Restoring triggers left suspended by an unfinished import: %s",
+                           ', '.join(trigger for trigger, _ in restored))
+            with self.savepoint():
+                for trigger, trigger_sql in restored:
+                    self.cursor.execute(trigger_sql)
+                self.cursor.execute('DELETE FROM suspended_triggers')
+                for query in COUNTER_REBUILD:
+                    self.cursor.execute(query)
+                triggers = {trigger for trigger, _ in restored}
+                for table in SEARCH_INDEXES:
+                    if f'{table}_search_insert' in triggers:
+                        self.cursor.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+            self.finish_write('counters')
+
+    # Method to add a new patient; returns the patient ID. Raises
+    # ValueError if the date of birth cannot be read or is implausible.
     def add_patient(self, name, dob, gender, problem, mobile_no):
-        self.execute_query('''
-            INSERT INTO patients (name, dob, gender, problem, mobile_no) 
-            VALUES (?, ?, ?, ?, ?)
-        ''', (name, dob, gender, problem, mobile_no))
+        dob, dob_ordinal = normalize_dob(dob)
+        return self.execute_query('''
+            INSERT INTO patients (name, dob, gender, problem, mobile_no, dob_ordinal) 
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (name, dob, gender, problem, mobile_no, dob_ordinal))
 
-    # Method to add a new staff member
+    # Method to add a new staff member; returns the staff ID
     def add_staff(self, name, age, gender, specialization, languages_spoken, mobile_no, email, schedule):
-        self.execute_query('''
+        return self.execute_query('''
             INSERT INTO staff (name, age, gender, specialization, languages_spoken, mobile_no, email, schedule) 
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (name, age, gender, specialization, languages_spoken, mobile_no, email, schedule))
 
-    # Method to add a new appointment
+    # Method to add a new appointment without a doctor; returns the
+    # appointment ID. Raises ValueError if the date or time cannot be read.
     def add_appointment(self, patient_id, date, time, details):
-        self.execute_query('''
-            INSERT INTO appointments (patient_id, date, time, details) 
-            VALUES (?, ?, ?, ?)
-        ''', (patient_id, date, time, details))
+        date, time, start_ts = normalize_appointment_time(date, time)
+        return self.execute_query('''
+            INSERT INTO appointments (patient_id, date, time, details, start_ts) 
+            VALUES (?, ?, ?, ?, ?)
+        ''', (patient_id, date, time, details, start_ts))
+
+    # Method to fetch one patient's record, or None if there is no such
+    # patient or they have been discharged (see fetch_patient_history).
+    # Cached, as the front desk looks up the same patients often.
+    def fetch_patient(self, patient_id):
+        def load():
+            rows = self.fetch_query('SELECT * FROM patients WHERE id = ? AND discharged_ts IS NULL', (patient_id,))
+            return rows[0] if rows else None
+        return self.cached(('patient', patient_id), ('patients',), load)
+
+    # Method to fetch a patient's appointments in time order as (id, date,
+    # time, details, doctor_id) rows. Cached; discharging the patient
+    # deletes them too, so the entry depends on both tables.
+    def fetch_patient_appointments(self, patient_id):
+        return self.cached(('patient_appointments', patient_id), ('appointments', 'patients'), lambda: tuple(
+            self.fetch_query(
+                "SELECT id, date, time, details, COALESCE(doctor_id, '') FROM appointments "
+                "WHERE patient_id = ? ORDER BY date, time, id",
+                (patient_id,)
+            )
+        ))
+
+    # Method to discharge a patient; returns False if there is no such
+    # patient in care. The record is only marked (archive() moves it out
+    # later), but upcoming appointments are cancelled now to free the
+    # doctors' time. Marking the patient and taking their appointments out
+    # is one transaction, under the scheduler's lock so nothing is booked
+    # in between; only the archive copies of the appointments are committed
+    # ahead of it (see move_to_archive).
+    def discharge_patient(self, patient_id, discharged=None):
+        discharged = discharged or datetime.datetime.now()
+        with self.scheduler.lock, self.lock:
+            if not self.cursor.execute(
+                'SELECT 1 FROM patients WHERE id = ? AND discharged_ts IS NULL', (patient_id,)
+            ).fetchone():
+                return False
+            upcoming = self.cursor.execute(
+                'SELECT id, doctor_id, start_ts FROM appointments '
+                f'WHERE patient_id = :patient AND NOT {APPOINTMENT_PAST}',
+                dict(past_moments(discharged), patient=patient_id)
+            ).fetchall()
+            appointment_ids = [appointment_id for appointment_id, _, _ in upcoming]
+            if appointment_ids:
+                self.copy_to_archive('appointments', appointment_ids, "'cancelled', :archived",
+                                     {'archived': timestamp(datetime.datetime.now())})
+            with self.savepoint():
+                self.cursor.execute('UPDATE patients SET discharged_ts = ? WHERE id = ?',
+                                    (timestamp(discharged), patient_id))
+                if appointment_ids:
+                    self.delete_archived('appointments', appointment_ids)
+            self.finish_write('patients', 'appointments')
+            self.scheduler.discard(upcoming)
+        return True
+
+    # Method to open a bill for a patient. items are (description, quantity,
+    # unit amount in minor units); the bill stays open until invoiced.
+    def create_bill(self, patient_id, items, created=None):
+        items = [(description, int(quantity), int(unit_amount)) for description, quantity, unit_amount in items]
+        if not items:
+            raise ValueError("A bill needs at least one item.")
+        created_ts = timestamp(created or datetime.datetime.now())
+
+        with self.lock:
+            if not self.conn.execute('SELECT 1 FROM patients WHERE id = ?', (patient_id,)).fetchone():
+                raise ValueError("Patient ID does not exist.")
+            with self.savepoint():
+                self.cursor.execute('INSERT INTO bills (patient_id, created_ts) VALUES (?, ?)', (patient_id, created_ts))
+                bill_id = self.cursor.lastrowid
+                self.cursor.executemany(
+                    'INSERT INTO bill_items (bill_id, description, quantity, unit_amount) VALUES (?, ?, ?, ?)',
+                    [(bill_id,) + item for item in items]
+                )
+            self.finish_write()
+        return bill_id
+
+    # Method to invoice open bills: fix each bill's subtotal, taxes and total.
+    # With no bill_ids every open bill is invoiced, which is what the nightly
+    # run does. The whole batch is a handful of set-based statements in one
+    # transaction - subtotals are summed per bill into a temporary table,
+    # every applicable tax rate is applied to every bill in one INSERT ...
+    # SELECT, and the totals are written back with one UPDATE - so
+    # the cost per bill is a few index operations rather than a round trip
+    # through Python. Each tax is rounded half up to a whole minor unit.
+    # Returns the number of bills invoiced.
+    def invoice_bills(self, bill_ids=None, invoiced_at=None):
+        invoiced_ts = timestamp(invoiced_at or datetime.datetime.now())
+        if bill_ids is None:
+            selection, parameters = "b.status = 'open'", ()
+        else:
+            selection = "b.status = 'open' AND b.id IN (SELECT value FROM json_each(?))"
+            parameters = (json.dumps(list(bill_ids)),)
+
+        with self.lock:
+            with self.savepoint():
+                self.cursor.execute(
+                    'CREATE TEMP TABLE billing_run (bill_id INTEGER PRIMARY KEY, created_ts INTEGER, '
+                    'subtotal INTEGER, tax INTEGER)'
+                )
+                self.cursor.execute(f'''
+                    INSERT INTO billing_run (bill_id, created_ts, subtotal)
+                    SELECT b.id, b.created_ts, COALESCE(SUM(i.quantity * i.unit_amount), 0)
+                    FROM bills b LEFT JOIN bill_items i ON i.bill_id = b.id
+                    WHERE {selection}
+                    GROUP BY b.id
+                ''', parameters)
+                self.cursor.execute('''
+                    INSERT INTO bill_taxes (bill_id, code, rate_bp, amount)
+                    SELECT r.bill_id, t.code, t.rate_bp, (r.subtotal * t.rate_bp + 5000) / 10000
+                    FROM billing_run r JOIN tax_rates t
+                        ON t.valid_from <= r.created_ts AND (t.valid_to IS NULL OR t.valid_to > r.created_ts)
+                ''')
+                self.cursor.execute('''
+                    UPDATE billing_run SET tax = COALESCE(
+                        (SELECT SUM(amount) FROM bill_taxes WHERE bill_id = billing_run.bill_id), 0)
+                ''')
+                # Driven from billing_run so invoicing one bill never
+                # touches the rest of the table (UPDATE ... FROM would scan bills)
+                self.cursor.execute('''
+                    UPDATE bills SET (status, invoiced_ts, subtotal, tax, total) = (
+                        SELECT 'invoiced', ?, r.subtotal, r.tax, r.subtotal + r.tax
+                        FROM billing_run r WHERE r.bill_id = bills.id)
+                    WHERE id IN (SELECT bill_id FROM billing_run)
+                ''', (invoiced_ts,))
+                invoiced = self.cursor.rowcount
+                self.cursor.execute('DROP TABLE temp.billing_run')
+            self.finish_write()
+        return invoiced
+
+    # Method to fetch a bill with its items and taxes
+    def fetch_bill(self, bill_id):
+        bills = self.fetch_query('SELECT * FROM bills WHERE id = ?', (bill_id,))
+        if not bills:
+            return None
+        items = self.fetch_query(
+            'SELECT description, quantity, unit_amount FROM bill_items WHERE bill_id = ? ORDER BY id', (bill_id,)
+        )
+        taxes = self.fetch_query(
+            'SELECT code, rate_bp, amount FROM bill_taxes WHERE bill_id = ? ORDER BY code', (bill_id,)
+        )
+        return bills[0], items, taxes
+
+    # Method to list the tax rates in force at a moment (default now) as
+    # (code, rate in basis points) pairs
+    def tax_rates(self, at=None):
+        moment = timestamp(at or datetime.datetime.now())
+        return self.fetch_query(
+            'SELECT code, rate_bp FROM tax_rates WHERE valid_from <= ? AND (valid_to IS NULL OR valid_to > ?) '
+            'ORDER BY code',
+            (moment, moment)
+        )
+
+    # Method to change a tax rate from a moment on (default now); bills
+    # created before then keep the old rate. A rate of None stops charging
+    # the tax.
+    def set_tax_rate(self, code, rate_bp, valid_from=None):
+        start = timestamp(valid_from or datetime.datetime.now())
+        with self.lock:
+            with self.savepoint():
+                self.cursor.execute(
+                    'UPDATE tax_rates SET valid_to = ? WHERE code = ? AND valid_from <= ? '
+                    'AND (valid_to IS NULL OR valid_to > ?)',
+                    (start, code, start, start)
+                )
+                if rate_bp is not None:
+                    self.cursor.execute(
+                        'INSERT INTO tax_rates (code, rate_bp, valid_from) VALUES (?, ?, ?)', (code, rate_bp, start)
+                    )
+            self.finish_write()
+
+    # Method to attach the archive database (creating and migrating it if
+    # need be) to the writer connection. Only that connection sees it, so
+    # every read of the archive runs there too (see archive_query).
+    def attach_archive(self):
+        with self.lock:
+            if self.archive_attached:
+                return
+            # ATTACH is not allowed inside a transaction
+            self.flush()
+            self.cursor.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+            self.cursor.execute('PRAGMA archive.journal_mode = WAL')
+            self.cursor.execute('PRAGMA archive.synchronous = NORMAL')
+            self.migrate('archive', ARCHIVE_MIGRATIONS)
+            # Readers on the pool can join the archive too, once it exists
+            if self.pool is not None:
+                self.pool.attach('archive', self.archive_path)
+            self.archive_attached = True
+
+    def archive_query(self, query, parameters=()):
+        with self.lock:
+            self.attach_archive()
+            if self.explain_enabled:
+                self.explain(query, parameters)
+            if self.stats is None:
+                return self.conn.execute(query, parameters).fetchall()
+            started = self.stats.begin()
+            rows = self.conn.execute(query, parameters).fetchall()
+            self.stats.record(query, started, len(rows))
+            return rows
+
+    # Method to move rows of patients or appointments, by id, to the archive.
+    # extra is the SQL for the archive columns after the copied ones (an
+    # appointment's status, then archived_ts). The copy is committed before
+    # the originals are deleted, as a commit spanning two WAL databases is
+    # not atomic: a crash in between leaves rows in both places - the copy
+    # is an INSERT OR REPLACE, so running again tidies up - and never
+    # loses any. Returns the number of rows moved.
+    def move_to_archive(self, table, ids, extra, parameters):
+        if not ids:
+            return 0
+        with self.lock:
+            self.copy_to_archive(table, ids, extra, parameters)
+            with self.savepoint():
+                moved = self.delete_archived(table, ids)
+            self.finish_write(table)
+        return moved
+
+    # First half of move_to_archive: copy the rows and commit the copies.
+    # Callers hold self.lock.
+    def copy_to_archive(self, table, ids, extra, parameters):
+        columns = ARCHIVE_COLUMNS[table]
+        self.attach_archive()
+        self.flush()
+        with self.savepoint():
+            self.cursor.execute(
+                f'INSERT OR REPLACE INTO archive.{table} ({columns}, {"status, " if table == "appointments" else ""}'
+                f'archived_ts) SELECT {columns}, {extra} FROM main.{table} '
+                f'WHERE id IN (SELECT value FROM json_each(:ids))',
+                dict(parameters, ids=json.dumps(list(ids)))
+            )
+        self.conn.commit()
+
+    # Second half: delete the rows that have been copied, in the caller's
+    # savepoint. Returns the number deleted.
+    def delete_archived(self, table, ids):
+        self.cursor.execute(
+            f'DELETE FROM main.{table} WHERE id IN (SELECT value FROM json_each(?)) '
+            f'AND EXISTS (SELECT 1 FROM archive.{table} a WHERE a.id = main.{table}.id)',
+            (json.dumps(list(ids)),)
+        )
+        return self.cursor.rowcount
+
+    # Method to move appointments to the archive as cancelled
+    def cancel_to_archive(self, appointment_ids, cancelled=None):
+        return self.move_to_archive('appointments', appointment_ids, "'cancelled', :archived",
+                                    {'archived': timestamp(cancelled or datetime.datetime.now())})
+
+    # Method to move discharged patients, with their appointments, and
+    # appointments that ended more than keep_days ago out of the active
+    # tables into the archive, batch_size rows at a time so the writer lock
+    # is never held for long; meant to be run nightly (archive.py run).
+    # on_batch(patients, appointments) gets running totals. Returns the
+    # numbers of patients and appointments archived.
+    def archive(self, keep_days=30, batch_size=5000, now=None, on_batch=None):
+        now = now or datetime.datetime.now()
+        cutoff = now - datetime.timedelta(days=keep_days)
+        moments = dict(past_moments(now), archived=timestamp(now))
+        status = f"CASE WHEN {APPOINTMENT_PAST} THEN 'completed' ELSE 'cancelled' END, :archived"
+        patients = appointments = 0
+
+        while True:
+            ids = [patient_id for patient_id, in self.archive_query(
+                'SELECT id FROM patients WHERE discharged_ts IS NOT NULL LIMIT ?', (batch_size,))]
+            if not ids:
+                break
+            appointment_ids = [appointment_id for appointment_id, in self.archive_query(
+                'SELECT id FROM appointments WHERE patient_id IN (SELECT value FROM json_each(?))', (json.dumps(ids),))]
+            appointments += self.move_to_archive('appointments', appointment_ids, status, moments)
+            patients += self.move_to_archive('patients', ids, ':archived', moments)
+            if on_batch:
+                on_batch(patients, appointments)
+
+        # Appointments with an end, then ones without a doctor, then old
+        # ones whose time could not be read
+        past = past_moments(cutoff)
+        for selection in ('end_ts <= :now', 'end_ts IS NULL AND start_ts < :today', 'start_ts IS NULL AND date < :day'):
+            while True:
+                ids = [appointment_id for appointment_id, in self.archive_query(
+                    f'SELECT id FROM appointments WHERE {selection} LIMIT :limit', dict(past, limit=batch_size))]
+                if not ids:
+                    break
+                appointments += self.move_to_archive('appointments', ids, status, moments)
+                if on_batch:
+                    on_batch(patients, appointments)
+
+        # Archived appointments must stop counting as booked time
+        self.scheduler.forget()
+        # Deleting from a full-text index only records tombstones, which
+        # searches keep reading past until the index is merged
+        if patients:
+            self.execute_query("INSERT INTO patients_fts (patients_fts) VALUES ('optimize')")
+        return patients, appointments
+
+    # Method to find discharged patients - archived or not yet - whose name
+    # or mobile number starts with text
+    def search_archive(self, text, limit=SEARCH_LIMIT):
+        prefix = re.sub(r'[%_]', '', text).strip()
+        if not prefix:
+            return []
+        columns = ARCHIVE_COLUMNS['patients']
+        return self.archive_query(f'''
+            SELECT {columns}, NULL FROM main.patients
+            WHERE discharged_ts IS NOT NULL AND (name LIKE :prefix OR mobile_no LIKE :prefix)
+            UNION ALL
+            SELECT {columns}, archived_ts FROM archive.patients
+            WHERE name LIKE :prefix OR mobile_no LIKE :prefix
+            LIMIT :limit
+        ''', {'prefix': prefix + '%', 'limit': limit})
+
+    # Method to fetch a patient's full record from the active tables and the
+    # archive: (patient row with discharged_ts and archived_ts, or None;
+    # appointments as (id, date, time, details, doctor_id, status) in time
+    # order, status being 'booked' for those still in the active table)
+    def fetch_patient_history(self, patient_id):
+        columns = ARCHIVE_COLUMNS['patients']
+        patient = self.archive_query(f'''
+            SELECT {columns}, NULL FROM main.patients WHERE id = :patient
+            UNION ALL
+            SELECT {columns}, archived_ts FROM archive.patients WHERE id = :patient
+        ''', {'patient': patient_id})
+        appointments = self.archive_query('''
+            SELECT id, date, time, details, doctor_id, 'booked' FROM main.appointments WHERE patient_id = :patient
+            UNION ALL
+            SELECT id, date, time, details, doctor_id, status FROM archive.appointments WHERE patient_id = :patient
+            ORDER BY 2, 3, 1
+        ''', {'patient': patient_id})
+        return (patient[0] if patient else None), appointments
+
+    # Method to fetch a patient's timeline, newest first: (patient row, or
+    # None if there is no such patient; events). The patient comes from
+    # fetch_patient, and so usually from the cache. Events are
+    # appointments - booked, or completed and cancelled ones from the
+    # archive - and bills, as (at, kind, id, date, time, details, doctor,
+    # status, amount) rows, kind being 'appointment' or 'bill', at their
+    # start or creation timestamp and amount a bill's total in minor units.
+    # before is the (at, kind, id) of the last event of the previous page.
+    # Each source is read off its (patient_id, time) index, at most limit
+    # rows, so a page costs the same however long the history is. Off the
+    # owner thread the page is one query on a reader connection, which
+    # has the archive attached, so the front desk's writes never wait for
+    # it. Appointments whose time could not be read have no start_ts and
+    # are left out.
+    def fetch_patient_timeline(self, patient_id, before=None, limit=50):
+        patient = self.fetch_patient(patient_id)
+        if patient is None:
+            # Discharged patients keep their record until archived
+            rows = self.fetch_query(
+                'SELECT id, name, dob, gender, problem, mobile_no, discharged_ts FROM patients WHERE id = ?',
+                (patient_id,)
+            )
+            if not rows:
+                return None, []
+            patient = rows[0]
+        if not self.archive_attached:
+            self.attach_archive()
+
+        parameters = {'patient': patient_id, 'limit': limit}
+        appointments_before = bills_before = ''
+        if before is not None:
+            parameters['at'], parameters['kind'], parameters['id'] = before
+            appointments_before = "AND a.start_ts <= :at AND (a.start_ts, 'appointment', a.id) < (:at, :kind, :id)"
+            bills_before = "AND b.created_ts <= :at AND (b.created_ts, 'bill', b.id) < (:at, :kind, :id)"
+        appointments = '''
+            SELECT * FROM (
+                SELECT a.start_ts AS at, 'appointment' AS kind, a.id, a.date, a.time, a.details, s.name AS doctor,
+                       {status} AS status, NULL AS amount
+                FROM {schema}.appointments a LEFT JOIN main.staff s ON s.id = a.doctor_id
+                WHERE a.patient_id = :patient AND a.start_ts IS NOT NULL {before}
+                ORDER BY a.start_ts DESC, a.id DESC LIMIT :limit
+            )
+        '''
+        events = self.fetch_query(f'''
+            {appointments.format(schema='main', status="'booked'", before=appointments_before)}
+            UNION ALL
+            {appointments.format(schema='archive', status='a.status', before=appointments_before)}
+            UNION ALL
+            SELECT * FROM (
+                SELECT b.created_ts, 'bill', b.id, date(b.created_ts, 'unixepoch', 'localtime'),
+                       strftime('%H:%M', b.created_ts, 'unixepoch', 'localtime'), 'Bill', NULL, b.status,
+                       COALESCE(b.total, (SELECT SUM(i.quantity * i.unit_amount) FROM main.bill_items i
+                                          WHERE i.bill_id = b.id))
+                FROM main.bills b
+                WHERE b.patient_id = :patient {bills_before}
+                ORDER BY b.created_ts DESC, b.id DESC LIMIT :limit
+            )
+            ORDER BY 1 DESC, 2 DESC, 3 DESC LIMIT :limit
+        ''', parameters)
+        return tuple(patient[:7]), events
 
-    # Close the database connection
+    # Close the database connections, after draining any queued writes
     def close(self):
+        if self.write_queue is not None:
+            self.write_queue.close()
+        self.flush()
+        if self.pool is not None:
+            self.pool.close()
         self.conn.close()
 
-    
+
+# One doctor's appointments as parallel lists sorted by start time. A
+# doctor's appointments never overlap, so the end times are sorted too and
+# both "what overlaps this interval" and "where does the next gap start"
+# are a binary search.
+class IntervalIndex:
+    def __init__(self, rows=()):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        for appointment_id, start, end in rows:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.ids.append(appointment_id)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Id of an appointment overlapping [start, end), or None
+    def overlapping(self, start, end):
+        i = bisect.bisect_right(self.ends, start)
+        if i < len(self.ids) and self.starts[i] < end:
+            return self.ids[i]
+        return None
+
+    def add(self, appointment_id, start, end):
+        i = bisect.bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, appointment_id)
+
+    def remove(self, appointment_id, start):
+        i = bisect.bisect_left(self.starts, start)
+        while i < len(self.ids) and self.starts[i] == start:
+            if self.ids[i] == appointment_id:
+                del self.starts[i], self.ends[i], self.ids[i]
+                return
+            i += 1
+
+
+# Books appointments with a doctor and finds free slots. Each doctor's
+# appointments are loaded into an IntervalIndex the first time they are
+# needed and kept up to date by book() and cancel(). The database triggers
+# from migration 4 remain the authority: a booking that lost a race with
+# another process is rejected there, and the indexes are dropped whenever
+# PRAGMA data_version shows another connection has written.
+#
+# Times are naive local datetimes. Slots are slot_minutes long and laid out
+# from opening to closing time every day; an appointment must fit in one day.
+class Scheduler:
+    def __init__(self, hospital, slot_minutes=30, opening=datetime.time(9, 0), closing=datetime.time(17, 0),
+                 horizon_days=366):
+        self.hospital = hospital
+        self.horizon_days = horizon_days
+        self.slot = datetime.timedelta(minutes=slot_minutes)
+        self.opening = opening
+        self.closing = closing
+        self.indexes = {}
+        self.data_version = None
+        self.lock = threading.RLock()
+
+    # Run a read on the writer connection, which also sees writes that
+    # group commit has not committed yet
+    def query(self, sql, parameters=()):
+        stats = self.hospital.stats
+        with self.hospital.lock:
+            if stats is None:
+                return self.hospital.conn.execute(sql, parameters).fetchall()
+            started = stats.begin()
+            rows = self.hospital.conn.execute(sql, parameters).fetchall()
+            stats.record(sql, started, len(rows))
+            return rows
+
+    # The interval index of one doctor, loading it on first use
+    def index(self, doctor_id):
+        with self.lock:
+            version = self.query('PRAGMA data_version')[0][0]
+            if version != self.data_version:
+                self.indexes.clear()
+                self.data_version = version
+            if doctor_id not in self.indexes:
+                # Built straight from the cursor, without a list of every row
+                with self.hospital.lock:
+                    self.indexes[doctor_id] = IntervalIndex(self.hospital.conn.execute(
+                        'SELECT id, start_ts, end_ts FROM appointments WHERE doctor_id = ? ORDER BY start_ts',
+                        (doctor_id,)
+                    ))
+            return self.indexes[doctor_id]
+
+    # Id of the doctor's appointment overlapping [start, end), or None
+    def overlapping(self, doctor_id, start, end):
+        with self.lock:
+            return self.index(doctor_id).overlapping(timestamp(start), timestamp(end))
+
+    # Length of an appointment, defaulting to one slot. Raises ValueError
+    # unless it is positive and fits between opening and closing time.
+    def appointment_length(self, duration):
+        duration = self.slot if duration is None else duration
+        day = datetime.date.today()
+        open_hours = datetime.datetime.combine(day, self.closing) - datetime.datetime.combine(day, self.opening)
+        if duration <= datetime.timedelta(0) or duration > open_hours:
+            raise ValueError(f"An appointment must be longer than zero and at most {open_hours} long.")
+        return duration
+
+    # The next count free (start, end) slots of the doctor from after on,
+    # looking at most horizon_days ahead, so fewer may be returned.
+    # duration defaults to one slot; slots always start on the slot grid.
+    def free_slots(self, doctor_id, after, count=5, duration=None):
+        duration = self.appointment_length(duration)
+        slots = []
+        with self.lock:
+            index = self.index(doctor_id)
+            candidate = self.align(after)
+            last_day = candidate.date() + datetime.timedelta(days=self.horizon_days)
+            i = bisect.bisect_right(index.ends, timestamp(candidate))
+            while len(slots) < count and candidate.date() <= last_day:
+                end = candidate + duration
+                if end > datetime.datetime.combine(candidate.date(), self.closing):
+                    next_day = candidate.date() + datetime.timedelta(days=1)
+                    candidate = datetime.datetime.combine(next_day, self.opening)
+                    continue
+                start_ts, end_ts = timestamp(candidate), timestamp(end)
+                while i < len(index) and index.ends[i] <= start_ts:
+                    i += 1
+                if i < len(index) and index.starts[i] < end_ts:
+                    candidate = self.align(datetime.datetime.fromtimestamp(index.ends[i]))
+                    continue
+                slots.append((candidate, end))
+                candidate = end
+        return slots
+
+    # First slot boundary at or after moment
+    def align(self, moment):
+        opening = datetime.datetime.combine(moment.date(), self.opening)
+        if moment <= opening:
+            return opening
+        slots = -((opening - moment) // self.slot)
+        return opening + slots * self.slot
+
+    # Book an appointment and return its id. Raises ValueError when the
+    # patient or doctor does not exist or the doctor is not free.
+    def book(self, patient_id, doctor_id, start, details, duration=None):
+        end = start + self.appointment_length(duration)
+        start_ts, end_ts = timestamp(start), timestamp(end)
+        # Checked under the lock, which discharge_patient also takes
+        with self.lock:
+            if not self.query('SELECT 1 FROM patients WHERE id = ? AND discharged_ts IS NULL', (patient_id,)):
+                raise ValueError("Patient ID does not exist.")
+            if not self.query('SELECT 1 FROM staff WHERE id = ?', (doctor_id,)):
+                raise ValueError("Doctor ID does not exist.")
+            index = self.index(doctor_id)
+            if index.overlapping(start_ts, end_ts) is not None:
+                raise ValueError("The doctor already has an appointment at that time.")
+            try:
+                appointment_id = self.hospital.execute_query(
+                    'INSERT INTO appointments (patient_id, date, time, details, doctor_id, start_ts, end_ts) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (patient_id, start.strftime('%Y-%m-%d'), start.strftime('%H:%M'), details,
+                     doctor_id, start_ts, end_ts)
+                )
+            except sqlite3.IntegrityError as e:
+                # Booked by another process since the index was loaded
+                self.indexes.pop(doctor_id, None)
+                raise ValueError(str(e)) from None
+            index.add(appointment_id, start_ts, end_ts)
+            return appointment_id
+
+    # Cancel an appointment, moving it to the archive; returns False if
+    # there was no such appointment
+    def cancel(self, appointment_id):
+        return self.cancel_many([appointment_id]) == 1
+
+    # Cancel several appointments in one move to the archive; returns the
+    # number of appointments cancelled
+    def cancel_many(self, appointment_ids):
+        with self.lock:
+            rows = self.query(
+                'SELECT id, doctor_id, start_ts FROM appointments WHERE id IN (SELECT value FROM json_each(?))',
+                (json.dumps(list(appointment_ids)),)
+            )
+            if not rows:
+                return 0
+            self.hospital.cancel_to_archive([appointment_id for appointment_id, _, _ in rows])
+            self.discard(rows)
+            return len(rows)
+
+    # Take removed appointments, as (id, doctor_id, start_ts), out of the
+    # loaded indexes
+    def discard(self, appointments):
+        with self.lock:
+            for appointment_id, doctor_id, start_ts in appointments:
+                if doctor_id in self.indexes:
+                    self.indexes[doctor_id].remove(appointment_id, start_ts)
+
+    # Drop every loaded index, after appointments were removed in bulk
+    def forget(self):
+        with self.lock:
+            self.indexes.clear()
+
+
+# Unix timestamp of a naive local datetime
+def timestamp(moment):
+    return int(moment.timestamp())
+
+
+# Timestamp of midnight at the start of a date
+def midnight(day):
+    return timestamp(datetime.datetime.combine(day, datetime.time()))
+
+
+# Parameters of APPOINTMENT_PAST at a given moment
+def past_moments(now):
+    return {'now': timestamp(now), 'today': midnight(now.date()), 'day': now.date().isoformat()}
+
+
+# True for an EXPLAIN QUERY PLAN step that reads a whole table rather than
+# seeking into the primary key or an index ("SCAN patients" on current
+# SQLite, "SCAN TABLE patients" on older releases). Constant rows and
+# subquery results are not tables and are never flagged, nor are the
+# named subqueries given in subqueries. A virtual table (e.g. a full-text
+# index) only scans everything when no constraint was passed to it, which
+# shows up as "INDEX 0:".
+def is_full_scan(plan_step, subqueries=()):
+    if not plan_step.startswith('SCAN') or ' USING ' in plan_step:
+        return False
+    words = plan_step.split()
+    if len(words) > 1 and words[1] in subqueries:
+        return False
+    if ' VIRTUAL TABLE INDEX ' in plan_step:
+        return plan_step.endswith(' INDEX 0:')
+    return not plan_step.startswith(('SCAN CONSTANT ROW', 'SCAN SUBQUERY', 'SCAN ('))
+
+
+# A unit of work submitted to a DatabaseExecutor. Cancelling stops a queued
+# task from starting, stops a generator task at its next yield, and
+# suppresses all of its callbacks.
+class DatabaseTask:
+    def __init__(self, fn, args, on_done, on_error, on_progress, group):
+        self.fn = fn
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.group = group
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+
+# Runs database work on background threads so Tk callbacks never block on
+# SQLite. Results come back to the Tk thread through a queue that is polled
+# with root.after, and each poll stops after frame_budget seconds so a
+# flood of results cannot stall the event loop.
+#
+# A submitted function may return a generator: every value it yields is
+# passed to on_progress on the Tk thread (e.g. a page of rows), the task can
+# be cancelled between yields, and the generator's return value goes to
+# on_done.
+class DatabaseExecutor:
+    def __init__(self, root, workers=2, poll_interval=10, frame_budget=0.008):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.frame_budget = frame_budget
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.active = set()
+        self.threads = []
+        for number in range(workers):
+            thread = threading.Thread(target=self.run, name=f"hms-db-{number}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        self.poll_id = self.root.after(self.poll_interval, self.poll)
+
+    # Queue fn(*args) for a worker thread. Callbacks run on the Tk thread.
+    # Tasks submitted with a group can be cancelled together, e.g. every
+    # read that belongs to the screen being left.
+    def submit(self, fn, *args, on_done=None, on_error=None, on_progress=None, group=None):
+        task = DatabaseTask(fn, args, on_done, on_error, on_progress, group)
+        self.active.add(task)
+        self.jobs.put(task)
+        return task
+
+    def cancel_group(self, group):
+        for task in list(self.active):
+            if task.group == group:
+                task.cancel()
+
+    def run(self):
+        while True:
+            task = self.jobs.get()
+            if task is None:
+                break
+            if task.cancelled:
+                self.results.put((task, 'cancelled', None))
+                continue
+            try:
+                result = task.fn(*task.args)
+                if inspect.isgenerator(result):
+                    result = self.drain(task, result)
+                self.results.put((task, 'done', result))
+            except Exception as e:
+                self.results.put((task, 'error', e))
+
+    def drain(self, task, generator):
+        try:
+            while True:
+                if task.cancelled:
+                    generator.close()
+                    return None
+                self.results.put((task, 'progress', next(generator)))
+        except StopIteration as stop:
+            return stop.value
+
+    # Deliver finished work to its callbacks, within the frame budget
+    def poll(self):
+        deadline = time.perf_counter() + self.frame_budget
+        while time.perf_counter() < deadline:
+            try:
+                task, kind, value = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if kind != 'progress':
+                self.active.discard(task)
+            if task.cancelled:
+                continue
+
+            if kind == 'progress':
+                callback = task.on_progress
+            elif kind == 'done':
+                callback = task.on_done
+            elif kind == 'error':
+                callback = task.on_error
+                if callback is None:
+                    logger.error("Database task failed", exc_info=value)
+            else:
+                callback = None
+            if callback is not None:
+                try:
+                    callback(value)
+                except Exception:
+                    logger.exception("Database task callback failed")
+        self.poll_id = self.root.after(self.poll_interval, self.poll)
+
+    # Stop the workers once queued work has finished
+    def shutdown(self):
+        self.root.after_cancel(self.poll_id)
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+# Keeps only a sliding window of rows in a Treeview and fetches more pages as
+# the user scrolls, so large tables open instantly and memory stays flat.
+# fetch_page(after_id=None, before_id=None, limit=...) must return rows whose
+# first column is a strictly increasing integer key. With an executor the
+# pages are fetched on a worker thread and inserted when they arrive.
+class PagedTreeview:
+    def __init__(self, tree, scrollbar, fetch_page, page_size=100, max_rows=500, prefetch=0.2,
+                 executor=None, group=None, on_error=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.fetch_page = fetch_page
+        self.executor = executor
+        self.group = group
+        self.on_error = on_error
+        self.page_size = page_size
+        self.max_rows = max(max_rows, page_size * 2)
+        self.prefetch = prefetch
+        self.first_key = None
+        self.last_key = None
+        self.more_above = False
+        self.more_below = True
+        self.loading = False
+
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.scrollbar.configure(command=self.tree.yview)
+
+    # Load the first page (and a second one as prefetch margin). A fetch
+    # cancelled while the screen was hidden never clears loading, so a
+    # reload starts from a clean state.
+    def load(self):
+        self.tree.delete(*self.tree.get_children())
+        self.first_key = self.last_key = None
+        self.more_above = False
+        self.more_below = True
+        self.loading = True
+        self.fetch(self.show_first_page, after_id=None, limit=self.page_size)
+
+    # The second page can only be asked for once the first one is in,
+    # as it starts after the first page's last key
+    def show_first_page(self, rows):
+        self.append_rows(rows)
+        self.load_next()
+
+    # Scroll callback: update the scrollbar and fetch more rows near the edges
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.loading:
+            return
+        if float(last) >= 1 - self.prefetch and self.more_below:
+            self.tree.after_idle(self.load_next)
+        elif float(first) <= self.prefetch and self.more_above:
+            self.tree.after_idle(self.load_previous)
+
+    # Fetch a page, then hand it to callback (on the Tk thread)
+    def fetch(self, callback, **kwargs):
+        if self.executor is None:
+            try:
+                rows = self.fetch_page(**kwargs)
+            except Exception as e:
+                self.fetch_failed(e)
+                return
+            callback(rows)
+        else:
+            self.executor.submit(functools.partial(self.fetch_page, **kwargs),
+                                 on_done=callback, on_error=self.fetch_failed, group=self.group)
+
+    def fetch_failed(self, error):
+        self.loading = False
+        if self.on_error is not None:
+            self.on_error(error)
+        else:
+            logger.error("Failed to fetch page: %s", error)
+
+    def load_next(self):
+        if self.loading or not self.more_below:
+            return
+        self.loading = True
+        self.fetch(self.append_rows, after_id=self.last_key, limit=self.page_size)
+
+    def append_rows(self, rows):
+        try:
+            if len(rows) < self.page_size:
+                self.more_below = False
+            if not rows:
+                return
+            for row in rows:
+                self.tree.insert('', tk.END, iid=str(row[0]), values=row)
+            if self.first_key is None:
+                self.first_key = rows[0][0]
+            self.last_key = rows[-1][0]
+            self.trim(from_top=True)
+        finally:
+            self.loading = False
+
+    def load_previous(self):
+        if self.loading or not self.more_above:
+            return
+        self.loading = True
+        self.fetch(self.prepend_rows, before_id=self.first_key, limit=self.page_size)
+
+    def prepend_rows(self, rows):
+        try:
+            if len(rows) < self.page_size:
+                self.more_above = False
+            if not rows:
+                return
+            first_index = self.first_visible_index()
+            for position, row in enumerate(rows):
+                self.tree.insert('', position, iid=str(row[0]), values=row)
+            self.first_key = rows[0][0]
+            self.restore_view(first_index + len(rows))
+            self.trim(from_top=False)
+        finally:
+            self.loading = False
+
+    # Drop rows from the opposite end once the window grows past max_rows
+    def trim(self, from_top):
+        items = self.tree.get_children()
+        excess = len(items) - self.max_rows
+        if excess <= 0:
+            return
+        if from_top:
+            first_index = self.first_visible_index()
+            self.tree.delete(*items[:excess])
+            self.first_key = int(items[excess])
+            self.more_above = True
+            self.restore_view(first_index - excess)
+        else:
+            self.tree.delete(*items[-excess:])
+            self.last_key = int(items[-excess - 1])
+            self.more_below = True
+
+    def first_visible_index(self):
+        count = len(self.tree.get_children())
+        return int(round(self.tree.yview()[0] * count))
+
+    def restore_view(self, index):
+        count = len(self.tree.get_children())
+        if count:
+            self.tree.yview_moveto(max(index, 0) / count)
+
+
+# A patient's timeline (see Hospital.fetch_patient_timeline) in a
+# Treeview, newest first. Events are fetched page_size at a time; as soon
+# as a page is shown the next one is fetched in the background, so
+# scrolling near the bottom appends it without waiting for the database.
+# The timeline only grows downwards: a patient's history is small enough
+# to keep every loaded row.
+class TimelinePager:
+    def __init__(self, tree, scrollbar, fetch_page, executor, page_size=50, prefetch=0.2,
+                 group="screen", on_error=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.fetch_page = fetch_page
+        self.executor = executor
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.group = group
+        self.on_error = on_error
+        self.patient_id = None
+        self.generation = 0
+        self.ready = None
+        self.fetching = False
+        self.waiting = False
+        self.more = False
+
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.scrollbar.configure(command=self.tree.yview)
+
+    # Show a patient's timeline from the start. first is the first page as
+    # returned by fetch_page, if the caller already has it.
+    def load(self, patient_id, first=None):
+        self.tree.delete(*self.tree.get_children())
+        self.patient_id = patient_id
+        # Pages still in flight for the previous patient are ignored
+        self.generation += 1
+        self.ready = None
+        self.fetching = False
+        self.waiting = first is None
+        self.more = False
+        if first is not None:
+            self.show(first[1])
+        else:
+            self.fetch(None)
+
+    def fetch(self, before):
+        generation = self.generation
+        self.fetching = True
+        self.executor.submit(self.fetch_page, self.patient_id, before, self.page_size,
+                             on_done=lambda page: self.fetched(generation, page),
+                             on_error=lambda error: self.fetch_failed(generation, error), group=self.group)
+
+    def fetched(self, generation, page):
+        if generation != self.generation:
+            return
+        self.fetching = False
+        if self.waiting:
+            self.waiting = False
+            self.show(page[1])
+        else:
+            self.ready = page[1]
+
+    def fetch_failed(self, generation, error):
+        if generation != self.generation:
+            return
+        self.fetching = self.waiting = False
+        if self.on_error is not None:
+            self.on_error(error)
+        else:
+            logger.error("Failed to fetch timeline: %s", error)
+
+    # Append a page of events and start fetching the one after it
+    def show(self, events):
+        for at, kind, event_id, date, time_of_day, details, doctor, status, amount in events:
+            self.tree.insert('', tk.END, iid=f"{kind}-{event_id}", values=(
+                date, time_of_day, kind.capitalize(), details, doctor or '', status,
+                format_money(amount) if amount is not None else ''
+            ))
+        self.more = len(events) == self.page_size
+        if self.more:
+            self.fetch(tuple(events[-1][:3]))
+
+    # Scroll callback: update the scrollbar and show the prefetched page
+    # once the bottom is near
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(last) >= 1 - self.prefetch and self.more:
+            self.tree.after_idle(self.next_page)
+
+    def next_page(self):
+        if self.ready is not None:
+            events, self.ready = self.ready, None
+            self.show(events)
+        elif self.fetching:
+            self.waiting = True
+
+
+# Search-as-you-type for an Entry: search(text) runs on the executor once
+# the text has not changed for delay milliseconds, and its rows are passed to
+# on_results on the Tk thread. A new keystroke cancels both the pending timer
+# and any search still in flight, so a slow result never replaces a newer
+# one. on_clear is called instead when the entry is emptied.
+class IncrementalSearch:
+    def __init__(self, entry, search, on_results, executor, on_clear=None, on_error=None,
+                 delay=250, group="screen"):
+        self.entry = entry
+        self.search = search
+        self.on_results = on_results
+        self.executor = executor
+        self.on_clear = on_clear
+        self.on_error = on_error
+        self.delay = delay
+        self.group = group
+        self.after_id = None
+        self.task = None
+        self.last_text = ''
+
+        self.text = tk.StringVar(master=entry)
+        self.entry.configure(textvariable=self.text)
+        self.text.trace_add('write', self.schedule)
+
+    def schedule(self, *args):
+        if self.after_id is not None:
+            self.entry.after_cancel(self.after_id)
+        self.after_id = self.entry.after(self.delay, self.run)
+
+    def run(self):
+        self.after_id = None
+        text = self.text.get().strip()
+        if text == self.last_text:
+            return
+        self.last_text = text
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if not text:
+            if self.on_clear is not None:
+                self.on_clear()
+            return
+        self.task = self.executor.submit(self.search, text, on_done=self.on_results,
+                                         on_error=self.on_error, group=self.group)
+
+    # Empty the entry without triggering a search
+    def reset(self):
+        self.text.set('')
+        if self.after_id is not None:
+            self.entry.after_cancel(self.after_id)
+            self.after_id = None
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.last_text = ''
+
+
+# Scale (width, height) down to fit within bounds, keeping the aspect ratio;
+# images that already fit keep their size
+def fit_within(size, bounds):
+    img_width, img_height = size
+    max_width, max_height = bounds
+
+    if img_width > max_width or img_height > max_height:
+        scale = min(max_width / img_width, max_height / img_height)
+        return max(1, int(img_width * scale)), max(1, int(img_height * scale))
+    return img_width, img_height
+
+
+# Path of the cached, resized copy of an image. The key covers the source
+# path, its mtime and size, and the requested bounds, so editing the image
+# or changing the screen size produces a new entry.
+def image_cache_path(path, bounds, cache_dir=IMAGE_CACHE_DIR):
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{bounds[0]}x{bounds[1]}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".png")
+
+
+# Make sure a resized PNG copy of path exists in the cache and return its
+# path. Cache hits never import Pillow; misses decode with draft() so JPEGs
+# are downscaled while decoding. With fit=True the image keeps its aspect
+# ratio within bounds, otherwise it is stretched to exactly bounds.
+def render_cached_image(path, bounds, fit=False, cache_dir=IMAGE_CACHE_DIR):
+    cached = image_cache_path(path, bounds, cache_dir)
+    if os.path.exists(cached):
+        return cached
+
+    load_pil()
+    with Image.open(path) as image:
+        size = fit_within(image.size, bounds) if fit else bounds
+        image.draft('RGB', size)
+        resized = image.convert('RGB').resize(size, Image.LANCZOS)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f"{cached}.{threading.get_ident()}.tmp"
+    resized.save(temp_path, "PNG", compress_level=1)
+    os.replace(temp_path, cached)
+    return cached
+
+
+# Decodes and resizes slideshow images once and keeps the results: resizing
+# runs on a background thread into the on-disk cache (see
+# render_cached_image), and the finished PhotoImages are held in an LRU
+# bounded by memory_budget bytes. Tk reads the cached PNGs itself, so a
+# warm cache needs no Pillow at all. get() must be called on the Tk thread.
+class SlideshowCache:
+    def __init__(self, size=(1200, 600), cache_dir=IMAGE_CACHE_DIR, memory_budget=64 * 1024 * 1024):
+        self.size = size
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self.images = collections.OrderedDict()
+        self.decoding = {}
+        self.decoder = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="hms-images")
+
+    # Start decoding images that are not cached yet
+    def prefetch(self, paths):
+        for path in paths:
+            if path not in self.images and path not in self.decoding:
+                self.decoding[path] = self.decoder.submit(render_cached_image, path, self.size,
+                                                          cache_dir=self.cache_dir)
+
+    # Return the PhotoImage for path, or None while it is still decoding
+    def get(self, path):
+        if path in self.images:
+            self.images.move_to_end(path)
+            return self.images[path][0]
+
+        self.prefetch([path])
+        future = self.decoding[path]
+        if not future.done():
+            return None
+        del self.decoding[path]
+        try:
+            photo = tk.PhotoImage(file=future.result())
+        except (OSError, tk.TclError) as e:
+            logger.error("Could not load slideshow image %s: %s", path, e)
+            return None
+
+        cost = photo.width() * photo.height() * 4
+        self.images[path] = (photo, cost)
+        self.memory_used += cost
+        while self.memory_used > self.memory_budget and len(self.images) > 1:
+            evicted_path, (evicted, evicted_cost) = self.images.popitem(last=False)
+            self.memory_used -= evicted_cost
+        return photo
+
+    def shutdown(self):
+        self.decoder.shutdown(wait=False, cancel_futures=True)
+
+
+# Number of widgets under (and including) widget
+def count_widgets(widget):
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+# Navigations a ScreenManager keeps in its log
+NAVIGATION_LOG_SIZE = 1000
+
+
+# Builds each screen once and switches between them instead of destroying
+# and rebuilding the whole window on every navigation. Screens are
+# registered with a build(page) function that fills a fresh frame, plus
+# optional on_show(*args) / on_hide() hooks used to reset forms, reload
+# listings or pause timers. Every navigation is timed (until the next idle
+# point, so layout is included) and recorded with the window's widget count;
+# only the last NAVIGATION_LOG_SIZE are kept. With cache_screens=False
+# hidden screens are destroyed instead, which reproduces the old
+# rebuild-everything behaviour for comparison.
+class ScreenManager:
+    def __init__(self, root, on_leave=None, cache_screens=True):
+        self.root = root
+        self.on_leave = on_leave
+        self.cache_screens = cache_screens
+        self.container = ttk.Frame(root)
+        self.container.pack(fill='both', expand=True)
+        self.container.grid_rowconfigure(0, weight=1)
+        self.container.grid_columnconfigure(0, weight=1)
+
+        self.builders = {}
+        self.pages = {}
+        self.current = None
+        self.navigation_log = collections.deque(maxlen=NAVIGATION_LOG_SIZE)
+        self.log_navigation = False
+
+    def register(self, name, build, on_show=None, on_hide=None):
+        self.builders[name] = (build, on_show, on_hide)
+
+    def show(self, name, *args):
+        start = time.perf_counter()
+        build, on_show, on_hide = self.builders[name]
+
+        if self.current is not None and self.current != name:
+            if self.on_leave is not None:
+                self.on_leave()
+            previous_hide = self.builders[self.current][2]
+            if previous_hide is not None:
+                previous_hide()
+            if self.cache_screens:
+                self.pages[self.current].grid_remove()
+            else:
+                self.pages.pop(self.current).destroy()
+
+        built = name not in self.pages
+        if built:
+            page = ttk.Frame(self.container)
+            build(page)
+            self.pages[name] = page
+        page = self.pages[name]
+        page.grid(row=0, column=0, sticky='nsew')
+        page.tkraise()
+        self.current = name
+
+        if on_show is not None:
+            on_show(*args)
+        self.root.after_idle(self.record_navigation, name, start, built)
+
+    def record_navigation(self, name, start, built):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        widgets = count_widgets(self.root)
+        self.navigation_log.append((name, elapsed_ms, widgets, built))
+        if self.log_navigation:
+            logger.info("Screen %s shown in %.1f ms (%s, %d widgets)",
+                        name, elapsed_ms, "built" if built else "reused", widgets)
+
+
+# How often the home screen dashboard is re-read
+DASHBOARD_REFRESH_MS = 5000
+
+
 class HospitalGUI:
-    def __init__(self, root):
-        self.hospital = Hospital()
+    def __init__(self, root, hospital=None, cache_screens=True, log_navigation=False):
+        self.hospital = hospital if hospital is not None else Hospital()
         self.root = root
         self.root.title("Hospital Management System")
+        self.configure_styles()
 
-        # Load the hospital image
-        self.load_image()
+        # Screens are created by show_main_window() after login
+        self.screens = None
+        self.cache_screens = cache_screens
+        self.log_navigation = log_navigation
 
-        # Create a login frame
-        self.create_login_frame()
+        # All database work runs on background threads; reads started by a
+        # screen are grouped under "screen" and cancelled when it is left
+        self.db = DatabaseExecutor(root)
 
         # Photo slideshow variables
         self.photo_index = 0
-        self.photo_files = [
-            r"C:\Users\chint\Downloads\hospital1.jpg",
-            r"C:\Users\chint\Downloads\hospital2.jpg",
-            r"C:\Users\chint\Downloads\hospital3.jpg",
-            r"C:\Users\chint\Downloads\hospital4.jpg",
-            r"C:\Users\chint\Downloads\hospital5.jpg"
-        ]
+        self.photo_files = [os.path.join(BASE_DIR, f"hospital{number}.jpg") for number in range(1, 6)]
         self.slideshow_running = False
         self.slideshow_label = None  # Placeholder for the slideshow label
+        self.slideshow_after_id = None
+        self.slideshow_cache = SlideshowCache()
+
+        # Pending refresh of the home screen dashboard
+        self.dashboard_after_id = None
+
+        # Create the canvas for the hospital image; the image itself is
+        # drawn once the login window is showing
+        self.load_image()
+
+        # Create a login frame
+        self.create_login_frame()
+        STARTUP.mark('login window')
+
+        # Once the login window has been drawn, stream in the background
+        # image and start decoding the slideshow frames
+        self.root.after_idle(self.root.after, 0, self.start_background_loading)
 
     def load_image(self):
-        image_path = r"C:\Users\chint\Downloads\hospital.jpg"
-        if os.path.exists(image_path):
-            self.hospital_image = Image.open(image_path)
-            self.update_image()
+        self.hospital_image_path = os.path.join(BASE_DIR, "hospital.jpg")
+        self.screen_size = (self.root.winfo_screenwidth(), self.root.winfo_screenheight())
+        self.canvas = tk.Canvas(self.root)
+        self.canvas.pack(fill='both', expand=True)
 
-            self.canvas = tk.Canvas(self.root, width=self.hospital_image.width, height=self.hospital_image.height)
-            self.canvas.pack(fill='both', expand=True)
+        if not os.path.exists(self.hospital_image_path):
+            messagebox.showerror("File Error", f"Image file not found: {self.hospital_image_path}")
+            return
 
-            self.hospital_image_tk = ImageTk.PhotoImage(self.hospital_image)
-            self.canvas.create_image(0, 0, anchor=tk.NW, image=self.hospital_image_tk)
+        # With a warm cache the canvas gets its final size straight away
+        cached = image_cache_path(self.hospital_image_path, self.screen_size)
+        if os.path.exists(cached):
+            self.splash_future = concurrent.futures.Future()
+            self.splash_future.set_result(cached)
         else:
-            messagebox.showerror("File Error", f"Image file not found: {image_path}")
-
-    def update_image(self):
-        screen_width = self.root.winfo_screenwidth()
-        screen_height = self.root.winfo_screenheight()
-
-        img_width, img_height = self.hospital_image.size
-        aspect_ratio = img_width / img_height
-
-        if img_width > screen_width or img_height > screen_height:
-            if aspect_ratio > 1:  # Wider than tall
-                new_width = screen_width
-                new_height = int(screen_width / aspect_ratio)
-            else:  # Taller than wide
-                new_height = screen_height
-                new_width = int(screen_height * aspect_ratio)
+            self.splash_future = self.slideshow_cache.decoder.submit(
+                render_cached_image, self.hospital_image_path, self.screen_size, fit=True)
+
+    def start_background_loading(self):
+        STARTUP.mark('first paint')
+        if os.path.exists(self.hospital_image_path):
+            self.show_background_image()
         else:
-            new_width, new_height = img_width, img_height
+            STARTUP.finish()
+        self.slideshow_cache.prefetch(self.photo_files)
 
-        # Resize image
-        self.hospital_image = self.hospital_image.resize((new_width, new_height), Image.LANCZOS)
+    # Draw the screen-sized splash once it has been rendered (or read from
+    # the cache); polls so the Tk thread never waits on the decoder
+    def show_background_image(self):
+        if not self.canvas.winfo_exists():
+            return
+        if not self.splash_future.done():
+            self.root.after(20, self.show_background_image)
+            return
+
+        try:
+            self.hospital_image_tk = tk.PhotoImage(file=self.splash_future.result())
+        except (OSError, tk.TclError) as e:
+            messagebox.showerror("File Error", f"Could not load image {self.hospital_image_path}: {e}")
+            return
+        self.canvas.configure(width=self.hospital_image_tk.width(), height=self.hospital_image_tk.height())
+        self.canvas.create_image(0, 0, anchor=tk.NW, image=self.hospital_image_tk)
+        STARTUP.mark('background image')
+        STARTUP.finish()
+
+    # Configure the ttk styles once; screens pick a named style instead of
+    # reconfiguring the shared defaults every time they are shown
+    def configure_styles(self):
+        style = ttk.Style()
+        style.configure('TFrame', background='lightblue')
+        style.configure('TButton', background='skyblue', font=("Helvetica", 12))
+        style.configure('TLabel', font=("Helvetica", 14))  # Set font size for labels
+
+        # Registration and booking forms
+        style.configure('Form.TFrame', background='#f0f0f0')  # Light gray background
+        style.configure('Form.TButton', font=("Helvetica", 14))  # Set font size for buttons
+
+        # Listings
+        style.configure("Staff.Treeview", font=("Times New Roman", 14))  # Set font for Treeview rows
+        style.configure("Staff.Treeview.Heading", font=("Times New Roman", 16, "bold"))  # Set font for Treeview headers
+        style.configure("Appointments.Treeview", font=("Helvetica", 14))
+        style.configure("Appointments.Treeview.Heading", font=("Times New Roman", 16, "bold"))
 
     def create_login_frame(self):
         self.login_frame = ttk.Frame(self.root, relief=tk.SUNKEN, borderwidth=10, padding=20)
@@ -169,11 +3489,6 @@ class HospitalGUI:
         ttk.Button(self.login_frame, text="Login", command=self.login).grid(row=4, column=0, columnspan=2, pady=10)
         ttk.Button(self.login_frame, text="Forgot Password?", command=self.forgot_password).grid(row=5, column=0, columnspan=2, pady=10)
 
-        # Configure styles
-        style = ttk.Style()
-        style.configure('TFrame', background='lightblue')
-        style.configure('TButton', background='skyblue', font=("Helvetica", 12))
-
     def login(self):
         username = self.username_entry.get()
         password = self.password_entry.get()
@@ -181,18 +3496,42 @@ class HospitalGUI:
         # Basic authentication
         if username == "admin" and password == "password":
             messagebox.showinfo("Login Successful", "Welcome to the Hospital Management System!")
-            self.canvas.destroy()  # Close the image
-            self.login_frame.destroy()  # Remove the login frame
-            self.create_home_frame()  # Create the home frame
+            self.show_main_window()
         else:
             messagebox.showerror("Login Failed", "Invalid username or password.")
 
     def forgot_password(self):
         messagebox.showinfo("Forgot Password", "Reset password feature is not implemented yet.")
 
+    # Replace the login window with the screen manager and register every
+    # screen; each one is built the first time it is shown
+    def show_main_window(self):
+        self.canvas.destroy()  # Close the image
+        self.login_frame.destroy()  # Remove the login frame
+
+        # Reads still running for the old screen must not touch its widgets
+        self.screens = ScreenManager(self.root, on_leave=lambda: self.db.cancel_group("screen"),
+                                     cache_screens=self.cache_screens)
+        self.screens.log_navigation = self.log_navigation
+        self.screens.register('home', self.build_home_screen, on_show=self.show_home, on_hide=self.hide_home)
+        self.screens.register('contact', self.build_contact_us_screen)
+        self.screens.register('view_staff', self.build_view_staff_screen, on_show=self.load_staff)
+        self.screens.register('billing', self.build_billing_screen, on_show=self.reset_billing_form)
+        self.screens.register('receipt', self.build_receipt_screen, on_show=self.fill_receipt)
+        self.screens.register('new_patient', self.build_new_patient_screen, on_show=self.reset_patient_form)
+        self.screens.register('book_appointment', self.build_appointments_screen, on_show=self.reset_appointment_form)
+        self.screens.register('view_appointments', self.build_view_appointments_screen, on_show=self.load_appointments)
+        self.screens.register('cancel_appointment', self.build_cancel_appointments_screen, on_show=self.reset_cancel_form)
+        self.screens.register('view_patient', self.build_view_patients_screen, on_show=self.reset_view_patient)
+        self.screens.register('discharge_patient', self.build_discharge_patient_screen, on_show=self.reset_discharge_form)
+        self.screens.register('new_staff', self.build_new_staff_screen, on_show=self.reset_staff_form)
+        self.create_home_frame()
+
     def create_home_frame(self):
-        self.clear_frame()
-        self.home_frame = ttk.Frame(self.root)
+        self.screens.show('home')
+
+    def build_home_screen(self, page):
+        self.home_frame = ttk.Frame(page)
         self.home_frame.pack(fill='both', expand=True)
 
         heading_label = ttk.Label(self.home_frame, text="HOSPITAL MANAGEMENT SYSTEM", font=("Helvetica", 24, "bold"))
@@ -219,7 +3558,7 @@ class HospitalGUI:
 
         appointment_button.config(menu=appointment_menu)
         appointment_button.pack(side=tk.LEFT, padx=5)
-        
+
         ttk.Button(button_frame, text="View Patient by ID", command=self.create_view_patients_frame).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Discharge Patient", command=self.create_discharge_patient_frame).pack(side=tk.LEFT, padx=5)
 
@@ -229,38 +3568,102 @@ class HospitalGUI:
         # Billing button
         ttk.Button(button_frame, text="Billing", command=self.create_billing_frame).pack(side=tk.LEFT,padx=5)
         ttk.Button(button_frame, text="View Staff", command=self.create_view_staff_frame).pack(side=tk.LEFT,padx=10)
-        # Start the photo slideshow
+
+        # Live numbers for the day, above the slideshow
+        dashboard_frame = ttk.Frame(self.home_frame)
+        dashboard_frame.pack(pady=(0, 10))
+        self.dashboard_labels = {}
+        for column, (name, caption) in enumerate((("appointments", "Appointments today"),
+                                                  ("patients_in_care", "Patients in care"),
+                                                  ("doctors_working", "Doctors with appointments today"))):
+            ttk.Label(dashboard_frame, text=caption, font=("Helvetica", 11)).grid(row=0, column=column, padx=20)
+            label = ttk.Label(dashboard_frame, text="-", font=("Helvetica", 18, "bold"))
+            label.grid(row=1, column=column, padx=20)
+            self.dashboard_labels[name] = label
+        self.dashboard_specializations = ttk.Label(dashboard_frame, font=("Helvetica", 10), wraplength=900,
+                                                   justify='center')
+        self.dashboard_specializations.grid(row=2, column=0, columnspan=3, pady=(5, 0))
+
+        # Label for the photo slideshow
         self.slideshow_label = tk.Label(self.home_frame)
         self.slideshow_label.pack(fill='both', expand=True)
+
+    # The home screen runs the slideshow and keeps the dashboard up to date
+    # while it is showing
+    def show_home(self):
+        self.start_slideshow()
+        self.refresh_dashboard()
+
+    def hide_home(self):
+        self.stop_slideshow()
+        if self.dashboard_after_id is not None:
+            self.root.after_cancel(self.dashboard_after_id)
+            self.dashboard_after_id = None
+
+    # Read the dashboard counters on a worker thread; the next refresh is
+    # scheduled once they are shown. Leaving the screen cancels the read.
+    def refresh_dashboard(self):
+        self.dashboard_after_id = None
+        self.db.submit(self.hospital.dashboard, on_done=self.show_dashboard, on_error=self.dashboard_failed,
+                       group="screen")
+
+    def show_dashboard(self, dashboard):
+        working = dashboard['doctors_working']
+        self.dashboard_labels['appointments'].configure(text=f"{dashboard['appointments']:,}")
+        self.dashboard_labels['patients_in_care'].configure(text=f"{dashboard['patients_in_care']:,}")
+        self.dashboard_labels['doctors_working'].configure(text=f"{sum(working.values()):,}")
+        self.dashboard_specializations.configure(text="   ".join(
+            f"{specialization}: {working.get(specialization, 0)} of {count}"
+            for specialization, count in sorted(dashboard['staff'].items())
+        ))
+        self.dashboard_after_id = self.root.after(DASHBOARD_REFRESH_MS, self.refresh_dashboard)
+
+    # A failed refresh is retried at the next interval rather than shown
+    def dashboard_failed(self, error):
+        logger.warning("Dashboard refresh failed: %s", error)
+        self.dashboard_after_id = self.root.after(DASHBOARD_REFRESH_MS, self.refresh_dashboard)
+
+    # Start the photo slideshow from the first picture
+    def start_slideshow(self):
         self.photo_index = 0
         self.show_slideshow()
 
+    # The slideshow only runs while the home screen is showing
+    def stop_slideshow(self):
+        if self.slideshow_after_id is not None:
+            self.root.after_cancel(self.slideshow_after_id)
+            self.slideshow_after_id = None
+
     def show_slideshow(self):
+        # Only one slideshow timer may be pending (the Home button restarts it)
+        self.stop_slideshow()
+        if self.slideshow_label is None or not self.slideshow_label.winfo_exists():
+            return
+
         if self.photo_index >= len(self.photo_files):
             self.photo_index = 0  # Reset index
 
         img_path = self.photo_files[self.photo_index]
         if os.path.exists(img_path):
-            img = Image.open(img_path)
-            img = img.resize((1200, 600), Image.LANCZOS)
+            img_tk = self.slideshow_cache.get(img_path)
+            if img_tk is None:
+                # Still being decoded in the background; check again shortly
+                self.slideshow_after_id = self.root.after(100, self.show_slideshow)
+                return
             self.photo_index += 1
-            img_tk = ImageTk.PhotoImage(img)
 
             self.slideshow_label.configure(image=img_tk)
             self.slideshow_label.image = img_tk  # Keep a reference to avoid garbage collection
 
             # Call this method again after 3 seconds
-            self.slideshow_label.after(3000, self.show_slideshow)  # Change image every 3 seconds
+            self.slideshow_after_id = self.root.after(3000, self.show_slideshow)  # Change image every 3 seconds
 
-    def clear_frame(self):
-        # Destroy all widgets from the root window (i.e., the main container)
-        for widget in self.root.winfo_children():
-            widget.destroy()
     def create_contact_us_frame(self):
-        self.clear_frame()  # Clear the current frame before creating a new one
+        self.screens.show('contact')
 
+    def build_contact_us_screen(self, page):
         # Create the contact us frame
-        self.contact_frame = ttk.Frame(self.root, padding=20)  # Attach to root window
+        self.contact_frame = ttk.Frame(page, padding=20)
         self.contact_frame.pack(fill='both', expand=True)
 
         # Add a title label for better visualization
@@ -286,22 +3689,27 @@ class HospitalGUI:
         back_button.pack(pady=20)
 
     def create_view_staff_frame(self):
-        self.clear_frame()  # Clear the current frame
+        self.screens.show('view_staff')
 
+    def build_view_staff_screen(self, page):
         # Create the staff viewing frame
-        staff_frame = ttk.Frame(self.root, padding=20)
+        staff_frame = ttk.Frame(page, padding=20)
         staff_frame.pack(fill='both', expand=True)
 
         # Title label with larger font
         ttk.Label(staff_frame, text="Staff Details", font=("Helvetica", 20, "bold")).pack(pady=10)
 
-        # Create a custom style for the Treeview to increase font size
-        style = ttk.Style()
-        style.configure("Treeview", font=("Times New Roman", 14))  # Set font for Treeview rows
-        style.configure("Treeview.Heading", font=("Times New Roman", 16, "bold"))  # Set font for Treeview headers
+        # Search by name, specialization or language as you type
+        search_frame = ttk.Frame(staff_frame)
+        search_frame.pack(fill='x', pady=5)
+        ttk.Label(search_frame, text="Search", font=("Helvetica", 12)).pack(side=tk.LEFT, padx=5)
+        search_entry = ttk.Entry(search_frame, width=40)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        self.staff_search = IncrementalSearch(search_entry, self.hospital.search_staff, self.show_staff_matches,
+                                              self.db, on_clear=self.load_staff, on_error=self.show_database_error)
 
         # Create a Treeview widget to display staff records
-        tree = ttk.Treeview(staff_frame, columns=("ID", "Name", "Age", "Gender", "Specialization", "Languages", "Mobile No", "Email", "Schedule"), show='headings')
+        tree = ttk.Treeview(staff_frame, columns=("ID", "Name", "Age", "Gender", "Specialization", "Languages", "Mobile No", "Email", "Schedule"), show='headings', style="Staff.Treeview")
 
         # Define the headings
         tree.heading("ID", text="ID")
@@ -330,28 +3738,81 @@ class HospitalGUI:
         tree.configure(yscrollcommand=scrollbar.set)
         scrollbar.pack(side="right", fill="y")
 
-        # Fetch staff details from the database
-        try:
-            staff_details = self.hospital.fetch_query('SELECT * FROM staff')
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to fetch staff details: {e}")
-            return
-
-        # Insert each staff member into the Treeview
-        for staff in staff_details:
-            tree.insert('', tk.END, values=staff)
+        # Loading progress and a way to stop a long listing
+        status_frame = ttk.Frame(staff_frame)
+        status_frame.pack(side="bottom", fill='x')
+        self.staff_status_label = ttk.Label(status_frame, text="Loading staff...", font=("Helvetica", 12))
+        self.staff_status_label.pack(side=tk.LEFT, padx=5)
+        self.staff_stop_button = ttk.Button(status_frame, text="Stop Loading", command=self.stop_staff_loading)
+        self.staff_stop_button.pack(side=tk.RIGHT, padx=5)
 
         # Pack the Treeview to expand and fill the frame
         tree.pack(fill='both', expand=True)
 
         # Back button to return to home
         ttk.Button(staff_frame, text="Back to Home", command=self.create_home_frame).pack(pady=20)
+        self.staff_tree = tree
+
+    # Fetch staff details page by page on a worker thread; each page is
+    # inserted into the Treeview as it arrives
+    def load_staff(self):
+        self.staff_search.reset()
+        self.staff_tree.delete(*self.staff_tree.get_children())
+        self.staff_loaded = 0
+        self.staff_status_label.configure(text="Loading staff...")
+        self.staff_stop_button.state(['!disabled'])
+        self.staff_task = self.db.submit(self.hospital.iter_staff_pages,
+                                         on_progress=self.add_staff_rows,
+                                         on_done=self.staff_loading_finished,
+                                         on_error=self.staff_loading_failed,
+                                         group="screen")
+
+    def add_staff_rows(self, rows):
+        for staff in rows:
+            self.staff_tree.insert('', tk.END, values=staff)
+        self.staff_loaded += len(rows)
+        self.staff_status_label.configure(text=f"Loading staff... {self.staff_loaded} loaded")
+
+    def staff_loading_finished(self, result):
+        self.staff_stop_button.state(['disabled'])
+        self.staff_status_label.configure(text=f"{self.staff_loaded} staff members")
+
+    def staff_loading_failed(self, error):
+        self.staff_stop_button.state(['disabled'])
+        self.staff_status_label.configure(text="Failed to load staff")
+        messagebox.showerror("Error", f"Failed to fetch staff details: {error}")
+
+    def stop_staff_loading(self):
+        self.staff_task.cancel()
+        self.staff_stop_button.state(['disabled'])
+        self.staff_status_label.configure(text=f"Stopped after {self.staff_loaded} staff members")
+
+    # Replace the listing with the staff members matching the search
+    def show_staff_matches(self, rows):
+        self.staff_task.cancel()
+        self.staff_stop_button.state(['disabled'])
+        self.staff_tree.delete(*self.staff_tree.get_children())
+        for staff in rows:
+            self.staff_tree.insert('', tk.END, values=staff)
+        self.staff_status_label.configure(text=f"{len(rows)} matching staff members")
+
+    # Report a failed background write
+    def show_database_error(self, error):
+        messagebox.showerror("Database Error", f"An error occurred: {error}")
+
+    # Empty the given entry fields and radio button variables of a reused form
+    def clear_form(self, entries=(), variables=()):
+        for entry in entries:
+            entry.delete(0, tk.END)
+        for variable in variables:
+            variable.set('')
 
     def create_billing_frame(self):
-        self.clear_frame()  # Clear the current frame
+        self.screens.show('billing')
 
+    def build_billing_screen(self, page):
         # Create the billing frame
-        billing_frame = ttk.Frame(self.root, padding=20)
+        billing_frame = ttk.Frame(page, padding=20)
         billing_frame.pack(fill='both', expand=True)
 
         # Billing form title
@@ -378,6 +3839,9 @@ class HospitalGUI:
         # Back button
         ttk.Button(billing_frame, text="Back to Home", command=self.create_home_frame).pack(pady=20)
 
+    def reset_billing_form(self):
+        self.clear_form([self.patient_id_entry, self.services_entry, self.amount_entry])
+
     def submit_billing(self):
         # Retrieve data from entries
         patient_id = self.patient_id_entry.get()
@@ -390,51 +3854,80 @@ class HospitalGUI:
             return
 
         try:
-            # Attempt to convert amount_due to a float to ensure it’s a valid number
-            amount_due = float(amount_due)
+            patient_id = int(patient_id)
         except ValueError:
-            messagebox.showerror("Error", "Please enter a valid amount for Total Amount Due.")
+            messagebox.showerror("Error", "Patient ID must be a valid number.")
             return
 
-        # Calculate taxes
-        cst_rate = 0.02  # 2% CST
-        gst_rate = 0.18  # 18% GST
+        try:
+            # Amounts are kept in whole cents so taxes never pick up float error
+            amount_due = to_minor_units(amount_due)
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid amount for Total Amount Due.")
+            return
 
-        cst = amount_due * cst_rate
-        gst = amount_due * gst_rate
-        total_amount = amount_due + cst + gst
+        self.db.submit(self.bill_patient, patient_id, services, amount_due,
+                       on_done=self.create_receipt_frame, on_error=self.show_request_error)
 
-        # Display receipt
-        self.create_receipt_frame(patient_id, services, amount_due, cst, gst, total_amount)
+    # Runs on a worker thread: store the bill, invoice it with the current
+    # tax rates and read it back for the receipt
+    def bill_patient(self, patient_id, services, amount_due):
+        bill_id = self.hospital.create_bill(patient_id, [(services, 1, amount_due)])
+        self.hospital.invoice_bills([bill_id])
+        self.hospital.flush()
+        return self.hospital.fetch_bill(bill_id)
 
-    def create_receipt_frame(self, patient_id, services, amount_due, cst, gst, total_amount):
-        self.clear_frame()  # Clear the current frame
+    def create_receipt_frame(self, bill):
+        self.screens.show('receipt', bill)
 
+    def build_receipt_screen(self, page):
         # Create the receipt frame
-        receipt_frame = ttk.Frame(self.root, padding=20)
+        receipt_frame = ttk.Frame(page, padding=20)
         receipt_frame.pack(fill='both', expand=True)
 
         # Receipt title
         ttk.Label(receipt_frame, text="Billing Receipt", font=("Helvetica", 20, "bold")).pack(pady=10)
 
-        # Display billing information
-        ttk.Label(receipt_frame, text=f"Patient ID: {patient_id}", font=("Helvetica", 12)).pack(pady=5)
-        ttk.Label(receipt_frame, text=f"Services Rendered: {services}", font=("Helvetica", 12)).pack(pady=5)
-        ttk.Label(receipt_frame, text=f"Total Amount Due: ${amount_due:.2f}", font=("Helvetica", 12)).pack(pady=5)
-        ttk.Label(receipt_frame, text=f"CST (2%): ${cst:.2f}", font=("Helvetica", 12)).pack(pady=5)
-        ttk.Label(receipt_frame, text=f"GST (18%): ${gst:.2f}", font=("Helvetica", 12)).pack(pady=5)
-        ttk.Label(receipt_frame, text=f"Total Amount Payable: ${total_amount:.2f}", font=("Helvetica", 12, "bold")).pack(pady=10)
+        # Lines of billing information, filled in by fill_receipt (the
+        # number of tax lines depends on the rates in force)
+        self.receipt_lines = ttk.Frame(receipt_frame)
+        self.receipt_lines.pack()
 
         # Back button to return to home
         ttk.Button(receipt_frame, text="Back to Home", command=self.create_home_frame).pack(pady=20)
 
+    # Display billing information
+    def fill_receipt(self, bill):
+        (bill_id, patient_id, created_ts, status, invoiced_ts, subtotal, tax, total), items, taxes = bill
+        lines = [
+            f"Bill No: {bill_id}",
+            f"Patient ID: {patient_id}",
+            f"Services Rendered: {', '.join(description for description, quantity, unit_amount in items)}",
+            f"Total Amount Due: ${format_money(subtotal)}",
+        ]
+        lines += [f"{code} ({format_rate(rate_bp)}): ${format_money(amount)}" for code, rate_bp, amount in taxes]
+
+        for label in self.receipt_lines.winfo_children():
+            label.destroy()
+        for text in lines:
+            ttk.Label(self.receipt_lines, text=text, font=("Helvetica", 12)).pack(pady=5)
+        ttk.Label(self.receipt_lines, text=f"Total Amount Payable: ${format_money(total)}",
+                  font=("Helvetica", 12, "bold")).pack(pady=10)
+
+    # Report a failed background request: ValueErrors carry a message meant
+    # for the user, anything else is a database problem
+    def show_request_error(self, error):
+        if isinstance(error, ValueError):
+            messagebox.showerror("Error", str(error))
+        else:
+            self.show_database_error(error)
 
     def open_new_patient_frame(self):
-        # Clear any existing frames
-        self.clear_frame()
+        self.screens.show('new_patient')
 
+    def build_new_patient_screen(self, page):
         # Create a parent frame for centering the registration form
-        self.new_patient_window = ttk.Frame(self.root, padding=20)
+        self.new_patient_window = ttk.Frame(page, padding=20, style='Form.TFrame')
         self.new_patient_window.pack(pady=20)  # Add vertical padding to center
 
         # Configure grid layout to center the form
@@ -443,14 +3936,6 @@ class HospitalGUI:
         for j in range(2):  # For 2 columns
             self.new_patient_window.grid_columnconfigure(j, weight=1)
 
-        # Set a background color for the frame and larger font size for labels, entry fields, and buttons
-        style = ttk.Style()
-        style.configure('TFrame', background='#f0f0f0')  # Light gray background
-        style.configure('TLabel', font=("Helvetica", 14))  # Set font size for labels
-        style.configure('TEntry', font=("Helvetica", 14))  # Set font size for entry fields
-        style.configure('TButton', font=("Helvetica", 14))  # Set font size for buttons
-        self.new_patient_window.configure(style='TFrame')
-
         # Create form title with larger font
         title_label = ttk.Label(self.new_patient_window, text="New Patient Registration", font=("Helvetica", 24, "bold"))
         title_label.grid(row=0, column=0, columnspan=2, pady=(10, 20))
@@ -488,10 +3973,14 @@ class HospitalGUI:
         self.patient_mobile_no_entry.grid(row=8, column=1, pady=5)
 
         # Register button
-        ttk.Button(self.new_patient_window, text="Register", command=self.register_patient).grid(row=9, column=0, pady=(10, 0))
+        ttk.Button(self.new_patient_window, text="Register", command=self.register_patient, style='Form.TButton').grid(row=9, column=0, pady=(10, 0))
 
         # Back button
-        ttk.Button(self.new_patient_window, text="Back to Home", command=self.return_to_home).grid(row=9, column=1, pady=(10, 0))
+        ttk.Button(self.new_patient_window, text="Back to Home", command=self.return_to_home, style='Form.TButton').grid(row=9, column=1, pady=(10, 0))
+
+    def reset_patient_form(self):
+        self.clear_form([self.patient_name_entry, self.patient_dob_entry, self.patient_problem_entry,
+                         self.patient_mobile_no_entry], [self.patient_gender_var])
 
     def register_patient(self):
         name = self.patient_name_entry.get()
@@ -501,40 +3990,43 @@ class HospitalGUI:
         mobile_no = self.patient_mobile_no_entry.get()
 
         if name and dob and gender and problem and mobile_no:
-            # Insert the new patient into the database
-            self.hospital.execute_query(
-                'INSERT INTO patients (name, dob, gender, problem, mobile_no) VALUES (?, ?, ?, ?, ?)',
-                (name, dob, gender, problem, mobile_no)
-            )
-
-            # Fetch the last inserted patient ID
-            patient_id = self.hospital.fetch_query('SELECT last_insert_rowid()')[0][0]
-
-            messagebox.showinfo("Success", f"Patient registered successfully! Patient ID: {patient_id}")
-            self.return_to_home()
+            try:
+                dob, _ = normalize_dob(dob)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            # Insert the new patient into the database on a worker thread
+            self.db.submit(self.insert_patient, name, dob, gender, problem, mobile_no,
+                           on_done=self.patient_registered, on_error=self.show_database_error)
         else:
             messagebox.showerror("Error", "Please fill in all fields.")
+
+    # Runs on a worker thread; the write is committed before the ID is
+    # shown to the user
+    def insert_patient(self, name, dob, gender, problem, mobile_no):
+        patient_id = self.hospital.add_patient(name, dob, gender, problem, mobile_no)
+        self.hospital.flush()
+        return patient_id
+
+    def patient_registered(self, patient_id):
+        messagebox.showinfo("Success", f"Patient registered successfully! Patient ID: {patient_id}")
+        self.return_to_home()
     def return_to_home(self):
-        self.clear_frame()
         self.create_home_frame()
     def create_appointments_frame(self):
-        self.clear_frame()
+        self.screens.show('book_appointment')
 
+    def build_appointments_screen(self, page):
         # Create a parent frame for centering the appointment form
-        self.appointment_frame = ttk.Frame(self.root, padding=20)
+        self.appointment_frame = ttk.Frame(page, padding=20, style='Form.TFrame')
         self.appointment_frame.pack(expand=True)
 
         # Configure grid layout for better alignment
-        for i in range(6):  # 6 rows (fields + buttons)
+        for i in range(11):  # 11 rows (fields, free slots + buttons)
             self.appointment_frame.grid_rowconfigure(i, weight=1)
         for j in range(2):  # 2 columns (label + entry)
             self.appointment_frame.grid_columnconfigure(j, weight=1)
 
-        # Set a background color for the frame
-        style = ttk.Style()
-        style.configure('TFrame', background='#f0f0f0')  # Light gray background
-        self.appointment_frame.configure(style='TFrame')
-
         # Create form title
         title_label = ttk.Label(self.appointment_frame, text="Book Appointment", font=("Helvetica", 20, "bold"))
         title_label.grid(row=0, column=0, columnspan=2, pady=(10, 20))
@@ -544,41 +4036,116 @@ class HospitalGUI:
         self.appointment_patient_id_entry = ttk.Entry(self.appointment_frame)
         self.appointment_patient_id_entry.grid(row=1, column=1, pady=5)
 
+        # Doctor (a staff member's ID)
+        ttk.Label(self.appointment_frame, text="Doctor (Staff ID)").grid(row=2, column=0, sticky='e', padx=10, pady=5)
+        self.appointment_doctor_id_entry = ttk.Entry(self.appointment_frame)
+        self.appointment_doctor_id_entry.grid(row=2, column=1, pady=5)
+
         # Appointment Date
-        ttk.Label(self.appointment_frame, text="Appointment Date (YYYY-MM-DD)").grid(row=2, column=0, sticky='e', padx=10, pady=5)
+        ttk.Label(self.appointment_frame, text="Appointment Date (YYYY-MM-DD)").grid(row=3, column=0, sticky='e', padx=10, pady=5)
         self.appointment_date_entry = ttk.Entry(self.appointment_frame)
-        self.appointment_date_entry.grid(row=2, column=1, pady=5)
+        self.appointment_date_entry.grid(row=3, column=1, pady=5)
 
         # Appointment Time
-        ttk.Label(self.appointment_frame, text="Appointment Time (HH:MM)").grid(row=3, column=0, sticky='e', padx=10, pady=5)
+        ttk.Label(self.appointment_frame, text="Appointment Time (HH:MM)").grid(row=4, column=0, sticky='e', padx=10, pady=5)
         self.appointment_time_entry = ttk.Entry(self.appointment_frame)
-        self.appointment_time_entry.grid(row=3, column=1, pady=5)
+        self.appointment_time_entry.grid(row=4, column=1, pady=5)
+
+        # Appointment length
+        ttk.Label(self.appointment_frame, text="Duration (minutes)").grid(row=5, column=0, sticky='e', padx=10, pady=5)
+        self.appointment_duration_entry = ttk.Entry(self.appointment_frame)
+        self.appointment_duration_entry.grid(row=5, column=1, pady=5)
 
         # Appointment Details
-        ttk.Label(self.appointment_frame, text="Details").grid(row=4, column=0, sticky='e', padx=10, pady=5)
+        ttk.Label(self.appointment_frame, text="Details").grid(row=6, column=0, sticky='e', padx=10, pady=5)
         self.appointment_details_entry = ttk.Entry(self.appointment_frame)
-        self.appointment_details_entry.grid(row=4, column=1, pady=5)
+        self.appointment_details_entry.grid(row=6, column=1, pady=5)
+
+        # The doctor's next free slots; picking one fills in the date and time
+        slots_button = ttk.Button(self.appointment_frame, text="Find Free Slots", command=self.find_free_slots)
+        slots_button.grid(row=7, column=0, columnspan=2, pady=5)
+        self.appointment_slots_list = tk.Listbox(self.appointment_frame, height=5, font=("Helvetica", 12))
+        self.appointment_slots_list.grid(row=8, column=0, columnspan=2, pady=5)
+        self.appointment_slots_list.bind('<<ListboxSelect>>', self.pick_free_slot)
+        self.appointment_slots = []
 
         # Buttons for actions
         book_button = ttk.Button(self.appointment_frame, text="Book Appointment", command=self.book_appointment)
-        book_button.grid(row=5, column=0, columnspan=2, pady=10)
+        book_button.grid(row=9, column=0, columnspan=2, pady=10)
 
         # Back button
         back_button = ttk.Button(self.appointment_frame, text="Back", command=self.return_to_home)
-        back_button.grid(row=6, column=0, columnspan=2, pady=5)
+        back_button.grid(row=10, column=0, columnspan=2, pady=5)
 
         # Add padding to make the form visually appealing
         for widget in self.appointment_frame.winfo_children():
             widget.grid_configure(padx=10, pady=5)
 
+    def reset_appointment_form(self):
+        self.clear_form([self.appointment_patient_id_entry, self.appointment_doctor_id_entry,
+                         self.appointment_date_entry, self.appointment_time_entry,
+                         self.appointment_duration_entry, self.appointment_details_entry])
+        self.appointment_duration_entry.insert(0, str(self.hospital.scheduler.slot.seconds // 60))
+        self.show_free_slots([])
+
+    # Read the doctor, start and duration from the form. Shows an error and
+    # returns None if any of them is invalid; a blank date/time means now.
+    def read_appointment_slot(self, need_time=True):
+        try:
+            doctor_id = int(self.appointment_doctor_id_entry.get())
+        except ValueError:
+            messagebox.showerror("Error", "Doctor ID must be a valid number.")
+            return None
+
+        date = self.appointment_date_entry.get().strip()
+        time = self.appointment_time_entry.get().strip()
+        if not need_time and not (date and time):
+            start = datetime.datetime.now()
+        else:
+            try:
+                start = datetime.datetime.combine(parse_date(date), parse_time(time))
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return None
+
+        try:
+            duration = datetime.timedelta(minutes=int(self.appointment_duration_entry.get()))
+        except ValueError:
+            messagebox.showerror("Error", "Duration must be a whole number of minutes.")
+            return None
+        if duration <= datetime.timedelta(0):
+            messagebox.showerror("Error", "Duration must be a whole number of minutes.")
+            return None
+        return doctor_id, start, duration
+
+    def find_free_slots(self):
+        slot = self.read_appointment_slot(need_time=False)
+        if slot is None:
+            return
+        doctor_id, start, duration = slot
+        self.db.submit(self.hospital.scheduler.free_slots, doctor_id, start, 5, duration,
+                       on_done=self.show_free_slots, on_error=self.show_request_error, group="screen")
+
+    def show_free_slots(self, slots):
+        self.appointment_slots = slots
+        self.appointment_slots_list.delete(0, tk.END)
+        for start, end in slots:
+            self.appointment_slots_list.insert(tk.END, f"{start:%a %Y-%m-%d %H:%M} - {end:%H:%M}")
+
+    def pick_free_slot(self, event=None):
+        selection = self.appointment_slots_list.curselection()
+        if not selection:
+            return
+        start, end = self.appointment_slots[selection[0]]
+        self.clear_form([self.appointment_date_entry, self.appointment_time_entry])
+        self.appointment_date_entry.insert(0, start.strftime('%Y-%m-%d'))
+        self.appointment_time_entry.insert(0, start.strftime('%H:%M'))
 
     def book_appointment(self):
         patient_id = self.appointment_patient_id_entry.get()
-        date = self.appointment_date_entry.get()
-        time = self.appointment_time_entry.get()
         details = self.appointment_details_entry.get()
 
-        if not (patient_id and date and time and details):
+        if not (patient_id and self.appointment_doctor_id_entry.get() and details):
             messagebox.showerror("Error", "Please fill in all fields.")
             return
 
@@ -588,49 +4155,47 @@ class HospitalGUI:
             messagebox.showerror("Error", "Patient ID must be a valid number.")
             return
 
-        # Check if patient ID exists in the database
-        patient_exists = self.hospital.fetch_query('SELECT id FROM patients WHERE id = ?', (patient_id,))
-        if not patient_exists:
-            messagebox.showerror("Error", "Patient ID does not exist.")
+        slot = self.read_appointment_slot()
+        if slot is None:
             return
+        doctor_id, start, duration = slot
+        self.db.submit(self.insert_appointment, patient_id, doctor_id, start, details, duration,
+                       on_done=self.appointment_booked, on_error=self.show_request_error)
+
+    # Runs on a worker thread. The scheduler rejects unknown patients or
+    # doctors and times the doctor is not free with a ValueError.
+    def insert_appointment(self, patient_id, doctor_id, start, details, duration):
+        appointment_id = self.hospital.scheduler.book(patient_id, doctor_id, start, details, duration)
+        self.hospital.flush()
+        return appointment_id
+
+    def appointment_booked(self, appointment_id):
+        messagebox.showinfo("Success", f"Appointment {appointment_id} booked successfully!")
+        self.return_to_home()
 
-        try:
-            self.hospital.execute_query(
-                'INSERT INTO appointments (patient_id, date, time, details) VALUES (?, ?, ?, ?)', 
-                (patient_id, date, time, details)
-            )
-            messagebox.showinfo("Success", "Appointment booked successfully!")
-            self.return_to_home()
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"An error occurred: {e}")
-                
     def create_view_appointments_frame(self):
-        self.clear_frame()
+        self.screens.show('view_appointments')
 
+    def build_view_appointments_screen(self, page):
         # Create a frame for the view appointments section
-        self.view_appointments_frame = ttk.Frame(self.root, padding=20)
+        self.view_appointments_frame = ttk.Frame(page, padding=20)
         self.view_appointments_frame.pack(fill='both', expand=True)
 
         # Title label with larger font
         ttk.Label(self.view_appointments_frame, text="View Appointments", font=("Helvetica", 20, "bold")).pack(pady=(10, 20))
 
-        # Create a custom style for the Treeview to increase font size
-        style = ttk.Style()
-        style.configure("Treeview", font=("Helvetica", 14))  # Set font for Treeview rows
-        style.configure("Treeview.Heading", font=("Times New Roman", 16, "bold"))  # Set font for Treeview headers
-
-        # Fetch appointments from the database
-        appointments = self.hospital.fetch_query('SELECT * FROM appointments')
-
         # Create a Treeview widget to display the appointments
-        tree = ttk.Treeview(self.view_appointments_frame, columns=("ID", "Patient ID", "Date", "Time", "Details"), show='headings')
-        
+        table_frame = ttk.Frame(self.view_appointments_frame)
+        table_frame.pack(fill='both', expand=True, pady=(0, 20))
+        tree = ttk.Treeview(table_frame, columns=("ID", "Patient ID", "Date", "Time", "Details", "Doctor"), show='headings', style="Appointments.Treeview")
+
         # Define the headings
         tree.heading("ID", text="ID")
         tree.heading("Patient ID", text="Patient ID")
         tree.heading("Date", text="Date")
         tree.heading("Time", text="Time")
         tree.heading("Details", text="Details")
+        tree.heading("Doctor", text="Doctor ID")
 
         # Set column widths and center the text in each column
         tree.column("ID", width=50, anchor="center")
@@ -638,13 +4203,20 @@ class HospitalGUI:
         tree.column("Date", width=100, anchor="center")
         tree.column("Time", width=100, anchor="center")
         tree.column("Details", width=200, anchor="center")
+        tree.column("Doctor", width=100, anchor="center")
 
-        # Insert each appointment into the Treeview
-        for appointment in appointments:
-            tree.insert('', tk.END, values=appointment)
+        # Add a vertical scrollbar
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical")
+        scrollbar.pack(side="right", fill="y")
 
         # Pack the Treeview and make it expandable
-        tree.pack(fill='both', expand=True, pady=(0, 20))
+        tree.pack(fill='both', expand=True)
+
+        # Only the visible window of appointments is kept in the Treeview;
+        # further pages are fetched from the database as the user scrolls
+        self.appointments_pager = PagedTreeview(tree, scrollbar, self.hospital.fetch_appointments_page,
+                                                executor=self.db, group="screen",
+                                                on_error=self.show_database_error)
 
         # Create a separate frame for the Back button
         button_frame = ttk.Frame(self.view_appointments_frame)
@@ -654,11 +4226,15 @@ class HospitalGUI:
         back_button = ttk.Button(button_frame, text="Back", command=self.return_to_home)
         back_button.pack(pady=10)  # Add some padding around the button
 
-
+    # Reload from the first page every time the listing is opened
+    def load_appointments(self):
+        self.appointments_pager.load()
 
     def create_cancel_appointments_frame(self):
-        self.clear_frame()
-        self.cancel_appointments_frame = ttk.Frame(self.root)
+        self.screens.show('cancel_appointment')
+
+    def build_cancel_appointments_screen(self, page):
+        self.cancel_appointments_frame = ttk.Frame(page)
         self.cancel_appointments_frame.pack(fill='both', expand=True)
 
         ttk.Label(self.cancel_appointments_frame, text="Cancel Appointment", font=("Helvetica", 16, "bold")).pack(pady=10)
@@ -670,6 +4246,9 @@ class HospitalGUI:
         ttk.Button(self.cancel_appointments_frame, text="Cancel Appointment", command=self.cancel_appointment).pack(pady=5)
         ttk.Button(self.cancel_appointments_frame, text="Back", command=self.return_to_home).pack(pady=5)
 
+    def reset_cancel_form(self):
+        self.clear_form([self.cancel_appointment_id_entry])
+
     def cancel_appointment(self):
         appointment_id = self.cancel_appointment_id_entry.get()
 
@@ -683,34 +4262,124 @@ class HospitalGUI:
             messagebox.showerror("Error", "Appointment ID must be a valid number.")
             return
 
-        try:
-            self.hospital.execute_query('DELETE FROM appointments WHERE id = ?', (appointment_id,))
-            messagebox.showinfo("Success", "Appointment cancelled successfully!")
-            self.return_to_home()
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"An error occurred: {e}")
+        self.db.submit(self.delete_appointment, appointment_id,
+                       on_done=self.appointment_cancelled, on_error=self.show_database_error)
 
-    def clear_frame(self):
-        # Clear all widgets from the current frame
-        for widget in self.root.winfo_children():
-            widget.destroy()
+    # Runs on a worker thread; the scheduler frees the doctor's slot
+    def delete_appointment(self, appointment_id):
+        cancelled = self.hospital.scheduler.cancel(appointment_id)
+        self.hospital.flush()
+        return cancelled
+
+    def appointment_cancelled(self, cancelled):
+        if not cancelled:
+            messagebox.showerror("Error", "Appointment ID does not exist.")
+            return
+        messagebox.showinfo("Success", "Appointment cancelled successfully!")
+        self.return_to_home()
 
     def create_view_patients_frame(self):
-        self.clear_frame()
-        self.view_patients_frame = ttk.Frame(self.root, padding=20)
+        self.screens.show('view_patient')
+
+    def build_view_patients_screen(self, page):
+        self.view_patients_frame = ttk.Frame(page, padding=20)
         self.view_patients_frame.pack(fill='both', expand=True)
 
+        # The screen switches between the search form and the details panel
+        self.patient_search_frame = ttk.Frame(self.view_patients_frame)
+
         # Label for the title
-        ttk.Label(self.view_patients_frame, text="View Patients by ID", font=("Helvetica", 16, "bold")).pack(pady=10)
+        ttk.Label(self.patient_search_frame, text="View Patients by ID", font=("Helvetica", 16, "bold")).pack(pady=10)
 
         # Input for Patient ID
-        ttk.Label(self.view_patients_frame, text="Patient ID").pack(pady=5)
-        self.view_patient_id_entry = ttk.Entry(self.view_patients_frame)
+        ttk.Label(self.patient_search_frame, text="Patient ID").pack(pady=5)
+        self.view_patient_id_entry = ttk.Entry(self.patient_search_frame)
         self.view_patient_id_entry.pack(pady=5)
 
         # Button to view patient
-        ttk.Button(self.view_patients_frame, text="View Patient", command=self.view_patient).pack(pady=5)
-        ttk.Button(self.view_patients_frame, text="Back", command=self.return_to_home).pack(pady=5)
+        ttk.Button(self.patient_search_frame, text="View Patient", command=self.view_patient).pack(pady=5)
+
+        # Or find the patient by name, problem or mobile number as you type;
+        # double-click (or Enter on) a match to open it
+        ttk.Label(self.patient_search_frame, text="Search by name, problem or mobile number").pack(pady=5)
+        search_entry = ttk.Entry(self.patient_search_frame, width=40)
+        search_entry.pack(pady=5)
+        self.patient_results = ttk.Treeview(self.patient_search_frame, columns=("ID", "Name", "Date of Birth", "Problem", "Mobile No"),
+                                            show='headings', height=8)
+        for column, width in (("ID", 60), ("Name", 200), ("Date of Birth", 120), ("Problem", 200), ("Mobile No", 120)):
+            self.patient_results.heading(column, text=column)
+            self.patient_results.column(column, width=width, anchor="center")
+        self.patient_results.pack(pady=5)
+        self.patient_results.bind('<Double-1>', self.open_patient_match)
+        self.patient_results.bind('<Return>', self.open_patient_match)
+        self.patient_matches = {}
+        self.patient_search = IncrementalSearch(search_entry, self.hospital.search_patients, self.show_patient_matches,
+                                                self.db, on_clear=self.clear_patient_matches,
+                                                on_error=self.show_database_error)
+
+        ttk.Button(self.patient_search_frame, text="Back", command=self.return_to_home).pack(pady=5)
+
+        # Create a frame for displaying patient details
+        details_frame = ttk.Frame(self.view_patients_frame, padding=20, relief='solid', borderwidth=1)
+        self.patient_details_frame = details_frame
+
+        # Set the background color for the details frame
+        details_frame.configure(style='TFrame')
+
+        # Create a label for the header
+        ttk.Label(details_frame, text="Patient Details", font=("Helvetica", 18, "bold")).grid(row=0, column=0, columnspan=2, pady=(0, 10))
+
+        # Create labels for patient information with increased font size
+        self.patient_detail_labels = []
+        for row, caption in enumerate(["Patient ID:", "Name:", "Date of Birth:", "Address:", "Contact:"], start=1):
+            ttk.Label(details_frame, text=caption, font=("Helvetica", 12)).grid(row=row, column=0, sticky='w', pady=5)
+            value_label = ttk.Label(details_frame, font=("Helvetica", 12))
+            value_label.grid(row=row, column=1, sticky='w', pady=5)
+            self.patient_detail_labels.append(value_label)
+
+        # The patient's appointments and bills, newest first
+        ttk.Label(details_frame, text="Timeline", font=("Helvetica", 14, "bold")).grid(row=6, column=0, columnspan=2, sticky='w', pady=(15, 5))
+        timeline_frame = ttk.Frame(details_frame)
+        timeline_frame.grid(row=7, column=0, columnspan=2, sticky='nsew')
+        details_frame.grid_rowconfigure(7, weight=1)
+        details_frame.grid_columnconfigure(1, weight=1)
+        columns = (("Date", 100), ("Time", 70), ("Type", 100), ("Details", 220), ("Doctor", 150), ("Status", 90), ("Amount", 100))
+        timeline = ttk.Treeview(timeline_frame, columns=[column for column, width in columns], show='headings', height=10)
+        for column, width in columns:
+            timeline.heading(column, text=column)
+            timeline.column(column, width=width, anchor="center")
+        timeline_scrollbar = ttk.Scrollbar(timeline_frame, orient="vertical")
+        timeline_scrollbar.pack(side="right", fill="y")
+        timeline.pack(fill='both', expand=True)
+        self.patient_timeline = TimelinePager(timeline, timeline_scrollbar, self.hospital.fetch_patient_timeline,
+                                              self.db, on_error=self.show_database_error)
+
+        # Back button to return to the previous screen
+        ttk.Button(details_frame, text="Back", command=self.create_view_patients_frame).grid(row=8, column=0, columnspan=2, pady=(20, 0))
+
+    # Show an empty search form
+    def reset_view_patient(self):
+        self.patient_details_frame.pack_forget()
+        self.patient_search_frame.pack(fill='both', expand=True)
+        self.clear_form([self.view_patient_id_entry])
+        self.patient_search.reset()
+        self.clear_patient_matches()
+
+    def show_patient_matches(self, rows):
+        self.clear_patient_matches()
+        for patient in rows:
+            iid = str(patient[0])
+            self.patient_matches[iid] = patient
+            self.patient_results.insert('', tk.END, iid=iid, values=(patient[0], patient[1], patient[2], patient[4], patient[5]))
+
+    def clear_patient_matches(self):
+        self.patient_results.delete(*self.patient_results.get_children())
+        self.patient_matches = {}
+
+    def open_patient_match(self, event=None):
+        selection = self.patient_results.selection()
+        if selection:
+            self.display_patient_details(self.patient_matches[selection[0]])
 
     def view_patient(self):
         patient_id = self.view_patient_id_entry.get()
@@ -725,51 +4394,33 @@ class HospitalGUI:
             messagebox.showerror("Error", "Patient ID must be a valid number.")
             return
 
-        patient = self.hospital.fetch_query('SELECT * FROM patients WHERE id = ?', (patient_id,))
+        # The record, usually from the cache, and the first page of the timeline
+        self.db.submit(self.hospital.fetch_patient_timeline, patient_id, None, self.patient_timeline.page_size,
+                       on_done=self.patient_fetched, on_error=self.show_database_error, group="screen")
 
-        if patient:
-            self.display_patient_details(patient[0])
+    def patient_fetched(self, page):
+        patient, events = page
+        if patient and patient[6] is None:
+            self.display_patient_details(patient, page)
         else:
             messagebox.showerror("Error", "Patient not found.")
 
-    def display_patient_details(self, patient_info):
-        # Clear existing widgets in the frame
-        for widget in self.view_patients_frame.winfo_children():
-            widget.destroy()
-
-        # Create a new frame for displaying patient details
-        details_frame = ttk.Frame(self.view_patients_frame, padding=20, relief='solid', borderwidth=1)
-        details_frame.pack(fill='both', expand=True, padx=50, pady=50)  # Adding padding around the frame
-
-        # Set the background color for the details frame
-        details_frame.configure(style='TFrame')
-
-        # Create a label for the header
-        ttk.Label(details_frame, text="Patient Details", font=("Helvetica", 18, "bold")).grid(row=0, column=0, columnspan=2, pady=(0, 10))
-
-        # Create labels for patient information with increased font size
-        ttk.Label(details_frame, text="Patient ID:", font=("Helvetica", 12)).grid(row=1, column=0, sticky='w', pady=5)
-        ttk.Label(details_frame, text=patient_info[0], font=("Helvetica", 12)).grid(row=1, column=1, sticky='w', pady=5)
-
-        ttk.Label(details_frame, text="Name:", font=("Helvetica", 12)).grid(row=2, column=0, sticky='w', pady=5)
-        ttk.Label(details_frame, text=patient_info[1], font=("Helvetica", 12)).grid(row=2, column=1, sticky='w', pady=5)
-
-        ttk.Label(details_frame, text="Date of Birth:", font=("Helvetica", 12)).grid(row=3, column=0, sticky='w', pady=5)
-        ttk.Label(details_frame, text=patient_info[2], font=("Helvetica", 12)).grid(row=3, column=1, sticky='w', pady=5)
-
-        ttk.Label(details_frame, text="Address:", font=("Helvetica", 12)).grid(row=4, column=0, sticky='w', pady=5)
-        ttk.Label(details_frame, text=patient_info[3], font=("Helvetica", 12)).grid(row=4, column=1, sticky='w', pady=5)
-
-        ttk.Label(details_frame, text="Contact:", font=("Helvetica", 12)).grid(row=5, column=0, sticky='w', pady=5)
-        ttk.Label(details_frame, text=patient_info[4], font=("Helvetica", 12)).grid(row=5, column=1, sticky='w', pady=5)
-
-        # Back button to return to the previous screen
-        ttk.Button(details_frame, text="Back", command=self.create_view_patients_frame).grid(row=6, column=0, columnspan=2, pady=(20, 0))
+    # timeline is the first page of the patient's timeline, if already
+    # fetched; otherwise it is loaded here
+    def display_patient_details(self, patient_info, timeline=None):
+        # Swap the search form for the details panel
+        self.patient_search_frame.pack_forget()
+        self.patient_details_frame.pack(fill='both', expand=True, padx=50, pady=50)  # Adding padding around the frame
 
+        for label, value in zip(self.patient_detail_labels, patient_info):
+            label.configure(text=value)
+        self.patient_timeline.load(patient_info[0], timeline)
 
     def create_discharge_patient_frame(self):
-        self.clear_frame()
-        self.discharge_patient_frame = ttk.Frame(self.root)
+        self.screens.show('discharge_patient')
+
+    def build_discharge_patient_screen(self, page):
+        self.discharge_patient_frame = ttk.Frame(page)
         self.discharge_patient_frame.pack(fill='both', expand=True)
 
         ttk.Label(self.discharge_patient_frame, text="Discharge Patient", font=("Helvetica", 16, "bold")).pack(pady=10)
@@ -781,6 +4432,9 @@ class HospitalGUI:
         ttk.Button(self.discharge_patient_frame, text="Discharge", command=self.discharge_patient).pack(pady=5)
         ttk.Button(self.discharge_patient_frame, text="Back", command=self.return_to_home).pack(pady=5)
 
+    def reset_discharge_form(self):
+        self.clear_form([self.discharge_patient_id_entry])
+
     def discharge_patient(self):
         patient_id = self.discharge_patient_id_entry.get()
 
@@ -794,19 +4448,28 @@ class HospitalGUI:
             messagebox.showerror("Error", "Patient ID must be a valid number.")
             return
 
-        try:
-            self.hospital.execute_query('DELETE FROM patients WHERE id = ?', (patient_id,))
-            messagebox.showinfo("Success", "Patient discharged successfully!")
-            self.return_to_home()
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"An error occurred: {e}")
+        self.db.submit(self.discharge, patient_id,
+                       on_done=self.patient_discharged, on_error=self.show_database_error)
+
+    # Runs on a worker thread
+    def discharge(self, patient_id):
+        discharged = self.hospital.discharge_patient(patient_id)
+        self.hospital.flush()
+        return discharged
+
+    def patient_discharged(self, discharged):
+        if not discharged:
+            messagebox.showerror("Error", "Patient ID does not exist.")
+            return
+        messagebox.showinfo("Success", "Patient discharged successfully!")
+        self.return_to_home()
 
     def open_new_staff_frame(self):
-        # Clear any existing frames
-        self.clear_frame()
+        self.screens.show('new_staff')
 
+    def build_new_staff_screen(self, page):
         # Create a parent frame for centering the registration form
-        self.new_staff_window = ttk.Frame(self.root, padding=20)
+        self.new_staff_window = ttk.Frame(page, padding=20, style='Form.TFrame')
         self.new_staff_window.pack(pady=20)  # Add vertical padding to center
 
         # Configure grid layout to center the form
@@ -815,14 +4478,6 @@ class HospitalGUI:
         for j in range(2):  # For 2 columns
             self.new_staff_window.grid_columnconfigure(j, weight=1)
 
-        # Set a background color for the frame
-        style = ttk.Style()
-        style.configure('TFrame', background='#f0f0f0')  # Light gray background
-        style.configure('TLabel', font=("Helvetica", 14))  # Set font size for labels
-        style.configure('TEntry', font=("Helvetica", 14))  # Set font size for entry fields
-        style.configure('TButton', font=("Helvetica", 14))  # Set font size for buttons
-        self.new_staff_window.configure(style='TFrame')
-
         # Create form title with larger font
         title_label = ttk.Label(self.new_staff_window, text="New Staff Registration", font=("Helvetica", 18, "bold"))
         title_label.grid(row=0, column=0, columnspan=2, pady=(10, 20))
@@ -875,10 +4530,15 @@ class HospitalGUI:
         self.staff_schedule_entry.grid(row=11, column=1, pady=5)
 
         # Register button
-        ttk.Button(self.new_staff_window, text="Register", command=self.register_staff).grid(row=12, column=0, pady=(10, 0))
+        ttk.Button(self.new_staff_window, text="Register", command=self.register_staff, style='Form.TButton').grid(row=12, column=0, pady=(10, 0))
 
         # Back button
-        ttk.Button(self.new_staff_window, text="Back to Home", command=self.return_to_home).grid(row=12, column=1, pady=(10, 0))
+        ttk.Button(self.new_staff_window, text="Back to Home", command=self.return_to_home, style='Form.TButton').grid(row=12, column=1, pady=(10, 0))
+
+    def reset_staff_form(self):
+        self.clear_form([self.staff_name_entry, self.staff_age_entry, self.staff_specialization_entry,
+                         self.staff_languages_entry, self.staff_mobile_no_entry, self.staff_email_entry,
+                         self.staff_schedule_entry], [self.staff_gender_var])
 
     def register_staff(self):
         name = self.staff_name_entry.get()
@@ -891,26 +4551,63 @@ class HospitalGUI:
         schedule = self.staff_schedule_entry.get() # Assuming you've captured the schedule data
 
         if name and age and gender and specialization and languages and mobile_no and email and schedule:
-            # Insert the new staff member into the database
-            self.hospital.execute_query(
-                'INSERT INTO staff (name, age, gender, specialization, languages_spoken, mobile_no, email, schedule) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-                (name, age, gender, specialization, languages, mobile_no, email, schedule)
-            )
-
-            # Fetch the last inserted staff ID
-            staff_id = self.hospital.fetch_query('SELECT last_insert_rowid()')[0][0]
-
-            messagebox.showinfo("Success", f"Staff registered successfully! Staff ID: {staff_id}")
-            self.return_to_home()
+            # Insert the new staff member into the database on a worker thread
+            self.db.submit(self.insert_staff, name, age, gender, specialization, languages, mobile_no, email, schedule,
+                           on_done=self.staff_registered, on_error=self.show_database_error)
         else:
             messagebox.showerror("Error", "Please fill in all fields.")
-    
-    def clear_frame(self):
-        for widget in self.root.winfo_children():
-            widget.destroy()
+
+    # Runs on a worker thread; the write is committed before the ID is
+    # shown to the user
+    def insert_staff(self, name, age, gender, specialization, languages, mobile_no, email, schedule):
+        staff_id = self.hospital.add_staff(name, age, gender, specialization, languages, mobile_no, email, schedule)
+        self.hospital.flush()
+        return staff_id
+
+    def staff_registered(self, staff_id):
+        messagebox.showinfo("Success", f"Staff registered successfully! Staff ID: {staff_id}")
+        self.return_to_home()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hospital Management System")
+    parser.add_argument("--db", default="hospital.db", help="path to the SQLite database")
+    parser.add_argument("--server", metavar="URL",
+                        help="run as a terminal of an API server (see api.py) instead of opening --db")
+    parser.add_argument("--token", default=os.environ.get("HMS_API_TOKEN"),
+                        help="API token of the server (default: $HMS_API_TOKEN)")
+    parser.add_argument("--explain", action="store_true",
+                        help="run EXPLAIN QUERY PLAN on every query and log full table scans")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print how long each startup phase took as a JSON line")
+    parser.add_argument("--navigation-report", action="store_true",
+                        help="log the time and widget count of every screen change")
+    parser.add_argument("--slow-query-ms", type=float, default=100.0,
+                        help="log queries slower than this many milliseconds")
+    parser.add_argument("--trace-sql", action="store_true",
+                        help="log every SQL statement and count the work SQLite does for it")
+    parser.add_argument("--query-report", action="store_true",
+                        help="print the time spent in each query as JSON on exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    if args.trace_sql:
+        sql_logger.setLevel(logging.DEBUG)
+    STARTUP.report_enabled = args.startup_report
+
+    if args.server:
+        from api import RemoteHospital
+        hospital = RemoteHospital(args.server, args.token)
+    else:
+        hospital = Hospital(args.db, explain=args.explain, slow_query_ms=args.slow_query_ms, trace=args.trace_sql)
+    STARTUP.mark('database')
     root = tk.Tk()
-    app = HospitalGUI(root)
-    root.mainloop()
+    STARTUP.mark('tk')
+    # Close the database however the main loop ends, so writes still
+    # buffered for a group commit are flushed
+    try:
+        app = HospitalGUI(root, hospital, log_navigation=args.navigation_report)
+        root.mainloop()
+        if args.query_report:
+            print(json.dumps({'queries': hospital.query_stats()}, indent=2), flush=True)
+    finally:
+        hospital.close()
 
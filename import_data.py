@@ -0,0 +1,106 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from export_data import read_columnar
+from hms import Hospital, IMPORT_COLUMNS
+
+
+# Each reader returns (columns, rows). CSV rows stay plain lists laid out
+# like the header, which avoids building a dict per row.
+def read_csv(path):
+    source = open(path, newline='', encoding='utf-8')
+    reader = csv.reader(source)
+    columns = next(reader, [])
+
+    def rows():
+        with source:
+            for row in reader:
+                if row:
+                    yield row
+    return columns, rows()
+
+
+# JSON Lines rows are dicts (one object per line, blank lines ignored)
+def read_jsonl(path):
+    def rows():
+        with open(path, encoding='utf-8') as source:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+    return None, rows()
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+    'hmsc': read_columnar,
+}
+
+
+# A checkpoint records how many source rows of a given file have been
+# committed, so a rerun of the same import picks up where it stopped
+def load_checkpoint(path, table, source):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path, encoding='utf-8') as handle:
+        checkpoint = json.load(handle)
+    if checkpoint.get('table') != table or checkpoint.get('source') != os.path.abspath(source):
+        return 0
+    return checkpoint.get('rows_done', 0)
+
+
+def save_checkpoint(path, table, source, rows_done):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as handle:
+        json.dump({'table': table, 'source': os.path.abspath(source), 'rows_done': rows_done}, handle)
+    os.replace(temp_path, path)
+
+
+# Import one file into one table, printing progress after every batch
+def import_file(hospital, table, source, fmt=None, batch_size=50000, checkpoint=None):
+    fmt = fmt or os.path.splitext(source)[1].lstrip('.').lower()
+    if fmt not in READERS:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+    skip = load_checkpoint(checkpoint, table, source)
+    if skip:
+        print(f"Resuming {table} import from row {skip + 1}")
+    start = time.perf_counter()
+
+    def on_batch(rows_done, inserted, rejected):
+        if checkpoint:
+            save_checkpoint(checkpoint, table, source, rows_done)
+        elapsed = time.perf_counter() - start
+        print(f"{table}: {rows_done} rows read, {inserted} inserted, {rejected} rejected "
+              f"({inserted / elapsed if elapsed else 0:,.0f} rows/s)")
+
+    columns, rows = READERS[fmt](source)
+    inserted, rejected = hospital.bulk_import(table, rows, columns=columns, batch_size=batch_size,
+                                              skip=skip, on_batch=on_batch)
+    for row_number, message in rejected:
+        print(f"{source}:{row_number}: rejected: {message}", file=sys.stderr)
+    return inserted, rejected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import patients, staff or appointments")
+    parser.add_argument("table", choices=sorted(IMPORT_COLUMNS))
+    parser.add_argument("source", help="CSV (with header), JSONL or columnar (.hmsc) export file")
+    parser.add_argument("--format", choices=sorted(READERS), help="defaults to the file extension")
+    parser.add_argument("--db", default="hospital.db", help="path to the SQLite database")
+    parser.add_argument("--batch-size", type=int, default=50000, help="rows per transaction")
+    parser.add_argument("--checkpoint", help="file used to resume an interrupted import")
+    args = parser.parse_args()
+
+    hospital = Hospital(args.db)
+    try:
+        import_file(hospital, args.table, args.source, args.format, args.batch_size, args.checkpoint)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        sys.exit(f"Import failed: {e}")
+    finally:
+        hospital.close()
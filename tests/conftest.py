@@ -0,0 +1,81 @@
+import datetime
+import sqlite3
+
+import pytest
+
+from hms import Hospital
+
+
+# A fresh database, with its archive, in the test's own directory
+@pytest.fixture
+def hospital(tmp_path):
+    hospital = Hospital(str(tmp_path / "hospital.db"))
+    yield hospital
+    hospital.close()
+
+
+@pytest.fixture
+def doctor(hospital):
+    return hospital.add_staff("Asha Rao", 45, "Female", "Cardiology", "English", "9000000001",
+                              "asha@hospital.example", "Mon-Fri 09:00-17:00")
+
+
+@pytest.fixture
+def patient(hospital):
+    return hospital.add_patient("John Smith", "1980-04-02", "Male", "fever", "9000000002")
+
+
+# 09:00 tomorrow, so every booking in a test is upcoming
+@pytest.fixture
+def morning():
+    return datetime.datetime.combine(datetime.date.today() + datetime.timedelta(days=1), datetime.time(9))
+
+
+# The schema Hospital created before migrations existed, at user_version 0
+BASELINE_SCHEMA = '''
+    CREATE TABLE patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        dob DATE NOT NULL,
+        gender TEXT NOT NULL,
+        problem TEXT NOT NULL,
+        mobile_no TEXT NOT NULL
+    );
+    CREATE TABLE staff (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        age INTEGER NOT NULL,
+        gender TEXT NOT NULL,
+        specialization TEXT NOT NULL,
+        languages_spoken TEXT,
+        mobile_no TEXT NOT NULL,
+        email TEXT,
+        schedule TEXT
+    );
+    CREATE TABLE appointments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL,
+        details TEXT NOT NULL,
+        FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE
+    );
+'''
+
+
+# Factory for a database as the release before migrations left it, with
+# the given rows; returns its path
+@pytest.fixture
+def baseline(tmp_path):
+    def create(patients=(), appointments=()):
+        path = str(tmp_path / "baseline.db")
+        conn = sqlite3.connect(path)
+        conn.executescript(BASELINE_SCHEMA)
+        conn.executemany('INSERT INTO patients (name, dob, gender, problem, mobile_no) VALUES (?, ?, ?, ?, ?)',
+                         patients)
+        conn.executemany('INSERT INTO appointments (patient_id, date, time, details) VALUES (?, ?, ?, ?)',
+                         appointments)
+        conn.commit()
+        conn.close()
+        return path
+    return create
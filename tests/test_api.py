@@ -0,0 +1,53 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from api import ApiServer, RemoteHospital
+
+
+@pytest.fixture
+def server(hospital):
+    for number in range(5):
+        hospital.add_patient(f"Patient {number}", "1980-04-02", "Other", "checkup", f"90000000{number:02d}")
+    server = ApiServer(hospital, ('127.0.0.1', 0), token="secret")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path, token="secret"):
+    request = urllib.request.Request(server.url + path, headers={'Authorization': f"Bearer {token}"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        with e:
+            return e.code, json.load(e)
+
+
+def test_pages_are_limited(server):
+    status, rows = get(server, '/patients?limit=2')
+    assert status == 200 and len(rows) == 2
+    for limit in ('0', '-1'):
+        status, answer = get(server, f'/patients?limit={limit}')
+        assert status == 400 and "limit" in answer['error']
+    status, answer = get(server, '/patients/search?q=patient&limit=-1')
+    assert status == 400
+
+
+def test_requests_need_the_token(server):
+    assert get(server, '/patients', token="wrong")[0] == 401
+    client = RemoteHospital(server.url, "secret")
+    try:
+        assert client.fetch_patient(1)[1] == "Patient 0"
+    finally:
+        client.close()
+
+
+def test_servers_beyond_loopback_need_a_token(hospital):
+    with pytest.raises(ValueError):
+        ApiServer(hospital, ('0.0.0.0', 0))
@@ -0,0 +1,54 @@
+import datetime
+
+import pytest
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def test_discharge_cancels_upcoming_appointments(hospital, doctor, patient, morning):
+    for i in range(3):
+        hospital.scheduler.book(patient, doctor, morning + i * HOUR, "Consultation")
+    assert hospital.discharge_patient(patient)
+    assert not hospital.discharge_patient(patient)
+
+    assert hospital.fetch_query('SELECT COUNT(*) FROM appointments') == [(0,)]
+    assert hospital.archive_query('SELECT status, COUNT(*) FROM archive.appointments GROUP BY status') == [
+        ("cancelled", 3)]
+    assert hospital.scheduler.free_slots(doctor, morning, count=1) == [(morning, morning + HOUR / 2)]
+    with pytest.raises(ValueError):
+        hospital.scheduler.book(patient, doctor, morning, "Consultation")
+
+
+def test_discharge_keeps_past_appointments(hospital, doctor, patient, morning):
+    hospital.scheduler.book(patient, doctor, morning, "Consultation")
+    assert hospital.discharge_patient(patient, discharged=morning + HOUR)
+    assert hospital.fetch_query('SELECT COUNT(*) FROM appointments') == [(1,)]
+
+
+# A discharge that fails part way leaves the patient in care with all
+# their appointments
+def test_a_failed_discharge_changes_nothing(hospital, doctor, patient, morning, monkeypatch):
+    hospital.scheduler.book(patient, doctor, morning, "Consultation")
+
+    def fail(table, ids):
+        raise RuntimeError("disk on fire")
+
+    monkeypatch.setattr(hospital, 'delete_archived', fail)
+    with pytest.raises(RuntimeError):
+        hospital.discharge_patient(patient)
+    monkeypatch.undo()
+
+    assert hospital.fetch_query('SELECT discharged_ts FROM patients WHERE id = ?', (patient,)) == [(None,)]
+    assert hospital.fetch_query('SELECT COUNT(*) FROM appointments') == [(1,)]
+    assert hospital.discharge_patient(patient)
+    assert hospital.fetch_query('SELECT COUNT(*) FROM appointments') == [(0,)]
+
+
+def test_archive_moves_discharged_patients(hospital, doctor, patient, morning):
+    hospital.scheduler.book(patient, doctor, morning - datetime.timedelta(days=60), "Consultation")
+    hospital.discharge_patient(patient)
+    hospital.archive(now=morning)
+
+    assert hospital.fetch_query('SELECT COUNT(*) FROM patients') == [(0,)]
+    assert [row[0] for row in hospital.search_archive("john")] == [patient]
+    assert hospital.archive_query('SELECT status FROM archive.appointments') == [("completed",)]
@@ -0,0 +1,93 @@
+import datetime
+
+import pytest
+
+from hms import format_money, format_rate, to_basis_points, to_minor_units
+
+
+def invoice(hospital, patient, items, created=None):
+    bill = hospital.create_bill(patient, items, created=created)
+    assert hospital.invoice_bills([bill]) == 1
+    (_, _, _, status, _, subtotal, tax, total), _, taxes = hospital.fetch_bill(bill)
+    assert status == "invoiced"
+    return subtotal, tax, total, taxes
+
+
+def test_invoice_totals(hospital, patient):
+    subtotal, tax, total, taxes = invoice(hospital, patient, [("Consultation", 1, 50000), ("Tests", 2, 12500)])
+    assert (subtotal, tax, total) == (75000, 15000, 90000)
+    assert taxes == [("CST", 200, 1500), ("GST", 1800, 13500)]
+
+
+# Each tax is rounded half up to a whole minor unit: 2% and 18% of 25 are
+# 0.5 and 4.5
+def test_taxes_round_half_up(hospital, patient):
+    subtotal, tax, total, taxes = invoice(hospital, patient, [("Plaster", 1, 25)])
+    assert taxes == [("CST", 200, 1), ("GST", 1800, 5)]
+    assert (subtotal, tax, total) == (25, 6, 31)
+
+    # 0.48 and 4.32 round down
+    assert invoice(hospital, patient, [("Plaster", 1, 24)])[3] == [("CST", 200, 0), ("GST", 1800, 4)]
+
+
+# Taxes are worked out on the bill's subtotal, not item by item (where
+# three items of 25 would give a CST of 3)
+def test_taxes_are_rounded_once_per_bill(hospital, patient):
+    subtotal, tax, total, taxes = invoice(hospital, patient, [("Plaster", 1, 25)] * 3)
+    assert taxes == [("CST", 200, 2), ("GST", 1800, 14)]
+    assert (subtotal, tax, total) == (75, 16, 91)
+
+
+def test_only_the_given_bills_are_invoiced(hospital, patient):
+    bills = [hospital.create_bill(patient, [("Consultation", 1, 10000)]) for _ in range(3)]
+    assert hospital.invoice_bills(bills[:1]) == 1
+    assert hospital.invoice_bills(bills[:2]) == 1
+    assert [hospital.fetch_bill(bill)[0][3] for bill in bills] == ["invoiced", "invoiced", "open"]
+
+
+def test_rates_apply_by_the_day_a_bill_was_created(hospital, patient):
+    change = datetime.datetime(2030, 4, 1)
+    hospital.set_tax_rate("GST", 1200, valid_from=change)
+    hospital.set_tax_rate("CST", None, valid_from=change)
+
+    before = invoice(hospital, patient, [("Consultation", 1, 10000)], created=change - datetime.timedelta(days=1))
+    after = invoice(hospital, patient, [("Consultation", 1, 10000)], created=change)
+    assert before[3] == [("CST", 200, 200), ("GST", 1800, 1800)]
+    assert after[3] == [("GST", 1200, 1200)]
+    assert hospital.tax_rates(change) == [("GST", 1200)]
+
+
+def test_the_nightly_run_invoices_open_bills_once(hospital, patient):
+    for _ in range(3):
+        hospital.create_bill(patient, [("Consultation", 1, 10000)])
+    assert hospital.invoice_bills() == 3
+    assert hospital.invoice_bills() == 0
+
+
+def test_a_bill_needs_items_and_a_patient(hospital, patient):
+    with pytest.raises(ValueError):
+        hospital.create_bill(patient, [])
+    with pytest.raises(ValueError):
+        hospital.create_bill(patient + 1, [("Consultation", 1, 10000)])
+
+
+@pytest.mark.parametrize("text, minor", [("1,234.50", 123450), ("0.005", 1), ("0.004", 0), ("12", 1200)])
+def test_amounts_become_minor_units(text, minor):
+    assert to_minor_units(text) == minor
+
+
+def test_amounts_are_formatted_with_two_decimals():
+    assert format_money(123450) == "1,234.50"
+    assert format_money(-5) == "-0.05"
+
+
+@pytest.mark.parametrize("text, rate_bp", [("18", 1800), ("2.5", 250), ("7.25", 725), ("7.250", 725), ("0", 0)])
+def test_percentages_become_basis_points(text, rate_bp):
+    assert to_basis_points(text) == rate_bp
+    assert format_rate(rate_bp) == f"{text.rstrip('0').rstrip('.') if '.' in text else text}%"
+
+
+@pytest.mark.parametrize("text", ["7.255", "-1", "inf", "nan", "abc", ""])
+def test_invalid_percentages_are_refused(text):
+    with pytest.raises(ValueError, match="Invalid percentage"):
+        to_basis_points(text)
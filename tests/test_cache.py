@@ -0,0 +1,70 @@
+import sqlite3
+
+from hms import QueryCache
+
+
+def test_lookups_are_served_from_the_cache(hospital, patient):
+    record = hospital.fetch_patient(patient)
+    assert hospital.fetch_patient(patient) is record
+    stats = hospital.cache_stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+
+def test_a_write_drops_what_was_read_from_its_table(hospital, doctor, patient, morning):
+    hospital.fetch_patient(patient)
+    assert hospital.fetch_patient_appointments(patient) == ()
+
+    hospital.scheduler.book(patient, doctor, morning, "Consultation")
+    assert len(hospital.fetch_patient_appointments(patient)) == 1
+    assert hospital.fetch_patient(patient) is not None
+    assert hospital.cache_stats()['invalidations'] == 1
+
+    hospital.execute_query('UPDATE patients SET problem = ? WHERE id = ?', ("cough", patient))
+    assert hospital.fetch_patient(patient)[4] == "cough"
+    hospital.discharge_patient(patient)
+    assert hospital.fetch_patient(patient) is None
+    assert hospital.fetch_patient_appointments(patient) == ()
+
+
+# Writes made through another connection are noticed through PRAGMA
+# data_version and clear the whole cache
+def test_writes_from_another_connection_clear_the_cache(hospital, patient, tmp_path):
+    hospital.fetch_patient(patient)
+    other = sqlite3.connect(str(tmp_path / "hospital.db"))
+    with other:
+        other.execute('UPDATE patients SET problem = ? WHERE id = ?', ("cough", patient))
+    other.close()
+    assert hospital.fetch_patient(patient)[4] == "cough"
+
+
+def test_staff_pages_are_cached_until_staff_change(hospital, doctor):
+    assert [len(page) for page in hospital.iter_staff_pages(page_size=1)] == [1]
+    assert hospital.cache_stats()['entries'] == 1
+    hospital.add_staff("Meera Nair", 31, "Female", "Nursing", "English", "9000000005", "", "Shifts")
+    assert [len(page) for page in hospital.iter_staff_pages(page_size=1)] == [1, 1]
+
+
+def test_the_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, ("patients",), key, cache.generation(("patients",)))
+    cache.get("a")
+    cache.put("c", ("patients",), "c", cache.generation(("patients",)))
+    assert [cache.get(key)[0] for key in ("a", "b", "c")] == [True, False, True]
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire():
+    cache = QueryCache(ttl=0)
+    cache.put("a", ("patients",), "a", cache.generation(("patients",)))
+    assert cache.get("a") == (False, None)
+    assert cache.stats()['expirations'] == 1
+
+
+# A read that started before a write to its table must not be cached
+def test_a_read_racing_a_write_is_not_stored():
+    cache = QueryCache()
+    generation = cache.generation(("patients",))
+    cache.invalidate("patients")
+    cache.put("a", ("patients",), "stale", generation)
+    assert cache.get("a") == (False, None)
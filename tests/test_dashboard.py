@@ -0,0 +1,45 @@
+import datetime
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def counters(hospital):
+    return hospital.fetch_query('SELECT name, key, value FROM counters ORDER BY name, key')
+
+
+# The counter triggers, and the recount bulk_import does instead of them,
+# must always agree with counting the tables from scratch
+def test_counters_match_a_recount(hospital, doctor, patient, morning):
+    other = hospital.add_patient("Priya Sharma", "1992-11-20", "Female", "asthma", "9000000004")
+    nurse = hospital.add_staff("Meera Nair", 31, "Female", "Nursing", "English", "9000000005", "", "Shifts")
+    booked = [hospital.scheduler.book(patient, doctor, morning + i * HOUR, "Consultation") for i in range(3)]
+    hospital.scheduler.book(other, doctor, morning + datetime.timedelta(days=1), "Follow-up")
+    hospital.add_appointment(other, morning.strftime('%Y-%m-%d'), "14:00", "Walk-in")
+    hospital.scheduler.cancel(booked[0])
+    hospital.execute_query('UPDATE appointments SET date = ?, start_ts = start_ts + 86400, '
+                           'end_ts = end_ts + 86400 WHERE id = ?',
+                           ((morning + datetime.timedelta(days=1)).strftime('%Y-%m-%d'), booked[1]))
+    hospital.execute_query('DELETE FROM staff WHERE id = ?', (nurse,))
+    hospital.bulk_import('patients', [("Wei Chen", "1975-06-30", "Male", "checkup", "9000000006")],
+                         columns=('name', 'dob', 'gender', 'problem', 'mobile_no'))
+    hospital.bulk_import('appointments', [(other, morning.strftime('%Y-%m-%d'), "16:00", "Follow-up", doctor)],
+                         columns=('patient_id', 'date', 'time', 'details', 'doctor_id'))
+    hospital.discharge_patient(patient)
+
+    before = counters(hospital)
+    hospital.rebuild_counters()
+    assert before == counters(hospital)
+    assert hospital.dashboard(morning.date())['patients_in_care'] == 2
+
+
+# Doctors count as working on the days they have appointments, whatever
+# their free-text schedule says
+def test_doctors_working_are_those_with_appointments(hospital, doctor, patient, morning):
+    hospital.add_staff("Meera Nair", 31, "Female", "Cardiology", "English", "9000000005", "", "Mon-Sun")
+    hospital.scheduler.book(patient, doctor, morning, "Consultation")
+
+    dashboard = hospital.dashboard(morning.date())
+    assert dashboard['appointments'] == 1
+    assert dashboard['staff'] == {"Cardiology": 2}
+    assert dashboard['doctors_working'] == {"Cardiology": 1}
+    assert hospital.dashboard(morning.date() + datetime.timedelta(days=1))['doctors_working'] == {}
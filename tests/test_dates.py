@@ -0,0 +1,74 @@
+import datetime
+import logging
+
+import pytest
+
+from hms import Hospital, normalize_dob, parse_date, parse_time, timestamp
+
+
+@pytest.mark.parametrize("text", ["2025-01-31", "31-01-2025", "31/01/2025", "31.01.2025", "2025/01/31",
+                                  "31 Jan 2025", "31 January 2025", "Jan 31, 2025"])
+def test_dates_are_read_in_any_accepted_layout(text):
+    assert parse_date(text) == datetime.date(2025, 1, 31)
+
+
+@pytest.mark.parametrize("text, time", [("14:30", datetime.time(14, 30)), ("9:05", datetime.time(9, 5)),
+                                        ("2:30 pm", datetime.time(14, 30)), ("2 p.m.", datetime.time(14))])
+def test_times_are_read_in_any_accepted_layout(text, time):
+    assert parse_time(text) == time
+
+
+@pytest.mark.parametrize("text", ["2025-02-30", "01/31/2025", "yesterday"])
+def test_unreadable_dates_are_refused(text):
+    with pytest.raises(ValueError, match="Invalid date"):
+        parse_date(text)
+
+
+def test_dates_of_birth_must_be_plausible():
+    today = datetime.date(2025, 1, 31)
+    assert normalize_dob("02/04/1980", today) == ("1980-04-02", datetime.date(1980, 4, 2).toordinal())
+    for dob in ("2025-02-01", "1874-01-01"):
+        with pytest.raises(ValueError):
+            normalize_dob(dob, today)
+
+
+# Dates typed in other layouts before they were validated are rewritten
+# to the stored form on upgrade; what cannot be read is left as it was
+def test_legacy_dates_are_backfilled(baseline, caplog):
+    path = baseline(patients=[("John Smith", "02/04/1980", "Male", "fever", "9000000002"),
+                              ("Priya Sharma", "1992-11-20", "Female", "asthma", "9000000004"),
+                              ("Wei Chen", "sometime", "Male", "checkup", "9000000006")],
+                    appointments=[(1, "31/01/2025", "2:30 pm", "Consultation"),
+                                  (2, "2025-01-31", "09:00", "Follow-up"),
+                                  (2, "soon", "09:00", "Walk-in")])
+
+    with caplog.at_level(logging.WARNING, logger="hms"):
+        hospital = Hospital(path)
+    try:
+        assert hospital.fetch_query('SELECT dob, dob_ordinal FROM patients ORDER BY id') == [
+            ("1980-04-02", datetime.date(1980, 4, 2).toordinal()),
+            ("1992-11-20", datetime.date(1992, 11, 20).toordinal()),
+            ("sometime", None)]
+        assert hospital.fetch_query('SELECT date, time, start_ts FROM appointments ORDER BY id') == [
+            ("2025-01-31", "14:30", timestamp(datetime.datetime(2025, 1, 31, 14, 30))),
+            ("2025-01-31", "09:00", timestamp(datetime.datetime(2025, 1, 31, 9))),
+            ("soon", "09:00", None)]
+        assert "2 dates of birth or appointment times could not be read" in caplog.text
+    finally:
+        hospital.close()
+
+
+def test_appointments_between_two_dates(hospital, patient):
+    for date, time in (("2025-01-30", "23:59"), ("31/01/2025", "09:00"), ("2025-01-31", "08:00"),
+                       ("1 Feb 2025", "10:00"), ("2025-02-02", "00:00")):
+        hospital.add_appointment(patient, date, time, "Consultation")
+
+    day = hospital.fetch_appointments_between("2025-01-31")
+    assert [(row[2], row[3]) for row in day] == [("2025-01-31", "08:00"), ("2025-01-31", "09:00")]
+    span = hospital.fetch_appointments_between(datetime.date(2025, 1, 31), "2025-02-01")
+    assert len(span) == 3
+
+    # Paged by the (start_ts, id) of the last row
+    first = hospital.fetch_appointments_between("2025-01-30", "2025-02-02", limit=2)
+    rest = hospital.fetch_appointments_between("2025-01-30", "2025-02-02", after=(first[-1][6], first[-1][0]))
+    assert [row[0] for row in first + rest] == [1, 3, 2, 4, 5]
@@ -0,0 +1,56 @@
+import datetime
+
+import pytest
+
+from generate_data import Generator
+from hms import Hospital
+
+TODAY = datetime.date(2025, 3, 3)
+
+
+def generate(path, seed=1, workers=1):
+    hospital = Hospital(str(path))
+    Generator(300, 20, 900, seed=seed, today=TODAY, workers=workers).into_database(hospital)
+    return hospital
+
+
+def test_generated_rows_refer_to_each_other(tmp_path):
+    hospital = generate(tmp_path / "generated.db")
+    try:
+        assert hospital.fetch_query('SELECT COUNT(*), MIN(id), MAX(id) FROM patients') == [(300, 1, 300)]
+        assert hospital.fetch_query('''
+            SELECT COUNT(*) FROM appointments a
+            WHERE NOT EXISTS (SELECT 1 FROM patients p WHERE p.id = a.patient_id)
+               OR NOT EXISTS (SELECT 1 FROM staff s WHERE s.id = a.doctor_id)
+        ''') == [(0,)]
+        archived = hospital.archive_query('SELECT COUNT(*) FROM archive.appointments WHERE status = ?', ("no-show",))
+        assert hospital.fetch_query('SELECT COUNT(*) FROM appointments')[0][0] + archived[0][0] == 900
+
+        # Imported with their ids, and still indexed for search
+        name = hospital.fetch_query('SELECT name FROM patients WHERE id = 1')[0][0]
+        assert 1 in [row[0] for row in hospital.search_patients(name)]
+        counters = hospital.fetch_query('SELECT * FROM counters ORDER BY name, key')
+        hospital.rebuild_counters()
+        assert counters == hospital.fetch_query('SELECT * FROM counters ORDER BY name, key')
+    finally:
+        hospital.close()
+
+
+def test_the_same_seed_gives_the_same_data(tmp_path):
+    dumps = []
+    for number, workers in enumerate((1, 2)):
+        hospital = generate(tmp_path / f"generated-{number}.db", workers=workers)
+        dumps.append([hospital.fetch_query(f'SELECT * FROM {table} ORDER BY id')
+                      for table in ('patients', 'staff', 'appointments')])
+        hospital.close()
+    assert dumps[0] == dumps[1]
+
+
+def test_today_cannot_be_in_the_future():
+    with pytest.raises(ValueError):
+        Generator(10, 1, 0, today=datetime.date.today() + datetime.timedelta(days=1))
+
+
+def test_only_an_empty_database_is_filled(hospital, patient):
+    with pytest.raises(ValueError):
+        Generator(10, 1, 0, today=TODAY, workers=1).into_database(hospital)
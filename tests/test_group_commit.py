@@ -0,0 +1,37 @@
+import sqlite3
+
+import pytest
+
+from hms import Hospital
+
+
+# A failed write inside a group-commit transaction undoes only itself, and
+# leaves the writes buffered for other callers to be committed
+@pytest.mark.parametrize("group_commit", [False, True])
+def test_a_failed_bill_leaves_other_writes_alone(hospital, patient, group_commit):
+    if group_commit:
+        hospital.enable_group_commit(max_statements=1000, max_delay=60)
+    buffered = hospital.add_patient("Priya Sharma", "1992-11-20", "Female", "asthma", "9000000004")
+    with pytest.raises(sqlite3.IntegrityError):
+        hospital.create_bill(buffered, [("Consultation", 1, 50000), ("Refund", 0, 100)])
+    bill = hospital.create_bill(buffered, [("Consultation", 1, 50000)])
+    hospital.flush()
+
+    assert hospital.fetch_query('SELECT id FROM patients WHERE id = ?', (buffered,)) == [(buffered,)]
+    assert hospital.fetch_query('SELECT id FROM bills') == [(bill,)]
+    assert hospital.fetch_query('SELECT COUNT(*) FROM bill_items') == [(1,)]
+
+
+# Buffered writes are durable once the database is closed
+def test_closing_flushes_buffered_writes(tmp_path):
+    path = str(tmp_path / "hospital.db")
+    hospital = Hospital(path)
+    hospital.enable_group_commit(max_statements=1000, max_delay=60)
+    hospital.add_patient("Priya Sharma", "1992-11-20", "Female", "asthma", "9000000004")
+    hospital.close()
+
+    hospital = Hospital(path)
+    try:
+        assert hospital.fetch_query('SELECT name FROM patients') == [("Priya Sharma",)]
+    finally:
+        hospital.close()
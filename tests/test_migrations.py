@@ -0,0 +1,57 @@
+import pytest
+
+from hms import MIGRATIONS, Hospital
+
+
+def user_version(hospital):
+    return hospital.fetch_query('PRAGMA user_version')[0][0]
+
+
+def test_a_new_database_gets_every_migration(hospital):
+    assert user_version(hospital) == len(MIGRATIONS)
+    assert hospital.migrate() == len(MIGRATIONS)
+
+
+def test_data_survives_a_restart(tmp_path):
+    path = str(tmp_path / "restarted.db")
+    hospital = Hospital(path)
+    hospital.add_patient("Priya Sharma", "1992-11-20", "Female", "asthma", "9000000004")
+    hospital.close()
+
+    hospital = Hospital(path)
+    try:
+        assert hospital.fetch_query('SELECT name FROM patients') == [("Priya Sharma",)]
+    finally:
+        hospital.close()
+
+
+def test_a_baseline_database_is_upgraded_in_place(baseline):
+    path = baseline(patients=[("John Smith", "1980-04-02", "Male", "fever", "9000000002")],
+                    appointments=[(1, "2025-01-31", "09:30", "Consultation")])
+
+    hospital = Hospital(path)
+    try:
+        assert user_version(hospital) == len(MIGRATIONS)
+        assert hospital.fetch_query('SELECT id, name, dob_ordinal, discharged_ts FROM patients') == [
+            (1, "John Smith", 722907, None)]
+        assert [row[0] for row in hospital.search_patients("john")] == [1]
+        assert [row[0] for row in hospital.fetch_appointments_between("2025-01-31")] == [1]
+        assert hospital.dashboard("2025-01-31")['appointments'] == 1
+        assert hospital.add_patient("Priya Sharma", "1992-11-20", "Female", "asthma", "9000000004") == 2
+    finally:
+        hospital.close()
+
+
+# A migration that fails is rolled back whole and leaves the version where
+# it was, so the next start tries it again
+def test_a_failed_migration_is_rolled_back(hospital):
+    version = user_version(hospital)
+
+    def fail(cursor):
+        raise RuntimeError("disk on fire")
+
+    steps = MIGRATIONS + [['CREATE TABLE notes (id INTEGER PRIMARY KEY)', fail]]
+    with pytest.raises(RuntimeError):
+        hospital.migrate(migrations=steps)
+    assert user_version(hospital) == version
+    assert hospital.fetch_query("SELECT name FROM sqlite_master WHERE name = 'notes'") == []
@@ -0,0 +1,114 @@
+import datetime
+import sqlite3
+
+import pytest
+
+from hms import Scheduler, timestamp
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def test_free_slots_start_at_opening_on_the_slot_grid(hospital, doctor, morning):
+    slots = hospital.scheduler.free_slots(doctor, morning - 2 * HOUR, count=3)
+    assert slots == [(morning + i * HOUR / 2, morning + (i + 1) * HOUR / 2) for i in range(3)]
+
+    slots = hospital.scheduler.free_slots(doctor, morning + datetime.timedelta(minutes=10), count=1)
+    assert slots == [(morning + HOUR / 2, morning + HOUR)]
+
+
+def test_free_slots_skip_bookings_and_closed_hours(hospital, doctor, patient, morning):
+    hospital.scheduler.book(patient, doctor, morning, "Consultation", duration=HOUR)
+    assert hospital.scheduler.free_slots(doctor, morning, count=1) == [(morning + HOUR, morning + 1.5 * HOUR)]
+
+    # Nothing fits after 16:45, so the next slot is the following morning
+    tomorrow = morning + datetime.timedelta(days=1)
+    slots = hospital.scheduler.free_slots(doctor, morning + datetime.timedelta(hours=7, minutes=45), count=1)
+    assert slots == [(tomorrow, tomorrow + HOUR / 2)]
+
+
+@pytest.mark.parametrize("duration", [datetime.timedelta(0), -HOUR, 9 * HOUR])
+def test_durations_that_never_fit_are_refused(hospital, doctor, patient, morning, duration):
+    with pytest.raises(ValueError):
+        hospital.scheduler.free_slots(doctor, morning, duration=duration)
+    with pytest.raises(ValueError):
+        hospital.scheduler.book(patient, doctor, morning, "Consultation", duration=duration)
+
+
+def test_a_whole_day_fits(hospital, doctor, patient, morning):
+    hospital.scheduler.book(patient, doctor, morning, "Procedure", duration=8 * HOUR)
+    tomorrow = morning + datetime.timedelta(days=1)
+    assert hospital.scheduler.free_slots(doctor, morning, count=1, duration=8 * HOUR) == [(tomorrow, tomorrow + 8 * HOUR)]
+
+
+def test_free_slots_stop_at_the_horizon(hospital, doctor, patient, morning):
+    for day in range(3):
+        hospital.scheduler.book(patient, doctor, morning + datetime.timedelta(days=day), "Procedure",
+                                duration=8 * HOUR)
+    scheduler = Scheduler(hospital, horizon_days=2)
+    assert scheduler.free_slots(doctor, morning, count=5) == []
+    assert len(Scheduler(hospital, horizon_days=3).free_slots(doctor, morning, count=5)) == 5
+
+
+def test_book_refuses_overlaps_but_not_neighbours(hospital, doctor, patient, morning):
+    scheduler = hospital.scheduler
+    first = scheduler.book(patient, doctor, morning, "Consultation")
+    with pytest.raises(ValueError):
+        scheduler.book(patient, doctor, morning + datetime.timedelta(minutes=15), "Consultation")
+    second = scheduler.book(patient, doctor, morning + HOUR / 2, "Consultation")
+    assert scheduler.overlapping(doctor, morning, morning + HOUR / 2) == first
+    assert scheduler.overlapping(doctor, morning + HOUR / 2, morning + HOUR) == second
+
+    assert scheduler.cancel(first)
+    assert not scheduler.cancel(first)
+    assert scheduler.free_slots(doctor, morning, count=1) == [(morning, morning + HOUR / 2)]
+
+
+def test_book_refuses_unknown_people(hospital, doctor, patient, morning):
+    with pytest.raises(ValueError):
+        hospital.scheduler.book(patient + 1, doctor, morning, "Consultation")
+    with pytest.raises(ValueError):
+        hospital.scheduler.book(patient, doctor + 1, morning, "Consultation")
+
+
+# The triggers stop overlaps that never went through the scheduler, such as
+# a booking made by another process
+def test_overlap_triggers(hospital, doctor, patient, morning):
+    start_ts = timestamp(morning)
+    insert = ('INSERT INTO appointments (patient_id, date, time, details, doctor_id, start_ts, end_ts) '
+              'VALUES (?, ?, ?, ?, ?, ?, ?)')
+    date = morning.strftime('%Y-%m-%d')
+    hospital.execute_query(insert, (patient, date, "09:00", "Consultation", doctor, start_ts, start_ts + 1800))
+    later = hospital.execute_query(insert, (patient, date, "09:30", "Consultation", doctor,
+                                            start_ts + 1800, start_ts + 3600))
+
+    with pytest.raises(sqlite3.IntegrityError):
+        hospital.execute_query(insert, (patient, date, "09:15", "Consultation", doctor,
+                                        start_ts + 900, start_ts + 2700))
+    with pytest.raises(sqlite3.IntegrityError):
+        hospital.execute_query('UPDATE appointments SET start_ts = start_ts - 900 WHERE id = ?', (later,))
+
+    # Another doctor is free at the same time
+    other = hospital.add_staff("Ravi Iyer", 50, "Male", "Cardiology", "English", "9000000003", "", "")
+    hospital.execute_query(insert, (patient, date, "09:00", "Consultation", other, start_ts, start_ts + 1800))
+
+
+def test_bulk_import_rejects_overlaps_and_gives_missing_ends_a_slot(hospital, doctor, patient, morning):
+    booked = hospital.scheduler.book(patient, doctor, morning, "Consultation")
+    hospital.scheduler.free_slots(doctor, morning)
+    date = morning.strftime('%Y-%m-%d')
+    rows = [
+        (patient, date, "09:00", "Clashes with the booking", doctor),
+        (patient, date, "10:00", "Follow-up", doctor),
+        (patient, date, "", "No time", doctor),
+        (patient, date, "10:15", "Clashes with row 2", doctor),
+        (patient, date, "11:00", "Follow-up", doctor),
+    ]
+    inserted, rejected = hospital.bulk_import('appointments', rows,
+                                              columns=('patient_id', 'date', 'time', 'details', 'doctor_id'))
+
+    assert inserted == 2
+    assert [row_number for row_number, message in rejected] == [1, 3, 4]
+    ends = hospital.fetch_query('SELECT start_ts, end_ts FROM appointments WHERE id != ? ORDER BY id', (booked,))
+    assert ends == [(start_ts, start_ts + 1800) for start_ts in (timestamp(morning + HOUR), timestamp(morning + 2 * HOUR))]
+    # The scheduler sees the imported appointments straight away
+    assert hospital.scheduler.overlapping(doctor, morning + HOUR, morning + 1.5 * HOUR) is not None
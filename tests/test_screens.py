@@ -0,0 +1,29 @@
+import tkinter as tk
+
+import pytest
+
+from hms import NAVIGATION_LOG_SIZE, ScreenManager
+
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("needs a display")
+    yield root
+    root.destroy()
+
+
+def test_screens_are_built_once_and_the_log_is_bounded(root):
+    builds = []
+    screens = ScreenManager(root)
+    for name in ("home", "patients"):
+        screens.register(name, lambda page, name=name: builds.append(name))
+    for _ in range(NAVIGATION_LOG_SIZE):
+        screens.show("home")
+        screens.show("patients")
+    root.update()
+
+    assert builds == ["home", "patients"]
+    assert len(screens.navigation_log) == NAVIGATION_LOG_SIZE
@@ -0,0 +1,53 @@
+import pytest
+
+
+@pytest.fixture
+def patients(hospital, patient):
+    return [patient] + [hospital.add_patient(name, "1990-01-01", "Female", problem, mobile)
+                        for name, problem, mobile in (("Johanna Smithers", "asthma", "9000000010"),
+                                                      ("Priya Sharma", "migraine", "9000000011"))]
+
+
+def ids(rows):
+    return [row[0] for row in rows]
+
+
+def test_every_word_is_a_prefix(hospital, patients):
+    john, johanna, priya = patients
+    assert ids(hospital.search_patients("jo")) == [john, johanna]
+    assert ids(hospital.search_patients("jo smithers")) == [johanna]
+    assert ids(hospital.search_patients("MIGR")) == [priya]
+    assert ids(hospital.search_patients("9000000011")) == [priya]
+    assert hospital.search_patients("  ") == []
+
+
+def test_misspelt_words_find_the_closest_names(hospital, patients):
+    john, johanna, priya = patients
+    assert ids(hospital.search_patients("jonh smiht")) == [john]
+    assert ids(hospital.search_patients("prija")) == [priya]
+    assert hospital.search_patients("xyzzy") == []
+
+
+# Exact prefix matches come first; fuzzy ones only fill the rest of the page
+def test_fuzzy_matches_only_fill_the_page(hospital, patients):
+    john, johanna, priya = patients
+    hospital.add_patient("Sharmi Iyer", "1990-01-01", "Female", "fever", "9000000012")
+    assert ids(hospital.search_patients("sharma", limit=1)) == [priya]
+    assert len(hospital.search_patients("sharma")) == 2
+
+
+def test_the_index_follows_updates_and_discharges(hospital, patients):
+    john, johanna, priya = patients
+    hospital.execute_query('UPDATE patients SET name = ? WHERE id = ?', ("Priya Menon", priya))
+    assert ids(hospital.search_patients("menon")) == [priya]
+    assert hospital.search_patients("sharma") == []
+
+    hospital.discharge_patient(john)
+    assert ids(hospital.search_patients("jo")) == [johanna]
+
+
+def test_staff_are_searched_by_specialization(hospital, doctor):
+    assert ids(hospital.search_staff("cardio")) == [doctor]
+    assert ids(hospital.search_staff("cardiolgy")) == [doctor]
+    with pytest.raises(ValueError):
+        hospital.search("bills", "x")
@@ -0,0 +1,53 @@
+import datetime
+
+from hms import timestamp
+
+NOON = datetime.datetime(2025, 1, 31, 12)
+
+
+def pages(hospital, patient_id, limit):
+    events, before = [], None
+    while True:
+        patient, page = hospital.fetch_patient_timeline(patient_id, before, limit)
+        assert len(page) <= limit
+        if not page:
+            return patient, events
+        events.extend(page)
+        before = page[-1][:3]
+
+
+def test_events_come_newest_first_a_page_at_a_time(hospital, doctor, patient, morning):
+    expected = []
+    for day in range(3):
+        at = NOON + datetime.timedelta(days=day)
+        appointment = hospital.add_appointment(patient, at.strftime('%Y-%m-%d'), "12:00", "Consultation")
+        # A bill created at the same moment still gets its own place
+        bill = hospital.create_bill(patient, [("Consultation", 1, 50000)], created=at)
+        expected += [(timestamp(at), 'appointment', appointment), (timestamp(at), 'bill', bill)]
+    upcoming = hospital.scheduler.book(patient, doctor, morning, "Follow-up")
+    expected.append((timestamp(morning), 'appointment', upcoming))
+    expected.sort(reverse=True)
+
+    for limit in (1, 2, 4, 50):
+        patient_row, events = pages(hospital, patient, limit)
+        assert [event[:3] for event in events] == expected
+    assert patient_row[1] == "John Smith"
+    assert events[0][6:8] == ("Asha Rao", "booked")
+    bill = next(event for event in events if event[1] == 'bill')
+    assert bill[7:] == ("open", 50000)
+
+
+# Cancelled appointments live in the archive, and a discharged patient's
+# timeline stays readable
+def test_archived_appointments_are_part_of_the_timeline(hospital, doctor, patient, morning):
+    past = hospital.add_appointment(patient, "2025-01-31", "12:00", "Consultation")
+    upcoming = hospital.scheduler.book(patient, doctor, morning, "Follow-up")
+    hospital.discharge_patient(patient)
+
+    patient_row, events = pages(hospital, patient, 1)
+    assert patient_row[6] is not None
+    assert [(event[2], event[7]) for event in events] == [(upcoming, "cancelled"), (past, "booked")]
+
+
+def test_an_unknown_patient_has_no_timeline(hospital):
+    assert hospital.fetch_patient_timeline(42) == (None, [])